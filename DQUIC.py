@@ -1,49 +1,119 @@
+import collections
+import select
 import socket
 from typing import List
 import random
 import struct
 import time
-import math
+
+import congestion
+import datagrams
+import fec
+import metrics
+import multipath
+import pmtud
+import recovery
+import scheduler
+import streams
+import varint
 
 MAX_RECV_BYTES = 65536
 SHORT = 3
 DATA = 5
 ACK = 6
-MAX_STREAMS = 10  # maximum number of streams
-ACK_TIMEOUT = 2  # timeout for ack receiving
-MAX_TRIES = 4  # maximum tries to send a packet
-MAX_FRAMES_IN_PACKET = 7  # maximum frames in a packet
-MAX_STREAM_SIZE = 2000  # maximum size of stream
-MIN_STREAM_SIZE = 1000  # minimum size of stream
+ACK_RANGE = 7  # a stream range received out of order (offset, length), carries no data
+DATA_FIN = 8  # a data frame ending its stream (the stream's final size is offset + length)
+MAX_DATA = 9  # the receiver's connection credit: the stream bytes (of all streams) the sender may send, as offset
+MAX_STREAM_DATA = 10  # the receiver's stream credit: the stream offset the sender's data may reach, as offset
+DATA_BLOCKED = 11  # the sender has data beyond the connection credit (the credit as offset)
+STREAM_DATA_BLOCKED = 12  # the sender has stream data beyond the stream credit (the credit as offset)
+PADDING = 13  # zero bytes filling a path MTU probe up to its size (length bytes follow the frame, like data)
+PACKET_RANGE = 14  # packet numbers received (offset: the first one, length: how many), carries no data
+ACK_DELAY = 15  # the microseconds the receiver held the ack of the ACK packet's number (as offset)
+IMMEDIATE_ACK = 16  # the sender can't send more until this packet is acked, the receiver mustn't delay the ack
+FEC_SOURCE = 17  # the packet is protected by the parity of its group (the receiver keeps its payload)
+FEC_GROUP = 18  # a parity packet's group (stream_id: the XOR of the payload lengths, offset: the first packet number,
+# length: the packet count), the parity follows in a FEC_PARITY frame
+FEC_PARITY = 19  # the XOR of the group's payloads (length bytes follow the frame, like data)
+PATH = 20  # the packet's path (offset: the path id), the first frame of the packets of every path but the first
+MAX_STREAMS = 10  # number of streams of the original assignment (not a limit, the schedulers scale beyond it)
+MAX_TRIES = 4  # maximum probe timeouts in a row before giving up on the receiver
+GIVE_UP_TIMEOUT = recovery.GIVE_UP_TIMEOUT  # seconds without any ack after which the receiver is given up on
+MAX_FRAMES_IN_PACKET = 7  # frames of the old fixed size packets (microbenchmark.py), packets fill the path MTU
+MAX_STREAM_SIZE = 2000  # frame data size of the old fixed size packets (microbenchmark.py)
+WINDOW_SIZE = 32  # maximum packets in flight (unacknowledged) per send_to call, 1 means stop-and-wait
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024  # requested kernel buffer size, a full window must fit in the receiver's buffer
+ACK_EVERY = 2  # ack-eliciting packets received before an ack is sent at once (1 acks every packet)
+FEC_GROUP_SIZE = 0  # data packets per parity packet (0: no forward error correction, "adaptive": by the loss rate)
+PATH_SCHEDULER = multipath.PATH_SCHEDULER  # default path scheduler (see multipath.PATH_SCHEDULERS)
+MAX_ACK_DELAY = recovery.MAX_ACK_DELAY  # the longest time an ack is delayed (the senders' probe timeout allows it)
+CONGESTION_CONTROL = "cubic"  # default congestion controller (see congestion.CONGESTION_CONTROLLERS)
+STREAM_SCHEDULER = "round_robin"  # default stream scheduler (see scheduler.STREAM_SCHEDULERS)
+SENDMSG = hasattr(socket.socket, "sendmsg")  # scatter/gather sending (missing on Windows)
+UNKNOWN_CONN_ID = 0  # the destination connection id of packets to a peer that didn't tell its id yet
+IDLE_TIMEOUT = 30.0  # seconds without packets after which an idle connection is forgotten
+MAX_CONNECTIONS = 1024  # maximum connections of a socket (the least recently active idle one makes room)
+INITIAL_MAX_DATA = 1024 * 1024  # the connection credit of a sender before the receiver's first update
+INITIAL_MAX_STREAM_DATA = 256 * 1024  # the stream credit of a sender before the receiver's first update
+CONNECTION_WINDOW = 32 * 1024 * 1024  # unread bytes a receiver buffers per connection (at least INITIAL_MAX_DATA)
+STREAM_WINDOW = 16 * 1024 * 1024  # unread bytes a receiver buffers per stream (at least INITIAL_MAX_STREAM_DATA)
+CONN_ID_BITS = 64
+WORKER_ID_BITS = 8  # the high bits of a connection id: the worker process holding the connection (sharded server)
+MAX_WORKERS = 2 ** WORKER_ID_BITS
+PADDING_DATA = memoryview(bytes(pmtud.MAX_PLPMTU))  # the zero bytes of every probe's PADDING frame
+FIXED_VERSION = 1  # the original wire encoding: fixed size header ("!BQQI") and frames ("!IIQI")
+COMPACT_VERSION = 2  # variable length integers, every frame type has only the fields it needs
+VERSIONS = (COMPACT_VERSION, FIXED_VERSION)  # the versions an endpoint speaks, the one it prefers first
+COMPACT_FORM = 0x80  # the first byte of a compact packet (the packet types of the fixed layout are below it)
+SOURCE_CONN_ID = 0x40  # a compact header carries the source connection id (until the peer uses it)
+PACKET_TYPE_MASK = 0x3F  # the packet type in a compact header's first byte
+DATA_FRAMES = (DATA, DATA_FIN, PADDING, FEC_PARITY)  # the frame types followed by length bytes
+PADDING_LENGTH_SIZE = 4  # the length of a compact PADDING frame has a fixed size (varint bytes)
+# the fields of every compact frame type: (stream_id, offset, length), the fields it doesn't have are 0
+COMPACT_FIELDS = {DATA: (True, True, True), DATA_FIN: (True, True, True), ACK: (True, True, False),
+                  ACK_RANGE: (True, True, True), MAX_DATA: (False, True, False), DATA_BLOCKED: (False, True, False),
+                  MAX_STREAM_DATA: (True, True, False), STREAM_DATA_BLOCKED: (True, True, False),
+                  PADDING: (False, False, True), PACKET_RANGE: (False, True, True), ACK_DELAY: (False, True, False),
+                  IMMEDIATE_ACK: (False, False, False), FEC_SOURCE: (False, False, False),
+                  FEC_GROUP: (True, True, True), FEC_PARITY: (False, False, True), PATH: (False, True, False)}
 
 
 class DQUICHeader:
-    HEADER_FORMAT = "!BI"  # Format string for packing/unpacking
+    __slots__ = ("packet_type", "dst_conn_id", "src_conn_id", "packet_number", "version")  # (one per packet received)
+    HEADER_FORMAT = "!BQQI"  # Format string for packing/unpacking (the fixed layout, FIXED_VERSION)
+    HEADER_STRUCT = struct.Struct(HEADER_FORMAT)  # precompiled format
 
-    def __init__(self, packet_type: int, packet_number: int):  # dst_conn_id: int
+    def __init__(self, packet_type: int, packet_number: int, dst_conn_id: int = UNKNOWN_CONN_ID,
+                 src_conn_id: int = UNKNOWN_CONN_ID, version: int = FIXED_VERSION):
         self.packet_type = packet_type
+        self.dst_conn_id = dst_conn_id  # the receiver's connection id (UNKNOWN_CONN_ID until it's learned)
+        self.src_conn_id = src_conn_id  # the sender's connection id (UNKNOWN_CONN_ID once the receiver uses it)
         self.packet_number = packet_number
+        self.version = version  # the encoding of the packet
 
     def to_bytes(self) -> bytes:
         """
-        Serialize the DQUICHeader object to bytes with a fixed size.
+        Serialize the DQUICHeader object to bytes in its version's encoding.
         """
-        return struct.pack(self.HEADER_FORMAT, self.packet_type, self.packet_number)
+        return ENCODINGS[self.version].pack_header(self.packet_type, self.packet_number, self.dst_conn_id,
+                                                   self.src_conn_id)
 
     @classmethod
-    def from_bytes(cls, data: bytes) -> 'DQUICHeader':
+    def from_bytes(cls, data) -> 'DQUICHeader':
         """
-        Deserialize bytes to create a DQUICHeader object.
+        Deserialize the header at the start of a packet (of any version) to create a DQUICHeader object.
+        :return: the header, None if the data isn't a DQUIC packet
         """
-        packet_type, packet_number = struct.unpack(cls.HEADER_FORMAT, data)
-        return cls(packet_type, packet_number)
+        return packet_encoding(data).parse_header(data)[0]
 
 
 class DQUICFrame:
     """
     A class representing a DQUIC frame.
     """
-    FRAME_FORMAT = "!IIQI"  # Format string for packing/unpacking
+    __slots__ = ("stream_id", "frame_type", "offset", "length")  # (one per frame received, no attribute dict)
+    FRAME_FORMAT = "!IIQI"  # Format string for packing/unpacking (the fixed layout, FIXED_VERSION)
+    FRAME_STRUCT = struct.Struct(FRAME_FORMAT)  # precompiled format
 
     def __init__(self, stream_id: int, frame_type: int, offset: int, length: int):
         self.stream_id = stream_id  # represent the stream id
@@ -57,277 +127,2003 @@ class DQUICFrame:
     def append_offset(self, offset: int):
         self.offset += offset
 
-    def to_bytes(self) -> bytes:
+    def to_bytes(self, version: int = FIXED_VERSION) -> bytes:
         """
-        Serialize the DQUICFrame object to bytes with a fixed size.
+        Serialize the DQUICFrame object to bytes in the version's encoding (a fixed size by default).
         """
-        return struct.pack(self.FRAME_FORMAT, self.stream_id, self.frame_type, self.offset, self.length)
+        return ENCODINGS[version].pack_frame(self.stream_id, self.frame_type, self.offset, self.length)
 
     @classmethod
     def from_bytes(cls, data: bytes) -> 'DQUICFrame':
         """
-        Deserialize bytes to create a DQUICFrame object.
+        Deserialize bytes (the fixed layout) to create a DQUICFrame object.
         """
-        stream_id, frame_type, offset, length = struct.unpack(cls.FRAME_FORMAT, data)
+        stream_id, frame_type, offset, length = cls.FRAME_STRUCT.unpack(data)
         return cls(stream_id, frame_type, offset, length)
 
 
+class FixedEncoding:
+    """
+    A class encoding the packets in the original layout (FIXED_VERSION): a 21 bytes header and 20 bytes frames.
+    """
+    version = FIXED_VERSION
+
+    @staticmethod
+    def header_size(packet_number: int, src_conn_id: int) -> int:
+        return DQUICHeader.HEADER_STRUCT.size
+
+    @staticmethod
+    def frame_size(stream_id: int, frame_type: int, offset: int, length: int) -> int:
+        """
+        The function returns the size of a frame, without its data.
+        """
+        return DQUICFrame.FRAME_STRUCT.size
+
+    @staticmethod
+    def pack_header_into(buffer, pointer: int, packet_type: int, packet_number: int, dst_conn_id: int,
+                         src_conn_id: int) -> int:
+        """
+        The function writes a packet header into the buffer.
+        :return: the position after the header
+        """
+        DQUICHeader.HEADER_STRUCT.pack_into(buffer, pointer, packet_type, dst_conn_id, src_conn_id, packet_number)
+        return pointer + DQUICHeader.HEADER_STRUCT.size
+
+    @staticmethod
+    def pack_frame_into(buffer, pointer: int, stream_id: int, frame_type: int, offset: int, length: int) -> int:
+        """
+        The function writes a frame (without its data) into the buffer.
+        :return: the position after the frame
+        """
+        DQUICFrame.FRAME_STRUCT.pack_into(buffer, pointer, stream_id, frame_type, offset, length)
+        return pointer + DQUICFrame.FRAME_STRUCT.size
+
+    @staticmethod
+    def pack_header(packet_type: int, packet_number: int, dst_conn_id: int, src_conn_id: int) -> bytes:
+        return DQUICHeader.HEADER_STRUCT.pack(packet_type, dst_conn_id, src_conn_id, packet_number)
+
+    @staticmethod
+    def pack_frame(stream_id: int, frame_type: int, offset: int, length: int) -> bytes:
+        return DQUICFrame.FRAME_STRUCT.pack(stream_id, frame_type, offset, length)
+
+    @staticmethod
+    def parse_header(data):
+        """
+        The function reads the header of a packet.
+        :return: the header and where the frames start, (None, 0) if the data isn't a packet of this version
+        """
+        if len(data) < DQUICHeader.HEADER_STRUCT.size:
+            return None, 0
+        packet_type, dst_conn_id, src_conn_id, packet_number = DQUICHeader.HEADER_STRUCT.unpack_from(data)
+        return (DQUICHeader(packet_type, packet_number, dst_conn_id, src_conn_id, FIXED_VERSION),
+                DQUICHeader.HEADER_STRUCT.size)
+
+    @classmethod
+    def parse_frames(cls, data, pointer: int):
+        """
+        The function iterates over the frames of a packet.
+        :param data: the packet
+        :param pointer: where the frames start (after the header)
+        :return: generator of (DQUICFrame, stream data), the stream data is a view of the packet (empty if the
+        frame carries no data)
+        """
+        for stream_id, frame_type, offset, length, stream_data in cls.unpack_frames(data, pointer):
+            yield DQUICFrame(stream_id, frame_type, offset, length), stream_data
+
+    @classmethod
+    def path_id(cls, data, pointer: int) -> int:
+        """
+        The function returns the path of a packet whose frames start at pointer (see packet_path_id).
+        """
+        for _, frame_type, offset, _, _ in cls.unpack_frames(data, pointer):
+            return offset if frame_type == PATH else 0
+        return 0
+
+    @staticmethod
+    def unpack_frames(data, pointer: int):
+        """
+        The function iterates over the frames of a packet as plain records, unpacked in place (the receive path:
+        nothing is allocated per frame but its record and its data's view).
+        :param data: the packet
+        :param pointer: where the frames start (after the header)
+        :return: generator of (stream_id, frame_type, offset, length, stream data) (like the frames given to
+        build_packet), the stream data is a view of the packet (empty if the frame carries no data)
+        """
+        unpack_from = DQUICFrame.FRAME_STRUCT.unpack_from
+        frame_len = DQUICFrame.FRAME_STRUCT.size
+        view = memoryview(data)
+        while len(view) - pointer >= frame_len:
+            stream_id, frame_type, offset, length = unpack_from(view, pointer)
+            pointer += frame_len
+            stream_data = b""
+            if frame_type in DATA_FRAMES:  # only data, padding and parity frames are followed by data
+                stream_data = view[pointer:pointer + length]
+                pointer += length
+            yield stream_id, frame_type, offset, length, stream_data
+
+
+class CompactEncoding(FixedEncoding):
+    """
+    A class encoding the packets compactly (COMPACT_VERSION), with variable length integers (varint.py): the
+    header is the first byte (COMPACT_FORM, the packet type and whether the source connection id follows), the
+    destination connection id, the source connection id until the peer uses it, and the packet number. A frame is
+    its type byte and the fields the type needs (COMPACT_FIELDS), so an ACK frame takes 3-10 bytes instead of 20.
+    """
+    version = COMPACT_VERSION
+    CONN_ID_STRUCT = struct.Struct("!Q")  # connection ids keep their 64 bits (the high bits pick the worker)
+
+    @staticmethod
+    def header_size(packet_number: int, src_conn_id: int) -> int:
+        return 1 + 8 + (8 if src_conn_id != UNKNOWN_CONN_ID else 0) + varint.encoded_size(packet_number)
+
+    @staticmethod
+    def frame_size(stream_id: int, frame_type: int, offset: int, length: int) -> int:
+        has_stream_id, has_offset, has_length = COMPACT_FIELDS[frame_type]
+        size = 1
+        if has_stream_id:
+            size += 1 if stream_id < 0x40 else varint.encoded_size(stream_id)
+        if has_offset:
+            size += 1 if offset < 0x40 else varint.encoded_size(offset)
+        if has_length:
+            size += PADDING_LENGTH_SIZE if frame_type == PADDING else varint.encoded_size(length)
+        return size
+
+    @staticmethod
+    def pack_header_into(buffer, pointer: int, packet_type: int, packet_number: int, dst_conn_id: int,
+                         src_conn_id: int) -> int:
+        if src_conn_id != UNKNOWN_CONN_ID:
+            buffer[pointer] = COMPACT_FORM | SOURCE_CONN_ID | packet_type
+            CompactEncoding.CONN_ID_STRUCT.pack_into(buffer, pointer + 1, dst_conn_id)
+            CompactEncoding.CONN_ID_STRUCT.pack_into(buffer, pointer + 9, src_conn_id)
+            return varint.pack_into(buffer, pointer + 17, packet_number)
+        buffer[pointer] = COMPACT_FORM | packet_type
+        CompactEncoding.CONN_ID_STRUCT.pack_into(buffer, pointer + 1, dst_conn_id)
+        return varint.pack_into(buffer, pointer + 9, packet_number)
+
+    @staticmethod
+    def pack_frame_into(buffer, pointer: int, stream_id: int, frame_type: int, offset: int, length: int) -> int:
+        has_stream_id, has_offset, has_length = COMPACT_FIELDS[frame_type]
+        buffer[pointer] = frame_type
+        pointer += 1
+        if has_stream_id:
+            pointer = varint.pack_into(buffer, pointer, stream_id)
+        if has_offset:
+            pointer = varint.pack_into(buffer, pointer, offset)
+        if has_length:  # (a probe's padding length has a fixed size, so the probe's size is exact)
+            pointer = varint.pack_into(buffer, pointer, length, PADDING_LENGTH_SIZE if frame_type == PADDING else None)
+        return pointer
+
+    @staticmethod
+    def pack_header(packet_type: int, packet_number: int, dst_conn_id: int, src_conn_id: int) -> bytes:
+        buffer = bytearray(CompactEncoding.header_size(packet_number, src_conn_id))
+        CompactEncoding.pack_header_into(buffer, 0, packet_type, packet_number, dst_conn_id, src_conn_id)
+        return bytes(buffer)
+
+    @staticmethod
+    def pack_frame(stream_id: int, frame_type: int, offset: int, length: int) -> bytes:
+        buffer = bytearray(CompactEncoding.frame_size(stream_id, frame_type, offset, length))
+        CompactEncoding.pack_frame_into(buffer, 0, stream_id, frame_type, offset, length)
+        return bytes(buffer)
+
+    @staticmethod
+    def parse_header(data):
+        try:
+            first = data[0]
+            pointer = 9
+            dst_conn_id = CompactEncoding.CONN_ID_STRUCT.unpack_from(data, 1)[0]
+            src_conn_id = UNKNOWN_CONN_ID
+            if first & SOURCE_CONN_ID:
+                src_conn_id = CompactEncoding.CONN_ID_STRUCT.unpack_from(data, pointer)[0]
+                pointer += 8
+            packet_number, pointer = varint.unpack_from(data, pointer)
+        except (IndexError, struct.error):  # a truncated header
+            return None, 0
+        return DQUICHeader(first & PACKET_TYPE_MASK, packet_number, dst_conn_id, src_conn_id, COMPACT_VERSION), pointer
+
+    @staticmethod
+    def unpack_frames(data, pointer: int):
+        view = memoryview(data)
+        size = len(view)
+        unpack_from = varint.unpack_from
+        while pointer < size:
+            frame_type = view[pointer]
+            fields = COMPACT_FIELDS.get(frame_type)
+            if fields is None:  # the rest of the packet can't be parsed
+                return
+            has_stream_id, has_offset, has_length = fields
+            pointer += 1
+            stream_id = offset = length = 0
+            try:  # (the one byte values are read in place, most stream ids and small offsets)
+                if has_stream_id:
+                    stream_id = view[pointer]
+                    if stream_id < 0x40:
+                        pointer += 1
+                    else:
+                        stream_id, pointer = unpack_from(view, pointer)
+                if has_offset:
+                    offset = view[pointer]
+                    if offset < 0x40:
+                        pointer += 1
+                    else:
+                        offset, pointer = unpack_from(view, pointer)
+                if has_length:
+                    length, pointer = unpack_from(view, pointer)
+            except (IndexError, struct.error):  # a truncated frame
+                return
+            stream_data = b""
+            if frame_type in DATA_FRAMES:  # only data, padding and parity frames are followed by data
+                stream_data = view[pointer:pointer + length]
+                pointer += length
+            yield stream_id, frame_type, offset, length, stream_data
+
+
+ENCODINGS = {encoding.version: encoding for encoding in (FixedEncoding, CompactEncoding)}
+
+
+def packet_encoding(data):
+    """
+    The function returns the encoding of a packet by its first byte.
+    """
+    return CompactEncoding if len(data) > 0 and data[0] & COMPACT_FORM else FixedEncoding
+
+
+def parse_frames(data):
+    """
+    The function iterates over the frames of a packet (of any version).
+    :param data: the packet
+    :return: generator of (DQUICFrame, stream data), the stream data is a view of the packet (empty if the frame
+    carries no data)
+    """
+    encoding = packet_encoding(data)
+    header, pointer = encoding.parse_header(data)
+    if header is not None:
+        yield from encoding.parse_frames(data, pointer)
+
+
+def unpack_frames(data):
+    """
+    The function iterates over the frames of a packet (of any version) as plain records (see
+    FixedEncoding.unpack_frames).
+    :param data: the packet
+    :return: generator of (stream_id, frame_type, offset, length, stream data)
+    """
+    encoding = packet_encoding(data)
+    header, pointer = encoding.parse_header(data)
+    if header is not None:
+        yield from encoding.unpack_frames(data, pointer)
+
+
+def packet_path_id(data) -> int:
+    """
+    The function returns the path of a packet (of any version): its leading PATH frame, 0 (the first path) without
+    one.
+    """
+    encoding = packet_encoding(data)
+    header, pointer = encoding.parse_header(data)
+    return 0 if header is None else encoding.path_id(data, pointer)
+
+
+def resolve_address(address):
+    """
+    The function resolves a host name to its IPv4 address, so the packets from the peer match its connection.
+    :param address: (host, port)
+    :return: (ip, port)
+    """
+    return socket.getaddrinfo(address[0], address[1], socket.AF_INET, socket.SOCK_DGRAM)[0][4]
+
+
+def conn_id_worker(conn_id: int) -> int:
+    """
+    The function returns the worker that chose the connection id (its slice of the connection id space).
+    """
+    return conn_id >> (CONN_ID_BITS - WORKER_ID_BITS)
+
+
 class Connection:
-    def __init__(self, addr, connection_id):
-        self.addr = addr
-        self.conn_id = connection_id
-        self.sent_packet_number = 0
+    """
+    A class representing the state of a connection to one peer, without any I/O: the streams being sent and
+    received, the packets in flight, the rtt estimation, congestion control and the loss timers. The socket (DQUIC
+    or the asyncio endpoint) sends the packets it builds, passes it the packets received and wakes it up at
+    timer_deadline.
+    Every packet is filled up to the path MTU found by the connection's path MTU discovery (pmtud.py), with frames
+    of as many streams as fit.
+    A connection may span several paths (multipath.Path, a local socket and a peer address each): the packets in
+    flight, rtt, congestion control and loss timers are kept per path, the path scheduler spreads the packets over
+    the paths and a path that goes silent fails over to the others (its data is sent again on them).
+    """
+
+    def __init__(self, addr, connection_id, congestion_control=CONGESTION_CONTROL,
+                 max_datagram_size: int = congestion.MAX_DATAGRAM_SIZE, stream_window: int = STREAM_WINDOW,
+                 connection_window: int = CONNECTION_WINDOW, max_plpmtu: int = None,
+                 stream_scheduler=STREAM_SCHEDULER, versions=VERSIONS, ack_every: int = ACK_EVERY,
+                 max_ack_delay: float = MAX_ACK_DELAY, metrics=None, fec_group_size=FEC_GROUP_SIZE,
+                 path_scheduler=PATH_SCHEDULER):
+        # the paths of the connection by (path_id: Path), the first one is the peer's address on the main socket:
+        self.congestion_control = congestion_control  # (every path's)
+        self.max_datagram_size = max_datagram_size
+        self.max_plpmtu = max_plpmtu
+        self.fec_group_size = fec_group_size
+        self.paths = {0: multipath.Path(0, addr, 0, congestion_control, max_datagram_size, max_plpmtu,
+                                        fec_group_size)}
+        self.path_scheduler = multipath.create_path_scheduler(path_scheduler)
+        self.packet_path = self.paths[0]  # the path of the last packet next_packet or next_ack returned
+        self.conn_id = connection_id  # this side's connection id, the destination of the peer's packets
+        self.peer_conn_id = UNKNOWN_CONN_ID  # the peer's connection id, learned from its packets
+        self.peer_uses_conn_id = False  # the peer's packets are sent to conn_id, the headers may omit it
+        self.versions = tuple(versions)  # the wire encodings this side speaks, the preferred first
+        self.version = self.versions[0]  # the encoding of the packets sent (the peer's, once it sent a packet)
+        self.last_activity = 0.0  # the time of the last packet received (or object queued)
         self.recv_packet_number = 0
-        self.stream_bytes_ack = {}  # represent the bytes received in every stream for that connection by (stream:bytes)
+        self.recv_streams = {}  # represent the data received in every stream for that connection by (stream:RecvStream)
+        self.closed_recv_streams = {}  # streams received up to the fin and handed over, by (stream:final size)
+        self.readable_streams = {}  # the streams with data read in order or completed, not taken yet (an ordered set)
+        self.send_streams = {}  # the objects being sent represented by (stream:SendStream)
+        self.frame_sizes = {}  # the maximum data size of the frames of every object being sent, by (stream:size)
+        self.finished_send_streams = set()  # streams whose fin was acknowledged (nothing more can be sent on them)
+        self.completed_send_streams = []  # streams whose object was acknowledged, until the socket takes them
+        self.scheduler = scheduler.create_scheduler(stream_scheduler)  # the order of the streams ready to send
+        self.blocked_streams = set()  # streams whose new data waits for the peer's credit
         self.stream_bytes_sent = {}   # represent the bytes sent in every stream for that connection by (stream:bytes)
+        self.send_buffer = memoryview(bytearray(max_datagram_size))  # every packet is built here, then sent from it
+        # flow control, receiving: (the credit given to the peer is raised as the application reads)
+        self.stream_window = max(stream_window, INITIAL_MAX_STREAM_DATA)  # unread bytes allowed in a stream
+        self.connection_window = max(connection_window, INITIAL_MAX_DATA)  # unread bytes allowed in all streams
+        self.data_received = 0  # stream bytes received (up to the highest offset of every stream)
+        self.data_consumed = 0  # stream bytes read by the application
+        self.data_in_order = 0  # stream bytes received in order (up to the offset of every stream)
+        # the application takes whole streams (receive_streams): the data received in order is held for it, so it's
+        # credited at once instead of when it's read (the windows bound the data beyond it):
+        self.hold_streams = False
+        self.peer_blocked = False  # the peer is blocked by the credit, it's updated once the application reads
+        # flow control, sending: (the peer's credit)
+        self.peer_max_data = INITIAL_MAX_DATA  # the stream bytes that may be sent (of all streams)
+        self.peer_max_stream_data = {}  # the offset the data of every stream may reach by (stream:offset)
+        self.data_sent = 0  # new stream bytes sent (retransmissions don't use credit)
+        self.data_resent = 0  # stream bytes sent again (declared lost)
+        self.next_blocked_probe = 0.0  # the time a blocked sender may tell the peer it's blocked again
+        # delayed acks, receiving: (one ack covers the packets received on its path since the previous one)
+        self.ack_every = max(1, ack_every)  # packets received before the ack is sent at once
+        self.max_ack_delay = min(max_ack_delay, recovery.MAX_ACK_DELAY)  # (the peer's probe timeout allows for it)
+        self.ack_streams = {}  # the streams the next ack reports (ordered, values unused)
+        self.ack_credit_streams = {}  # the streams whose credit the next ack carries (ordered, values unused)
+        self.metrics = metrics  # the connection's metrics.ConnectionMetrics, None when the metrics are disabled
+
+    # the state of the first path: (a connection of one path is all about it)
+    @property
+    def addr(self):
+        """
+        The peer's current address on the first path (it may change, the connection ids identify the connection).
+        """
+        return self.paths[0].addr
+
+    @addr.setter
+    def addr(self, addr):
+        self.paths[0].addr = addr
+
+    @property
+    def rtt(self) -> recovery.RttEstimator:
+        return self.paths[0].rtt
+
+    @property
+    def congestion_controller(self) -> congestion.CongestionController:
+        return self.paths[0].congestion_controller
+
+    @property
+    def pmtud(self) -> pmtud.PathMtuDiscovery:
+        return self.paths[0].pmtud
+
+    @property
+    def sent_packets(self) -> dict:
+        return self.paths[0].sent_packets
+
+    @property
+    def largest_acked(self) -> int:
+        return self.paths[0].largest_acked
+
+    @property
+    def fec_encoder(self) -> fec.FecEncoder:
+        return self.paths[0].fec_encoder
+
+    @property
+    def fec_decoder(self) -> fec.FecDecoder:
+        return self.paths[0].fec_decoder
+
+    @property
+    def sent_packet_number(self) -> int:
+        """
+        The packets sent on all the paths.
+        """
+        return sum(path.sent_packet_number for path in self.paths.values())
+
+    @property
+    def ack_deadline(self):
+        """
+        The time the first pending ack (of any path) must be sent, None when no ack is pending.
+        """
+        return min((path.ack_deadline for path in self.paths.values() if path.ack_deadline is not None),
+                   default=None)
+
+    def add_path(self, addr, local: int, weight: int = multipath.DEFAULT_WEIGHT) -> multipath.Path:
+        """
+        The function opens a new path to the peer (its packets carry the path's PATH frame, the peer acks them on it).
+        It carries data once the ack of its first probe validates it. Only one side of a connection opens paths.
+        :param addr: the peer's address on the path
+        :param local: the local socket of the path (the I/O layer's index)
+        :param weight: the path's share of the packets (weighted round robin)
+        :return: the path
+        """
+        path = multipath.Path(max(self.paths) + 1, addr, local, self.congestion_control, self.max_datagram_size,
+                              self.max_plpmtu, self.fec_group_size, weight)
+        self.paths[path.path_id] = path
+        return path
+
+    def path_of(self, path_id: int, addr=None, local: int = None):
+        """
+        The function returns the path of a packet received, a path the peer opened is created by its first packet.
+        A path whose peer moved to another address (or local socket) follows it.
+        :param path_id: the packet's path (see packet_path_id)
+        :param addr: the packet's source, None to keep the path's address
+        :param local: the local socket the packet arrived at, None to keep the path's socket
+        :return: the path
+        """
+        path = self.paths.get(path_id)
+        if path is None:
+            path = self.paths[path_id] = multipath.Path(path_id, addr, local or 0, self.congestion_control,
+                                                        self.max_datagram_size, self.max_plpmtu, self.fec_group_size)
+            path.validated = True  # (its packets arrive)
+        if addr is not None:
+            path.addr = addr
+        if local is not None:
+            path.local = local
+        return path
+
+    def is_active(self) -> bool:
+        """
+        The function checks if the connection can't be forgotten: objects are being sent, or streams received up to
+        their fin are waiting for the application.
+        """
+        return bool(self.send_streams) or any(recv_stream.is_complete() for recv_stream in self.recv_streams.values())
+
+    def congestion_state(self) -> dict:
+        """
+        The function returns the congestion state of the connection (cwnd, bytes in flight, pacing rate...).
+        """
+        return self.congestion_controller.state()
+
+    def stats(self) -> dict:
+        """
+        The function returns the connection's metrics (see metrics.ConnectionMetrics.snapshot) with its addresses,
+        path MTU, rtt and congestion state (of the first path, and of every path when there are more).
+        :return: the metrics represented by (name: value), None when the metrics are disabled
+        """
+        if self.metrics is None:
+            return None
+        stats = self.metrics.snapshot()
+        stats.update(address=self.addr, conn_id=self.conn_id, peer_conn_id=self.peer_conn_id, version=self.version,
+                     path_mtu=self.pmtud.plpmtu, latest_rtt=self.rtt.latest_rtt, min_rtt=self.rtt.min_rtt,
+                     smoothed_rtt=self.rtt.smoothed_rtt, congestion=self.congestion_state(),
+                     fec_group_size=self.fec_encoder.group_size, fec_parity_packets=self.fec_encoder.parity_packets,
+                     fec_recovered=self.fec_decoder.recovered)
+        if len(self.paths) > 1:
+            stats["paths"] = [path.stats() for path in self.paths.values()]
+        return stats
+
+    @property
+    def encoding(self):
+        """
+        The encoding of the packets sent (FixedEncoding or CompactEncoding).
+        """
+        return ENCODINGS[self.version]
+
+    def src_conn_id(self) -> int:
+        """
+        The function returns the source connection id of the packets sent: conn_id until the peer uses it.
+        """
+        return UNKNOWN_CONN_ID if self.peer_uses_conn_id else self.conn_id
+
+    def header_size(self, packet_number: int) -> int:
+        """
+        The function returns the size of the header of the packet.
+        """
+        return self.encoding.header_size(packet_number, self.src_conn_id())
+
+    def packet_size(self, packet_number: int, frames: list) -> int:
+        """
+        The function returns the size of a packet of the frames [(stream_id, frame_type, offset, length, data)].
+        """
+        frame_size = self.encoding.frame_size
+        return self.header_size(packet_number) + sum(frame_size(*frame[:4]) + len(frame[4]) for frame in frames)
+
+    def build_packet(self, packet_type: int, packet_number: int, frames: list) -> memoryview:
+        """
+        The function assembles a packet in the connection's send buffer: the header and frames are packed in place
+        and the stream data is copied once, from the application's object.
+        :param packet_type: the packet type
+        :param packet_number: the packet number
+        :param frames: the frames represented by [(stream_id, frame_type, offset, length, stream data)]
+        :return: the packet, a view valid until the next packet is built
+        """
+        encoding = self.encoding
+        packet_size = self.packet_size(packet_number, frames)
+        if packet_size > len(self.send_buffer):  # the path MTU grew (or an ack of many frames)
+            self.send_buffer = memoryview(bytearray(packet_size))
+        buffer = self.send_buffer
+        pointer = encoding.pack_header_into(buffer, 0, packet_type, packet_number, self.peer_conn_id,
+                                            self.src_conn_id())
+        for stream_id, frame_type, offset, length, stream_data in frames:
+            pointer = encoding.pack_frame_into(buffer, pointer, stream_id, frame_type, offset, length)
+            buffer[pointer:pointer + len(stream_data)] = stream_data
+            pointer += len(stream_data)
+        return buffer[:pointer]
+
+    def packet_segments(self, packet_type: int, packet_number: int, frames: list) -> list:
+        """
+        The function returns the segments of a packet for scatter/gather sending: the packed header and frames, and
+        the stream data as is (nothing is copied).
+        :param packet_type: the packet type
+        :param packet_number: the packet number
+        :param frames: the frames represented by [(stream_id, frame_type, offset, length, stream data)]
+        :return: list of the packet's segments in order
+        """
+        encoding = self.encoding
+        segments = [encoding.pack_header(packet_type, packet_number, self.peer_conn_id, self.src_conn_id())]
+        for stream_id, frame_type, offset, length, stream_data in frames:
+            segments.append(encoding.pack_frame(stream_id, frame_type, offset, length))
+            if len(stream_data) > 0:
+                segments.append(stream_data)
+        return segments
+
+    def queue_object(self, stream_id: int, data, fin: bool, frame_size: int = None,
+                     priority: int = scheduler.DEFAULT_PRIORITY,
+                     weight: int = scheduler.DEFAULT_WEIGHT) -> streams.SendStream:
+        """
+        The function queues an object to send, continuing its stream after the bytes sent before.
+        :param stream_id: the object's stream
+        :param data: the object: bytes, any buffer, a file path or binary file object, an iterator of chunks or a
+        sources.ChunkSource the application appends to (see sources.open_source), read only as it's sent
+        :param fin: the object ends the stream
+        :param frame_size: the maximum data size of the object's frames, None to fill the packets
+        :param priority: the stream's urgency for the scheduler, lower is sent first
+        :param weight: the stream's share of the bandwidth among the streams of its priority (priority scheduler)
+        :return: the object's sending state (complete once the peer received all of it)
+        """
+        if stream_id in self.finished_send_streams:
+            raise ValueError(f"stream {stream_id} to {self.addr} was already finished")
+        if stream_id in self.send_streams:
+            raise ValueError(f"stream {stream_id} to {self.addr} is already being sent")
+        send_stream = streams.SendStream(stream_id, data, self.stream_bytes_sent.setdefault(stream_id, 0), fin)
+        if not send_stream.is_complete():  # empty objects has nothing to send (but the fin)
+            self.scheduler.add_stream(stream_id, send_stream, priority, weight)
+            self.send_streams[stream_id] = send_stream
+            self.frame_sizes[stream_id] = frame_size
+            self.__wake(stream_id)
+        return send_stream
+
+    def resume_stream(self, stream_id: int):
+        """
+        The function schedules a stream whose source got more bytes (or was finished) after it ran out of them.
+        """
+        self.__wake(stream_id)
+
+    def set_scheduler(self, stream_scheduler):
+        """
+        The function replaces the stream scheduler, the objects being sent keep their priorities.
+        :param stream_scheduler: scheduler name or a scheduler.StreamScheduler subclass
+        """
+        new_scheduler = scheduler.create_scheduler(stream_scheduler)
+        for stream_id, (send_stream, priority, weight) in self.scheduler.streams.items():
+            new_scheduler.add_stream(stream_id, send_stream, priority, weight)
+        self.scheduler = new_scheduler
+        for stream_id in self.send_streams:
+            self.__wake(stream_id)
+
+    def set_fec(self, group_size):
+        """
+        The function sets the forward error correction of the data packets (of every path) from the next group on.
+        :param group_size: data packets per parity packet (0 disables the parity), or "adaptive"
+        """
+        encoders = [fec.FecEncoder(group_size) for _ in self.paths]  # (an invalid group size changes nothing)
+        for path, encoder in zip(self.paths.values(), encoders):
+            path.fec_encoder = encoder
+        self.fec_group_size = group_size
+
+    def set_path_scheduler(self, path_scheduler):
+        """
+        The function replaces the path scheduler.
+        :param path_scheduler: scheduler name or a multipath.PathScheduler subclass
+        """
+        self.path_scheduler = multipath.create_path_scheduler(path_scheduler)
+
+    def take_completed_send_streams(self) -> list:
+        """
+        The function takes the streams whose object was acknowledged since the previous call.
+        """
+        completed, self.completed_send_streams = self.completed_send_streams, []
+        return completed
+
+    def max_packet_size(self) -> int:
+        """
+        The function returns the size of the data packets: the path MTU confirmed.
+        """
+        return self.pmtud.plpmtu
+
+    def is_mtu_probe(self, packet_number: int, path_id: int = 0) -> bool:
+        """
+        The function checks if the packet is the path MTU probe in flight on its path (it's sent by itself, not in
+        a batch).
+        """
+        path = self.paths.get(path_id)
+        return path is not None and packet_number == path.mtu_probe
+
+    def send_limit(self, stream_id: int) -> int:
+        """
+        The function returns the stream offset the stream's new data may reach: the peer's stream credit, and the
+        connection credit left.
+        """
+        return min(self.peer_max_stream_data.get(stream_id, INITIAL_MAX_STREAM_DATA),
+                   self.send_streams[stream_id].send_offset + max(0, self.peer_max_data - self.data_sent))
+
+    def __wake(self, stream_id: int):
+        """
+        The function passes a stream that has data to send (within the peer's credit) to the scheduler, or keeps it
+        with the blocked streams when its new data waits for credit. It's called whenever a stream may have become
+        ready: a queued object, lost data, raised credit.
+        """
+        send_stream = self.send_streams.get(stream_id)
+        if send_stream is None:
+            return
+        send_limit = self.send_limit(stream_id)
+        if send_stream.has_data_to_send(send_limit):
+            self.blocked_streams.discard(stream_id)
+            self.scheduler.push(stream_id)
+        elif send_stream.is_blocked(send_limit):
+            self.blocked_streams.add(stream_id)
+
+    def __remove_send_stream(self, stream_id: int):
+        """
+        The function forgets the sending state of a stream whose object was acknowledged (or abandoned).
+        """
+        self.send_streams.pop(stream_id).close()
+        del self.frame_sizes[stream_id]
+        self.scheduler.remove_stream(stream_id)
+        self.blocked_streams.discard(stream_id)
+
+    def __on_lost_frames(self, packet_frames: list):
+        """
+        The function queues the ranges of a packet that won't arrive to be sent again.
+        """
+        for stream_id, offset, length, frame_fin in packet_frames:
+            if stream_id in self.send_streams:
+                self.send_streams[stream_id].on_lost(offset, offset + length, frame_fin)
+                self.__wake(stream_id)
+
+    def __blocked_frames(self) -> list:
+        """
+        The function returns the frames telling the peer which credit blocks the sending (empty if none does).
+        """
+        frames = [(stream_id, STREAM_DATA_BLOCKED, self.peer_max_stream_data.get(stream_id, INITIAL_MAX_STREAM_DATA),
+                   0, b"") for stream_id in self.blocked_streams
+                  if self.send_streams[stream_id].is_blocked(self.send_limit(stream_id))]
+        if frames and self.data_sent >= self.peer_max_data:
+            frames.append((0, DATA_BLOCKED, self.peer_max_data, 0, b""))
+        return frames
+
+    @staticmethod
+    def __path_frames(path: multipath.Path) -> list:
+        """
+        The function returns the PATH frame leading the packets of the path (none for the first path).
+        """
+        return [(0, PATH, path.path_id, 0, b"")] if path.path_id else []
+
+    def __path_frame_size(self, path: multipath.Path) -> int:
+        return self.encoding.frame_size(0, PATH, path.path_id, 0) if path.path_id else 0
+
+    def __register_packet(self, path: multipath.Path, packet_payload: list, packet_frames: list, now: float):
+        """
+        The function numbers a packet in its path's packet number space and registers it as in flight on the path.
+        :return: the packet number and the packet's frames (led by the path's PATH frame)
+        """
+        packet_number = path.sent_packet_number
+        path.sent_packet_number += 1  # updating the number of packets sent on this path
+        packet_payload = self.__path_frames(path) + packet_payload
+        packet_size = self.packet_size(packet_number, packet_payload)
+        path.sent_packets[packet_number] = (now, packet_size, packet_frames)
+        if self.metrics is not None:
+            self.metrics.on_packet_sent(packet_number, packet_size, packet_frames, now)
+        path.last_send_time = now
+        path.congestion_controller.on_packet_sent(packet_number, packet_size, now)
+        path.pacer.on_packet_sent(packet_size, path.congestion_controller.pacing_rate, now)
+        self.packet_path = path
+        return packet_number, packet_payload
+
+    def __probe_packet(self, path: multipath.Path, probe_size: int, now: float):
+        """
+        The function builds a path MTU probe: a packet of the probe size padded with zero bytes (a PADDING frame).
+        :return: the packet number and the packet's frames
+        """
+        padding = (probe_size - self.header_size(path.sent_packet_number) - self.__path_frame_size(path)
+                   - self.encoding.frame_size(0, PADDING, 0, probe_size))
+        packet = self.__register_packet(path, [(0, PADDING, 0, padding, PADDING_DATA[:padding])], [], now)
+        path.mtu_probe = packet[0]
+        return packet
+
+    def __in_flight(self) -> bool:
+        """
+        The function checks if packets are in flight on the working paths (a probing path's probe doesn't count).
+        """
+        return any(path.sent_packets for path in self.paths.values() if not path.probing)
+
+    def next_packet(self, now: float, window_size: int = WINDOW_SIZE):
+        """
+        The function builds the frames of the next packet to send, if the window, congestion controller and pacer
+        of a path allow it, and registers it as in flight on that path (the path scheduler picks it among the paths
+        ready, see packet_path). New data is sent within the peer's credit, when the credit blocks everything the
+        peer is told so (once per probe timeout), its ack brings the raised credit.
+        The packet is filled up to the path MTU with frames of the streams ready to send, in the scheduler's order
+        and shares. While the path MTU is searched a probe is sent instead of the next packet, one at a time.
+        A new path is probed (an IMMEDIATE_ACK packet at a time) until its first ack validates it, and a failed path
+        until its ack brings it back. The paths other than the first carry packets once the peer's connection id is
+        known (the peer routes them by it).
+        :param now: current time
+        :param window_size: maximum packets in flight on a path
+        :return: the packet number and the frames represented by [(stream_id, frame_type, offset, length, stream
+        data)], None when no packet should be sent now
+        """
+        paths = self.paths.values()
+        for path in paths:
+            if path.fec_encoder.parity_due(path.sent_packet_number):  # (right after its group, like a probe)
+                return self.__parity_packet(path, now)
+        if len(self.paths) > 1 and self.send_streams and self.peer_conn_id != UNKNOWN_CONN_ID:
+            for path in paths:
+                if path.probing and not path.sent_packets:
+                    return self.__register_packet(path, [(0, IMMEDIATE_ACK, 0, 0, b"")], [], now)
+        ready = [path for path in paths if not path.probing and path.can_send(now, window_size)]
+        if not ready:
+            return None
+        if not self.scheduler and not self.__in_flight():  # nothing to wait for, the unacknowledged data is sent again
+            for stream_id, send_stream in self.send_streams.items():
+                send_stream.resend_unacked()
+                self.__wake(stream_id)
+        if self.scheduler:
+            path = ready[0] if len(ready) == 1 else self.path_scheduler.select(ready)
+            # a probe follows data in flight, its loss is detected by their acks (never by the probe timeout):
+            probe_size = path.pmtud.next_probe(now) if path.sent_packets and path.pto_count == 0 else None
+            if probe_size is not None:
+                return self.__probe_packet(path, probe_size, now)
+            # the last packet the window allows asks for an immediate ack (a delayed ack would stall the sending):
+            ack_frame = (0, IMMEDIATE_ACK, 0, 0, b"")
+            ack_frame_size = self.encoding.frame_size(*ack_frame[:4])
+            window_full = len(path.sent_packets) + 1 >= window_size or path.congestion_controller.bytes_in_flight \
+                + path.pmtud.plpmtu >= path.congestion_controller.cwnd
+            protected = path.fec_encoder.group_size > 0
+            packet_payload, packet_frames = self.__fill_packet(path, (ack_frame_size if window_full else 0)
+                                                               + (self.__fec_overhead(path) if protected else 0))
+            if packet_payload:
+                if window_full or not self.scheduler and self.packet_size(path.sent_packet_number, packet_payload) \
+                        + self.__path_frame_size(path) + ack_frame_size <= path.pmtud.plpmtu:  # (or the last data)
+                    packet_payload.append(ack_frame)
+                if protected:
+                    packet_payload.append((0, FEC_SOURCE, 0, 0, b""))
+                    path.fec_encoder.add(path.sent_packet_number,
+                                         self.__packed_frames(self.__path_frames(path) + packet_payload))
+                    path.fec_encoder.flush = not self.scheduler  # (the last data to send is protected at once)
+                return self.__register_packet(path, packet_payload, packet_frames, now)
+        # everything was sent, only waiting for acks (or credit):
+        if not self.__in_flight() and now >= self.next_blocked_probe:
+            blocked_frames = self.__blocked_frames()
+            if blocked_frames:
+                self.next_blocked_probe = now + ready[0].rtt.pto()
+                return self.__register_packet(ready[0], blocked_frames, [], now)
+        return None
+
+    def __fec_overhead(self, path: multipath.Path) -> int:
+        """
+        The function returns the bytes a protected data packet leaves for its FEC_SOURCE frame and for the frames
+        and the larger packet number of its group's parity packet (so the parity packet fits the path MTU).
+        """
+        frame_size = self.encoding.frame_size
+        packet_number = path.sent_packet_number
+        return frame_size(0, FEC_SOURCE, 0, 0) \
+            + frame_size(path.pmtud.plpmtu, FEC_GROUP, packet_number, fec.MAX_GROUP_SIZE) \
+            + frame_size(0, FEC_PARITY, 0, path.pmtud.plpmtu) \
+            + self.header_size(packet_number + fec.MAX_GROUP_SIZE) - self.header_size(packet_number)
+
+    def __packed_frames(self, frames: list) -> bytes:
+        """
+        The function returns the frames of a packet as they are sent (the packet's bytes after its header).
+        """
+        encoding = self.encoding
+        pieces = []
+        for stream_id, frame_type, offset, length, stream_data in frames:
+            pieces.append(encoding.pack_frame(stream_id, frame_type, offset, length))
+            pieces.append(stream_data)
+        return b"".join(pieces)
+
+    def __parity_packet(self, path: multipath.Path, now: float):
+        """
+        The function builds the parity packet of the group of data packets sent last on the path (see
+        fec.FecEncoder).
+        :return: the packet number and the packet's frames
+        """
+        first, count, length_xor, parity = path.fec_encoder.take_parity()
+        return self.__register_packet(path, [(length_xor, FEC_GROUP, first, count, b""),
+                                             (0, FEC_PARITY, 0, len(parity), parity)], [], now)
+
+    def __fill_packet(self, path: multipath.Path, reserve: int = 0):
+        """
+        The function takes the frames of the next packet from the streams the scheduler picks, until the packet is
+        full or no stream is ready (a frame of every stream at most, they get their next turn after the packet).
+        :param reserve: bytes of the packet left for other frames
+        :return: the frames represented by [(stream_id, frame_type, offset, length, stream data)], and the
+        (stream_id, offset, length, fin) they carry
+        """
+        frame_size = self.encoding.frame_size
+        # the bytes left in the packet:
+        room = path.pmtud.plpmtu - self.header_size(path.sent_packet_number) - self.__path_frame_size(path) - reserve
+        packet_payload = []  # represent the frames of this packet (stream_id, frame_type, offset, length, data)
+        packet_frames = []  # represent the (stream_id, offset, length, fin) carried by this packet
+        while room > frame_size(0, DATA, 0, 0):
+            stream_id = self.scheduler.pop()
+            if stream_id is None:
+                break
+            send_stream = self.send_streams[stream_id]
+            send_limit = self.send_limit(stream_id)  # (the previous frames used connection credit)
+            if not send_stream.has_data_to_send(send_limit):
+                self.__wake(stream_id)  # (blocked by the credit the previous frames used)
+                continue
+            # the frame's size without data, at most: (lost data has lower offsets, the length fits the room)
+            frame_len = frame_size(stream_id, DATA, send_stream.send_offset, room)
+            if room <= frame_len:  # its next turn is in the next packet
+                self.__wake(stream_id)
+                break
+            # the stream's share of the room left: (a frame with data at least)
+            max_length = min(max(self.scheduler.share(room, len(packet_frames)), 2 * frame_len), room) - frame_len
+            if self.frame_sizes[stream_id] is not None:
+                max_length = min(max_length, self.frame_sizes[stream_id])
+            # cutting the data to send from the relevant object: (lost data first, a view of the object)
+            send_offset = send_stream.send_offset
+            offset, stream_data = send_stream.next_chunk(max_length, send_limit)
+            self.data_sent += send_stream.send_offset - send_offset  # new data uses credit
+            self.data_resent += len(stream_data) - (send_stream.send_offset - send_offset)
+            frame_fin = send_stream.ends_stream(offset + len(stream_data))
+            # building the frame: (offset in the stream, not in the object)
+            packet_payload.append((stream_id, DATA_FIN if frame_fin else DATA, offset, len(stream_data), stream_data))
+            packet_frames.append((stream_id, offset, len(stream_data), frame_fin))
+            room -= frame_len + len(stream_data)
+            self.scheduler.on_sent(stream_id, len(stream_data))
+        for stream_id, _, _, _ in packet_frames:  # their next turn, if they have more to send
+            self.__wake(stream_id)
+        return packet_payload, packet_frames
+
+    def __declare_lost(self, path: multipath.Path, packet_numbers, now: float, trigger: str = "threshold"):
+        """
+        The function removes the lost packets from the flight of their path, their ranges that were not
+        acknowledged otherwise are sent again (on any path).
+        :param trigger: why they're lost: "threshold" (later packets were acknowledged), "pto_expired" or
+        "path_failed"
+        """
+        for packet_number in packet_numbers:
+            send_time, size, packet_frames = path.sent_packets.pop(packet_number)
+            if self.metrics is not None:
+                self.metrics.on_packet_lost(packet_number, size, "mtu_probe" if packet_number == path.mtu_probe
+                                            else trigger, now)
+            if packet_number == path.mtu_probe:  # maybe too big for the path, not a sign of congestion
+                path.mtu_probe = None
+                path.pmtud.on_probe_lost()
+                path.congestion_controller.on_packet_discarded(packet_number, size)
+                continue
+            path.congestion_controller.on_packet_lost(packet_number, size, send_time, now)
+            path.fec_encoder.on_packet_lost()
+            self.__on_lost_frames(packet_frames)
+
+    def on_ack_packet(self, packet_number: int, data, now: float):
+        """
+        The function handles an ACK packet: the packets it acknowledges (every packet received since the receiver's
+        previous ack) leave the flight, the largest one gives an rtt sample (without the time the receiver held the
+        ack), the ranges the receiver reports are marked as received, and the packets sent before them are checked
+        for loss. Only the streams the ack mentions are updated, the objects it completes are kept for
+        take_completed_send_streams.
+        The ack of a path (its leading PATH frame) acknowledges the packets sent on it, it validates a new path and
+        brings a failed path back.
+        :param packet_number: the ACK packet's number (the largest packet number it acknowledges)
+        :param data: the ACK packet
+        :param now: current time
+        """
+        if self.metrics is not None:
+            self.metrics.on_packet_received("ack", packet_number, len(data), now)
+        frames = list(unpack_frames(data))
+        path = self.paths.get(frames[0][2] if frames and frames[0][1] == PATH else 0)
+        if path is None:  # (not a path of this connection)
+            return
+        acked_packets = {packet_number}
+        ack_delay = 0.0
+        for _, frame_type, offset, length, _ in frames:
+            if frame_type == PACKET_RANGE:
+                acked_packets.update(range(offset, offset + length))
+            elif frame_type == ACK_DELAY:
+                ack_delay = offset / 1e6
+
+        acked_streams = set()  # the streams the ack mentions
+        for acked_packet in sorted(acked_packets):
+            if acked_packet not in path.sent_packets:  # acked before, or declared lost
+                continue
+            path.pto_count = 0
+            path.validated, path.failed = True, False  # (the path carries packets)
+            send_time, size, packet_frames = path.sent_packets.pop(acked_packet)
+            if acked_packet == packet_number:  # (the ack was held for ack_delay after this packet only)
+                path.rtt.update(now - send_time, ack_delay)
+                if self.metrics is not None:
+                    self.metrics.on_rtt_sample(now - send_time, ack_delay, path.rtt.smoothed_rtt, now)
+            if self.metrics is not None:
+                self.metrics.on_packet_acked(acked_packet, size, send_time, now)
+            path.largest_acked = max(path.largest_acked, acked_packet)
+            path.congestion_controller.on_packet_acked(acked_packet, size, send_time, now)
+            path.fec_encoder.on_packet_acked()
+            if acked_packet == path.mtu_probe:  # the path carries the probe's size
+                path.mtu_probe = None
+                path.congestion_controller.max_datagram_size = path.pmtud.on_probe_acked()
+            for stream_id, offset, length, frame_fin in packet_frames:  # the receiver holds the whole packet
+                if stream_id in self.send_streams:
+                    self.send_streams[stream_id].on_acked(offset, offset + length, frame_fin)
+                    acked_streams.add(stream_id)
+
+        # extracting frames: (acks of packets declared lost still tell which ranges were received)
+        for stream_id, frame_type, offset, length, _ in frames:
+            if frame_type in (MAX_DATA, MAX_STREAM_DATA):
+                self.on_credit_frame(stream_id, frame_type, offset)
+            elif frame_type in (PACKET_RANGE, ACK_DELAY, PATH):
+                continue
+            elif stream_id in self.send_streams:
+                if frame_type == ACK:  # how many sequenced bytes this stream received
+                    self.send_streams[stream_id].on_acked(0, offset)
+                    acked_streams.add(stream_id)
+                elif frame_type == ACK_RANGE:  # a range received out of order
+                    self.send_streams[stream_id].on_acked(offset, offset + length)
+
+        # updating the acknowledged objects:
+        for stream_id in acked_streams:
+            send_stream = self.send_streams[stream_id]
+            self.stream_bytes_sent[stream_id] = send_stream.base + send_stream.acked_offset  # actual bytes sent and acked
+            if send_stream.is_complete():  # the object was fully acknowledged
+                self.__remove_send_stream(stream_id)
+                self.completed_send_streams.append(stream_id)
+                if self.metrics is not None:
+                    self.metrics.on_stream_completed(stream_id, now)
+                if send_stream.fin:
+                    self.finished_send_streams.add(stream_id)
+
+        # packets sent before the acknowledged one and still not acknowledged:
+        lost_packets, path.loss_time = recovery.detect_lost_packets(path.sent_packets, path.largest_acked,
+                                                                    path.rtt.loss_delay(), now)
+        self.__declare_lost(path, lost_packets, now)
+
+    def on_credit_frame(self, stream_id: int, frame_type: int, offset: int):
+        """
+        The function raises the peer's credit by a MAX_DATA or MAX_STREAM_DATA frame (credit never decreases).
+        :param offset: the frame's credit (as offset)
+        """
+        if frame_type == MAX_DATA and offset > self.peer_max_data:
+            self.peer_max_data = offset
+            self.next_blocked_probe = 0.0  # blocked again later is told at once
+            for blocked_stream_id in list(self.blocked_streams):
+                self.__wake(blocked_stream_id)
+        elif frame_type == MAX_STREAM_DATA \
+                and offset > self.peer_max_stream_data.get(stream_id, INITIAL_MAX_STREAM_DATA):
+            self.peer_max_stream_data[stream_id] = offset
+            self.next_blocked_probe = 0.0
+            if stream_id in self.blocked_streams:
+                self.__wake(stream_id)
+
+    def on_credit_packet(self, data):
+        """
+        The function handles a MAX_DATA packet: the credit the peer raised after its application read data.
+        :param data: the packet
+        """
+        for stream_id, frame_type, offset, _, _ in unpack_frames(data):
+            if frame_type in (MAX_DATA, MAX_STREAM_DATA):
+                self.on_credit_frame(stream_id, frame_type, offset)
+
+    def loss_deadline(self):
+        """
+        The function returns when the packets in flight (of the first path to check) are checked for loss: by the
+        time threshold, or the probe timeout (backing off exponentially) when no ack arrives.
+        :return: the time, None if nothing is in flight
+        """
+        return min((deadline for deadline in (path.loss_deadline() for path in self.paths.values())
+                    if deadline is not None), default=None)
+
+    def timer_deadline(self, now: float, window_size: int = WINDOW_SIZE):
+        """
+        The function returns when on_timeout should be called: the loss deadline, or the time the pacer allows the
+        next packet if the window has room and there's data to send (or the time to tell the peer the credit blocks
+        the sending), and when the delayed ack is due (next_ack). A parity packet due is sent at once.
+        :param now: current time
+        :param window_size: maximum packets in flight
+        :return: the time, None if there's nothing to wait for
+        """
+        if any(path.fec_encoder.parity_due(path.sent_packet_number) for path in self.paths.values()):
+            return now  # (its group was sent)
+        if len(self.paths) > 1 and self.send_streams and self.peer_conn_id != UNKNOWN_CONN_ID \
+                and any(path.probing and not path.sent_packets for path in self.paths.values()):
+            return now  # (a probing path's probe)
+        deadline = self.loss_deadline()
+        ack_deadline = self.ack_deadline
+        if ack_deadline is not None:  # a delayed ack
+            deadline = ack_deadline if deadline is None else min(deadline, ack_deadline)
+        pacer_delay = min((path.pacer.delay(now) for path in self.paths.values()
+                           if not path.probing and len(path.sent_packets) < window_size
+                           and path.congestion_controller.can_send()), default=None)
+        if pacer_delay is not None:
+            send_time = None
+            if self.scheduler:  # (some streams may turn out blocked by the credit, they leave the scheduler)
+                send_time = now + pacer_delay
+            elif self.send_streams and not self.__in_flight():  # resending the unacknowledged data, or blocked
+                send_time = max(now + pacer_delay, self.next_blocked_probe)
+            if send_time is not None:
+                deadline = send_time if deadline is None else min(deadline, send_time)
+        return deadline
+
+    def on_timeout(self, now: float) -> bool:
+        """
+        The function handles the loss deadlines of the paths (nothing to do before them, the pacer's time to send).
+        A path silent for PATH_FAILURE_PTOS probe timeouts in a row while another path works fails over: its
+        packets are declared lost (their data is sent on the other paths) and it's only probed from then on.
+        :param now: current time
+        :return: False when the peer didn't respond to MAX_TRIES probe timeouts in a row, or for GIVE_UP_TIMEOUT
+        seconds (on its last working path)
+        """
+        responding = True
+        for path in list(self.paths.values()):
+            responding = self.__on_path_timeout(path, now) and responding
+        return responding
+
+    def __on_path_timeout(self, path: multipath.Path, now: float) -> bool:
+        loss_deadline = path.loss_deadline()
+        if loss_deadline is None or now < loss_deadline:
+            return True
+        if path.loss_time is not None:  # time threshold loss
+            lost_packets, path.loss_time = recovery.detect_lost_packets(path.sent_packets, path.largest_acked,
+                                                                        path.rtt.loss_delay(), now)
+            self.__declare_lost(path, lost_packets, now)
+            return True
+        path.pto_count += 1
+        if path.pto_count == 1:  # the oldest packet in flight is the first one unanswered
+            path.silent_since = min(send_time for send_time, _, _ in path.sent_packets.values())
+        if path.probing:  # the probe went unanswered, the next one follows
+            self.__declare_lost(path, list(path.sent_packets), now, "pto_expired")
+            return True
+        if path.pto_count >= multipath.PATH_FAILURE_PTOS \
+                and any(not other.probing for other in self.paths.values() if other is not path):
+            path.failed = True  # the path went silent, the other paths take its data
+            self.__declare_lost(path, list(path.sent_packets), now, "path_failed")
+            return True
+        # handling too many tries:
+        if path.pto_count > MAX_TRIES or now - path.silent_since >= GIVE_UP_TIMEOUT:
+            return False
+        if path.path_id == 0 and self.peer_conn_id == UNKNOWN_CONN_ID and self.version != self.versions[-1]:
+            # the peer never answered, it may not speak this version: the next packets use the next one
+            self.version = self.versions[self.versions.index(self.version) + 1]
+        if path.pto_count == pmtud.BLACK_HOLE_PROBES:  # maybe the path stopped carrying packets of the path MTU
+            path.congestion_controller.max_datagram_size = path.pmtud.on_black_hole()
+        # no ack for a whole probe timeout, the packets in flight are sent again as probes:
+        if self.metrics is not None:
+            self.metrics.on_probe_timeout(path.pto_count, now)
+        self.__declare_lost(path, list(path.sent_packets), now, "pto_expired")
+        return True
+
+    def discard_sent_packets(self):
+        """
+        The function stops waiting for the packets in flight on every path (no one handles their acks anymore).
+        """
+        for path in self.paths.values():
+            for packet_number, (_, size, _) in path.sent_packets.items():
+                path.congestion_controller.on_packet_discarded(packet_number, size)
+            path.sent_packets.clear()
+            path.loss_time = None
+            if path.mtu_probe is not None:
+                path.mtu_probe = None
+                path.pmtud.on_probe_discarded()
+
+    def on_packet_too_big(self, packet_number: int, path_id: int = 0):
+        """
+        The function handles a packet the local device refused as bigger than its MTU (EMSGSIZE, it was never
+        sent): a probe bounds the search, a data packet means the path MTU dropped, its data is sent again in
+        smaller packets.
+        :param packet_number: the refused packet
+        :param path_id: the path it was sent on
+        """
+        path = self.paths.get(path_id)
+        if path is None or packet_number not in path.sent_packets:
+            return
+        _, size, packet_frames = path.sent_packets.pop(packet_number)
+        path.congestion_controller.on_packet_discarded(packet_number, size)
+        if packet_number == path.mtu_probe:
+            path.mtu_probe = None
+            path.pmtud.on_packet_too_big()
+            return
+        path.congestion_controller.max_datagram_size = path.pmtud.on_black_hole()
+        self.__on_lost_frames(packet_frames)
+
+    def abandon_send_stream(self, stream_id: int):
+        """
+        The function gives up on the object being sent on a stream (its source failed, or its sending was
+        cancelled), closing its source. The stream's next object starts from the offset the peer acknowledged.
+        """
+        if stream_id in self.send_streams:
+            self.__remove_send_stream(stream_id)
+
+    def abandon_send_streams(self):
+        """
+        The function gives up on the objects being sent (the peer is not responding).
+        """
+        for stream_id in list(self.send_streams):
+            self.__remove_send_stream(stream_id)
+        self.discard_sent_packets()
+        for path in self.paths.values():
+            path.pto_count = 0
+
+    def max_data(self) -> int:
+        """
+        The function returns the connection credit of the peer: the application's reading (or the data received in
+        order, when the streams are held whole) plus the window.
+        """
+        return (self.data_in_order if self.hold_streams else self.data_consumed) + self.connection_window
+
+    def max_stream_data(self, recv_stream: streams.RecvStream) -> int:
+        """
+        The function returns the stream credit of the peer: the application's reading of the stream (or its offset
+        received in order, when the streams are held whole) plus the window.
+        """
+        return (recv_stream.offset if self.hold_streams else recv_stream.read_offset) + self.stream_window
+
+    def __credit_frames(self, stream_ids) -> list:
+        """
+        The function returns the MAX_DATA frame and the MAX_STREAM_DATA frames of the (open) streams.
+        """
+        frames = [(stream_id, MAX_STREAM_DATA, self.max_stream_data(self.recv_streams[stream_id]), 0, b"")
+                  for stream_id in stream_ids if stream_id in self.recv_streams]
+        frames.append((0, MAX_DATA, self.max_data(), 0, b""))
+        return frames
+
+    def credit_update(self):
+        """
+        The function returns the credit update for a peer that reported it's blocked, to send after the application
+        read data (a MAX_DATA packet, the packet number isn't used).
+        :return: the MAX_DATA packet's frames, None if the peer isn't waiting for credit
+        """
+        if not self.peer_blocked:
+            return None
+        self.peer_blocked = False
+        return self.__credit_frames(list(self.recv_streams))
+
+    def on_data_packet(self, data, now: float = 0.0, addr=None, local: int = None) -> bool:
+        """
+        The function writes the data frames of a packet into their streams, its acknowledgement is sent by
+        next_ack. Data is written at its offset (out of order data is kept until the gap before it is filled) and
+        duplicates are dropped. Data beyond the credit given to the peer is dropped too (not acknowledged).
+        The ack is delayed until ack_every packets were received or max_ack_delay passed, but it's sent at once
+        for a packet out of order (a loss), a completed stream or a sender waiting for it (IMMEDIATE_ACK, or
+        blocked by the credit).
+        A protected packet lost from a group is rebuilt from the group's parity packet (forward error correction)
+        and handled as if it arrived, its ack is sent at once.
+        The packets of every path are acknowledged on their path, a path opened by the peer starts with its first
+        packet (see path_of).
+        :param data: the packet
+        :param now: current time
+        :param addr: the packet's source, None to keep its path's address
+        :param local: the local socket the packet arrived at, None to keep its path's socket
+        :return: True if the packet carried stream data (False for a path MTU probe, credit or parity)
+        """
+        # handling object transition:
+        self.recv_packet_number += 1
+        encoding = packet_encoding(data)
+        header, pointer = encoding.parse_header(data)
+        if self.metrics is not None:
+            self.metrics.on_packet_received("1RTT", header.packet_number, len(data), now)
+        path = self.path_of(encoding.path_id(data, pointer), addr, local)
+        return self.__on_packet(path, header.packet_number, encoding, data, pointer, now)
+
+    def __on_packet(self, path: multipath.Path, packet_number: int, encoding, data, pointer: int,
+                    now: float) -> bool:
+        """
+        The function handles the frames of a data packet (received, or rebuilt from its group's parity).
+        :param path: the path it arrived on
+        :param encoding: the packet's encoding
+        :param pointer: where the frames start
+        :return: True if the packet carried stream data
+        """
+        ack_now = packet_number != path.largest_received + 1  # out of order: the gap is reported at once
+        path.largest_received = max(path.largest_received, packet_number)
+        if not path.unacked_packets or packet_number >= path.unacked_packets.ends[-1]:
+            path.largest_unacked_time = now  # (the ack delay is measured from the largest packet number)
+        path.unacked_packets.add(packet_number, packet_number + 1)
+        path.unacked_count += 1
+
+        # here can be checksum and sequence number validation
+
+        stream_frames = False
+        protected = False
+        fec_group = fec_parity = None
+        for stream_id, frame_type, offset, length, stream_data in encoding.unpack_frames(data, pointer):
+            if frame_type == FEC_SOURCE:
+                protected = True
+                continue
+            if frame_type == FEC_GROUP:
+                fec_group = (offset, length, stream_id)  # (first packet number, count, the lengths' XOR)
+                continue
+            if frame_type == FEC_PARITY:
+                fec_parity = stream_data
+                continue
+            if frame_type in (DATA_BLOCKED, STREAM_DATA_BLOCKED):  # the peer waits for credit
+                self.peer_blocked = True
+                self.ack_credit_streams[stream_id] = None
+                ack_now = True
+                continue
+            if frame_type == IMMEDIATE_ACK:  # the sender waits for this ack
+                ack_now = True
+                continue
+            if frame_type not in (DATA, DATA_FIN):  # only data frames are expected here (or the PATH frame)
+                continue
+            stream_frames = True
+            self.ack_streams[stream_id] = None  # (the next ack reports the stream's offset and ranges)
+            if stream_id in self.closed_recv_streams:  # a duplicate of a completed stream
+                continue
+            recv_stream = self.recv_streams.get(stream_id)
+            if recv_stream is None:  # the stream's first bytes
+                recv_stream = self.recv_streams[stream_id] = streams.RecvStream()
+            frame_end = offset + length
+            new_bytes = max(0, frame_end - recv_stream.highest_offset())  # bytes using connection credit
+            if frame_end <= self.max_stream_data(recv_stream) and self.data_received + new_bytes <= self.max_data():
+                in_order = recv_stream.offset
+                recv_stream.add(offset, stream_data, frame_type == DATA_FIN)
+                self.data_received += new_bytes
+                self.data_in_order += recv_stream.offset - in_order
+                if recv_stream.readable() > 0 or recv_stream.is_complete():
+                    self.readable_streams[stream_id] = None
+                if frame_type == DATA_FIN or recv_stream.is_complete():  # the sender waits for the whole object
+                    ack_now = True
+            self.ack_credit_streams[stream_id] = None
+
+        # forward error correction: (a protected packet is kept until its group's parity arrives)
+        recovered = []
+        if protected:
+            recovered = path.fec_decoder.on_source(packet_number, bytes(data[pointer:]))
+        elif fec_group is not None and fec_parity is not None:
+            recovered = path.fec_decoder.on_parity(*fec_group, fec_parity)
+        for recovered_number, payload in recovered:  # (acked at once, it's out of order)
+            stream_frames = self.__on_packet(path, recovered_number, encoding, payload, 0, now) or stream_frames
+
+        if ack_now or path.unacked_count >= self.ack_every:
+            path.ack_deadline = now
+        elif path.ack_deadline is None:
+            path.ack_deadline = now + self.max_ack_delay
+        return stream_frames
+
+    def next_ack(self, now: float):
+        """
+        The function returns the pending ACK packet once it's due: it acknowledges every packet received since the
+        previous ack (by packet number ranges) and reports, for every stream they carried, the in order offset and
+        the ranges buffered beyond it (so the sender resends only the missing ranges), and the peer's credit.
+        Every path acknowledges its own packets, the ack is sent on its path (see packet_path).
+        :param now: current time
+        :return: the ACK packet's number (the largest packet number it acknowledges) and its frames represented by
+        [(stream_id, frame_type, offset, length, data)], None when no ack is due
+        """
+        path = min((path for path in self.paths.values() if path.ack_deadline is not None),
+                   key=lambda path: path.ack_deadline, default=None)
+        if path is None or now < path.ack_deadline:
+            return None
+        # generating ack packet payload: (stream_id, frame_type, offset, length, data) of every ack frame
+        ack_packet_payload = self.__path_frames(path)
+        for stream_id in self.ack_streams:
+            if stream_id in self.recv_streams:
+                recv_stream = self.recv_streams[stream_id]
+                ack_packet_payload.append((stream_id, ACK, recv_stream.offset, 0, b""))
+                for start, end in recv_stream.ack_ranges():
+                    ack_packet_payload.append((stream_id, ACK_RANGE, start, end - start, b""))
+            elif stream_id in self.closed_recv_streams:
+                ack_packet_payload.append((stream_id, ACK, self.closed_recv_streams[stream_id], 0, b""))
+        ack_packet_payload.extend(self.__credit_frames(list(self.ack_credit_streams)))
+        for start, end in path.unacked_packets:
+            ack_packet_payload.append((0, PACKET_RANGE, start, end - start, b""))
+        ack_delay = int((now - path.largest_unacked_time) * 1e6)
+        ack_packet_payload.append((0, ACK_DELAY, max(0, ack_delay), 0, b""))
+        packet_number = path.unacked_packets.ends[-1] - 1
+        if self.metrics is not None:
+            self.metrics.on_ack_sent(packet_number, now - path.largest_unacked_time, now)
+
+        path.unacked_packets = streams.RangeSet()
+        path.unacked_count = 0
+        self.ack_streams.clear()
+        self.ack_credit_streams.clear()
+        path.ack_deadline = None
+        path.sent_packet_number += 1  # doing this in including of the ack packet
+        self.packet_path = path
+        return packet_number, ack_packet_payload
+
+    def close_recv_stream(self, stream_id: int):
+        """
+        The function forgets a stream received up to its fin, keeping only its final size to acknowledge duplicates.
+        """
+        self.closed_recv_streams[stream_id] = self.recv_streams.pop(stream_id).final_size
+        self.readable_streams.pop(stream_id, None)
+
+    def take_completed_streams(self, stream_ids=None) -> dict[int, memoryview]:
+        """
+        The function takes the streams received up to their fin out of the connection.
+        :param stream_ids: the streams needed (all of them must be completed), None for every completed stream
+        :return: completed streams represented by (stream_id:int : object:memoryview), empty if not completed yet
+        """
+        if stream_ids is None:
+            stream_ids = [stream_id for stream_id in self.readable_streams
+                          if self.recv_streams[stream_id].is_complete()]
+        elif not all(stream_id in self.recv_streams and self.recv_streams[stream_id].is_complete()
+                     for stream_id in stream_ids):
+            return {}
+        completed = {}
+        for stream_id in stream_ids:
+            completed[stream_id] = self.recv_streams[stream_id].view()
+            self.data_consumed += len(completed[stream_id])
+            self.close_recv_stream(stream_id)
+        return completed
+
+    def read_streams(self, max_bytes: int) -> dict[int, bytes]:
+        """
+        The function reads the data received in order from the streams (raising the peer's credit).
+        :param max_bytes: maximum bytes to read (from all streams together)
+        :return: serialized objects represented by (stream_id:int : object:bytes)
+        """
+        objs_dict = {}
+        for stream_id in list(self.readable_streams):
+            if max_bytes <= 0:
+                break
+            recv_stream = self.recv_streams[stream_id]
+            if recv_stream.readable() > 0:
+                objs_dict[stream_id] = recv_stream.read(max_bytes)
+                max_bytes -= len(objs_dict[stream_id])
+                self.data_consumed += len(objs_dict[stream_id])
+            if recv_stream.readable() == 0:
+                if recv_stream.is_complete():  # read up to the fin
+                    self.close_recv_stream(stream_id)
+                else:
+                    del self.readable_streams[stream_id]
+        return objs_dict
+
+
+class ConnectionTable:
+    """
+    A class representing the connections of a socket, indexed by this side's connection id (the destination id of
+    every packet received) and by the peer's address (for send_to, and the peers that don't know the id yet), so a
+    packet finds its connection in constant time. The connections are ordered by their last activity: idle ones are
+    forgotten after idle_timeout, and at max_connections the least recently active idle one makes room.
+    The ids are chosen in the worker's slice of the id space, so a sharded server knows where a packet belongs.
+    """
+
+    def __init__(self, congestion_control=CONGESTION_CONTROL, max_datagram_size: int = congestion.MAX_DATAGRAM_SIZE,
+                 idle_timeout: float = IDLE_TIMEOUT, max_connections: int = MAX_CONNECTIONS, worker: int = 0,
+                 stream_window: int = STREAM_WINDOW, connection_window: int = CONNECTION_WINDOW,
+                 max_plpmtu: int = None, stream_scheduler=STREAM_SCHEDULER, versions=VERSIONS,
+                 ack_every: int = ACK_EVERY, max_ack_delay: float = MAX_ACK_DELAY, metrics: bool = False,
+                 trace=None, fec_group_size=FEC_GROUP_SIZE, path_scheduler=PATH_SCHEDULER,
+                 hold_streams: bool = False):
+        if not 0 <= worker < MAX_WORKERS:
+            raise ValueError(f"worker must be in range(0, {MAX_WORKERS}), got {worker}")
+        if not versions or any(version not in ENCODINGS for version in versions):
+            raise ValueError(f"versions must be some of {tuple(ENCODINGS)}, got {versions}")
+        self.worker = worker  # the high bits of every connection id chosen (see conn_id_worker)
+        self.congestion_control = congestion_control  # congestion controller of every connection
+        self.max_datagram_size = max_datagram_size
+        self.max_plpmtu = max_plpmtu  # the top of every connection's path MTU search (None: the socket can't probe)
+        self.stream_window = stream_window  # the flow control windows of every connection
+        self.connection_window = connection_window
+        self.stream_scheduler = stream_scheduler  # stream scheduler of every connection (send_to may change it)
+        self.versions = tuple(versions)  # the wire encodings spoken, the preferred first (others are dropped)
+        self.ack_every = ack_every  # the ack policy of every connection (see Connection.next_ack)
+        self.max_ack_delay = max_ack_delay
+        self.metrics = metrics or trace is not None  # every connection keeps metrics (see metrics.py)
+        self.trace = trace  # the events of every connection are passed to it (like metrics.QlogWriter)
+        self.fec_group_size = fec_group_size  # the forward error correction of every connection (send_to may change it)
+        self.path_scheduler = path_scheduler  # the path scheduler of every connection (send_to may change it)
+        self.hold_streams = hold_streams  # every connection's streams are taken whole (see Connection.hold_streams)
+        self.idle_timeout = idle_timeout
+        self.max_connections = max(1, max_connections)
+        self.connections = collections.OrderedDict()  # by (conn_id: Connection), the least recently active first
+        self.addresses = {}  # by (address: Connection)
+        self.readable = {}  # the connections holding data the application didn't take, by (conn_id: Connection)
+
+    def __len__(self):
+        return len(self.connections)
+
+    def __iter__(self):
+        return iter(list(self.connections.values()))
+
+    def get(self, address):
+        """
+        The function returns the connection to the address, None if there's none.
+        """
+        return self.addresses.get(address)
+
+    def touch(self, connection: Connection, now: float):
+        """
+        The function marks the connection as active now.
+        """
+        connection.last_activity = now
+        self.connections.move_to_end(connection.conn_id)
+
+    def create(self, address, now: float, peer_conn_id: int = UNKNOWN_CONN_ID):
+        """
+        The function creates a connection to the address with a new random connection id, replacing the address's
+        previous connection (a new peer on the same address).
+        :param address: the peer's address
+        :param now: current time
+        :param peer_conn_id: the peer's connection id, if it's known
+        :return: the connection, None when the table is full of active connections
+        """
+        if len(self.connections) >= self.max_connections:
+            self.evict_idle(now)
+        if len(self.connections) >= self.max_connections:  # making room: the least recently active idle connection
+            for connection in self.connections.values():
+                if not connection.is_active():
+                    self.remove(connection)
+                    break
+            else:
+                return None
+        id_bits = CONN_ID_BITS - WORKER_ID_BITS
+        conn_id = self.worker << id_bits | random.getrandbits(id_bits)
+        while conn_id == UNKNOWN_CONN_ID or conn_id in self.connections:
+            conn_id = self.worker << id_bits | random.getrandbits(id_bits)
+        connection = Connection(address, conn_id, self.congestion_control, self.max_datagram_size, self.stream_window,
+                                self.connection_window, self.max_plpmtu, self.stream_scheduler, self.versions,
+                                self.ack_every, self.max_ack_delay,
+                                metrics.ConnectionMetrics(conn_id, self.trace) if self.metrics else None,
+                                self.fec_group_size, self.path_scheduler)
+        connection.peer_conn_id = peer_conn_id
+        connection.hold_streams = self.hold_streams
+        self.connections[conn_id] = connection
+        self.addresses[address] = connection
+        self.touch(connection, now)
+        return connection
+
+    def route(self, packet_header: DQUICHeader, address, now: float, create: bool = False, path_id: int = 0):
+        """
+        The function finds the connection of a received packet: by its destination connection id, or by the address
+        when the peer doesn't know the id yet. A connection whose peer moved to another address (a new port behind a
+        NAT) follows it, and the peer's connection id is learned from the packet.
+        The packets of the other paths of a connection (see packet_path_id) are found by the connection id only,
+        their address is their path's (see Connection.path_of).
+        :param packet_header: the received packet's header
+        :param address: the packet's source
+        :param now: current time
+        :param create: create a connection for a new peer
+        :param path_id: the packet's path
+        :return: the connection, None for an unknown peer (or a refused one)
+        """
+        connection = self.connections.get(packet_header.dst_conn_id)
+        if connection is None:
+            if path_id != 0:
+                return None
+            connection = self.addresses.get(address)
+            if connection is not None and connection.peer_conn_id not in (UNKNOWN_CONN_ID, packet_header.src_conn_id):
+                connection = None  # a new peer on the address of a previous one
+            if connection is None:
+                return self.create(address, now, packet_header.src_conn_id) if create else None
+        if path_id == 0 and connection.addr != address:  # the peer moved
+            if self.addresses.get(connection.addr) is connection:
+                del self.addresses[connection.addr]
+            connection.addr = address
+            self.addresses[address] = connection
+        if packet_header.src_conn_id != UNKNOWN_CONN_ID:
+            connection.peer_conn_id = packet_header.src_conn_id
+        if packet_header.dst_conn_id == connection.conn_id:
+            connection.peer_uses_conn_id = True
+        connection.version = packet_header.version  # answering in the peer's version
+        self.touch(connection, now)
+        return connection
+
+    def update_readable(self, connection: Connection):
+        """
+        The function keeps the connection among the readable ones while it holds data the application didn't take
+        (see Connection.readable_streams), so the receiving never scans the other connections.
+        """
+        if connection.readable_streams and self.connections.get(connection.conn_id) is connection:
+            self.readable[connection.conn_id] = connection
+        else:
+            self.readable.pop(connection.conn_id, None)
+
+    def remove(self, connection: Connection):
+        """
+        The function forgets the connection.
+        """
+        del self.connections[connection.conn_id]
+        self.readable.pop(connection.conn_id, None)
+        if self.addresses.get(connection.addr) is connection:
+            del self.addresses[connection.addr]
+
+    def evict_idle(self, now: float) -> list:
+        """
+        The function forgets the connections idle for idle_timeout (see Connection.is_active).
+        :param now: current time
+        :return: the connections forgotten
+        """
+        evicted = []
+        for connection in self.connections.values():
+            if now - connection.last_activity < self.idle_timeout:
+                break  # the rest were active later
+            if not connection.is_active():
+                evicted.append(connection)
+        for connection in evicted:
+            self.remove(connection)
+        return evicted
 
 
 class DQUIC:
 
-    def __init__(self):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.connections = []  # representing the connections by this socket
-        self.__header_len = len(DQUICHeader(SHORT, 2).to_bytes())  # measuring DQUICHeader
-        self.__frame_len = len(DQUICFrame(5, DATA, 6, 7).to_bytes())  # measuring DQUICFrame
+    def __init__(self, window_size: int = WINDOW_SIZE, congestion_control=CONGESTION_CONTROL, batch_io: bool = False,
+                 idle_timeout: float = IDLE_TIMEOUT, max_connections: int = MAX_CONNECTIONS,
+                 stream_window: int = STREAM_WINDOW, connection_window: int = CONNECTION_WINDOW,
+                 stream_scheduler=STREAM_SCHEDULER, versions=VERSIONS, ack_every: int = ACK_EVERY,
+                 max_ack_delay: float = MAX_ACK_DELAY, metrics: bool = False, trace=None,
+                 fec_group_size=FEC_GROUP_SIZE, path_scheduler=PATH_SCHEDULER):
+        self.sock = self.__open_socket()
+        self.window_size = max(1, window_size)  # maximum packets in flight
+        congestion.create_congestion_controller(congestion_control)  # validating the controller before using it
+        self.congestion_control = congestion_control  # congestion controller of every connection
+        scheduler.create_scheduler(stream_scheduler)  # validating the scheduler before using it
+        fec.FecEncoder(fec_group_size)  # validating the group size before using it
+        multipath.create_path_scheduler(path_scheduler)  # validating the path scheduler before using it
+        # batched I/O (linux GSO/GRO), each falls back to a syscall per packet when the kernel doesn't support it:
+        self.batch_io = batch_io
+        self.send_batch = datagrams.DatagramBatch(self.sock, batch_io)
+        self.datagram_receiver = datagrams.DatagramReceiver(self.sock, batch_io)
+        # the packets grow from the base size up to the path MTU found, when the socket can probe (don't fragment):
+        max_plpmtu = pmtud.MAX_PLPMTU if pmtud.enable_probing(self.sock) else None
+        # representing the connections by this socket: (by connection id and address)
+        self.connections = ConnectionTable(congestion_control, idle_timeout=idle_timeout,
+                                           max_connections=max_connections, stream_window=stream_window,
+                                           connection_window=connection_window, max_plpmtu=max_plpmtu,
+                                           stream_scheduler=stream_scheduler, versions=versions,
+                                           ack_every=ack_every, max_ack_delay=max_ack_delay, metrics=metrics,
+                                           trace=trace, fec_group_size=fec_group_size,
+                                           path_scheduler=path_scheduler)
+        # the sockets of the other paths (see open_path) represented by [(socket, send batch, receiver)], the main
+        # socket is the local socket 0 of every path, these are 1, 2...:
+        self.path_sockets = []
+        self.delayed_acks = set()  # the connections holding an ack until it's due (see Connection.next_ack)
+        self.next_eviction = 0.0  # the time the idle connections are forgotten next (every idle_timeout)
+        self.send_times = {}  # the seconds every object of the last send_to took until it was acknowledged
+
+    @staticmethod
+    def __open_socket() -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):  # room for a full window of packets
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFFER_SIZE)
+            except OSError:
+                pass  # the kernel keeps its default size
+        return sock
 
     def bind(self, server_address):
         self.sock.bind(server_address)
 
+    def open_path(self, address, path_address=None, local_address=("0.0.0.0", 0),
+                  weight: int = multipath.DEFAULT_WEIGHT) -> int:
+        """
+        The function opens another path of the connection to the address: a new local socket (bound to
+        local_address, like the address of another interface) sending to path_address, the peer's address on that
+        path. The connection's path scheduler spreads the packets of send_to over its paths (each with its own
+        packet numbers, rtt and congestion control), and a path that goes silent fails over to the others.
+        The peer needs nothing to accept the path (its packets are routed by the connection id), only one side of
+        a connection opens paths.
+        :param address: the peer's address (the connection's)
+        :param path_address: the peer's address on the path (a proxy, another address of the peer), None for address
+        :param local_address: the local address of the path's socket
+        :param weight: the path's share of the packets (weighted_round_robin path scheduler)
+        :return: the path id
+        """
+        address = resolve_address(address)
+        path_address = address if path_address is None else resolve_address(path_address)
+        curr_connection = self.__connection_handling(address)
+        sock = self.__open_socket()
+        try:
+            sock.bind(local_address)
+            path = curr_connection.add_path(path_address, len(self.path_sockets) + 1, weight)
+        except (OSError, ValueError):
+            sock.close()
+            raise
+        if self.connections.max_plpmtu is not None:
+            pmtud.enable_probing(sock)
+        self.path_sockets.append((sock, datagrams.DatagramBatch(sock, self.batch_io),
+                                  datagrams.DatagramReceiver(sock, self.batch_io)))
+        return path.path_id
+
+    def __local_socket(self, local: int):
+        """
+        The function returns a local socket with its send batch and receiver (0 is the main socket).
+        """
+        if local == 0:
+            return self.sock, self.send_batch, self.datagram_receiver
+        return self.path_sockets[local - 1]
+
     def __connection_handling(self, address) -> Connection:
         """
         The function handles the connection by the address.
         :param address: the address to handle
         :return: the connection object
         """
-        is_exist = False
-        curr_connection: Connection = None  # will finally hold the current connection object
-        for conn in self.connections:  # checking if address is in the connections
-            if conn.addr == address:
-                is_exist = True
-                curr_connection = conn
-        if is_exist is False:  # in case the address is not in the connections list, we create a new connection:
-            self.connections.append(Connection(address, len(self.connections)))
-            curr_connection = self.connections[-1]
+        now = time.perf_counter()
+        curr_connection = self.connections.get(address)
+        if curr_connection is None:  # in case there's no connection to the address, we create a new connection:
+            curr_connection = self.connections.create(address, now)
+            if curr_connection is None:
+                raise ConnectionError(f"too many active connections ({self.connections.max_connections})")
+        self.connections.touch(curr_connection, now)
         return curr_connection
 
-    def send_to(self, address, ser_obj_dict: dict[int, bytes]) -> int:
+    def __send_packet(self, connection: Connection, packet_type: int, packet_number: int, frames: list,
+                      path: multipath.Path = None) -> int:
+        """
+        The function sends a packet without assembling it in memory where the OS gathers the segments (sendmsg),
+        otherwise it's assembled in the connection's send buffer. With GSO the packet is only collected into the
+        send batch, sent with the next packets by __flush_packets.
+        :param connection: the connection of the packet
+        :param packet_type: the packet type
+        :param packet_number: the packet number
+        :param frames: the frames represented by [(stream_id, frame_type, offset, length, stream data)]
+        :param path: the path to send on, None for the path of the packet the connection built last (packet_path)
+        A path MTU probe is sent by itself, a probe bigger than the local device's MTU is refused at once.
+        :return: number of bytes sent (to the path's current address)
+        """
+        if path is None:
+            path = connection.packet_path
+        sock, send_batch, _ = self.__local_socket(path.local)
+        address = path.addr
+        probe = packet_type == SHORT and connection.is_mtu_probe(packet_number, path.path_id)
+        if send_batch.gso and not probe:
+            segments = connection.packet_segments(packet_type, packet_number, frames)
+            packet_size = sum(len(segment) for segment in segments)
+            send_batch.add(sock, segments, packet_size, address)
+            return packet_size
+        try:
+            if SENDMSG:
+                return sock.sendmsg(connection.packet_segments(packet_type, packet_number, frames), (), 0, address)
+            return sock.sendto(connection.build_packet(packet_type, packet_number, frames), address)
+        except OSError as error:
+            if error.errno != pmtud.PACKET_TOO_BIG or packet_type != SHORT:
+                raise
+            connection.on_packet_too_big(packet_number, path.path_id)
+            return 0
+
+    def __send_ack(self, connection: Connection, now: float):
+        """
+        The function sends the connection's ack if it's due, and keeps the connection among the delayed acks while
+        an ack is pending.
+        """
+        ack = connection.next_ack(now)
+        if ack is not None:
+            self.__send_packet(connection, ACK, *ack)
+        if connection.ack_deadline is None:
+            self.delayed_acks.discard(connection)
+        else:
+            self.delayed_acks.add(connection)
+
+    def __send_delayed_acks(self) -> float:
+        """
+        The function sends the delayed acks that are due.
+        :return: when the next delayed ack is due, None if no ack is pending
+        """
+        now = time.perf_counter()
+        for connection in list(self.delayed_acks):
+            self.__send_ack(connection, now)
+        return min((connection.ack_deadline for connection in self.delayed_acks), default=None)
+
+    def __flush_packets(self):
+        """
+        The function sends the packets collected in the send batches (nothing without GSO).
+        """
+        self.send_batch.flush(self.sock)
+        for sock, send_batch, _ in self.path_sockets:
+            send_batch.flush(sock)
+
+    def __pending(self) -> bool:
+        """
+        The function checks if packets of a train received at once (GRO) are waiting to be handled.
+        """
+        return bool(self.datagram_receiver.pending) or any(receiver.pending for _, _, receiver in self.path_sockets)
+
+    def __recvfrom(self, timeout: float = None):
+        """
+        The function receives the next packet on any local socket, the rest of a train received at once (GRO) first.
+        :param timeout: maximum seconds to wait, None to wait forever
+        :return: the packet, its source and its local socket (0 is the main socket)
+        :raise socket.timeout: no packet arrived in time
+        """
+        if not self.path_sockets or self.datagram_receiver.pending:
+            self.sock.settimeout(timeout)
+            return (*self.datagram_receiver.recvfrom(self.sock), 0)
+        for local, (sock, _, receiver) in enumerate(self.path_sockets, 1):
+            if receiver.pending:
+                return (*receiver.recvfrom(sock), local)
+        sockets = [self.sock, *(sock for sock, _, _ in self.path_sockets)]
+        readable, _, _ = select.select(sockets, [], [], timeout)
+        if not readable:
+            raise socket.timeout("timed out")
+        local = sockets.index(readable[0])
+        sock, _, receiver = self.__local_socket(local)
+        sock.settimeout(0.0001)  # (it's readable)
+        return (*receiver.recvfrom(sock), local)
+
+    def congestion_state(self, address) -> dict:
+        """
+        The function returns the congestion state of the connection to the address.
+        :param address: the connection's address
+        :return: the congestion controller state (cwnd, bytes in flight, pacing rate...), None for unknown address
+        """
+        connection = self.connections.get(resolve_address(address))
+        return None if connection is None else connection.congestion_state()
+
+    def stats(self) -> list:
+        """
+        The function returns the metrics of every connection (see Connection.stats), kept when the endpoint was
+        created with metrics=True or a trace.
+        :return: [metrics of a connection], empty when the metrics are disabled
+        """
+        return [connection.stats() for connection in self.connections if connection.metrics is not None]
+
+    def send_to(self, address, ser_obj_dict: dict[int, object], fin: bool = True, priorities: dict[int, int] = None,
+                weights: dict[int, int] = None, stream_scheduler=None, fec_group_size=None,
+                path_scheduler=None) -> int:
         """
         The function sends the objects and streams id's as bytes to dst address.
+        Packets are kept in flight as long as the connection's congestion window (and window_size) allows, paced by
+        the congestion controller's pacing rate. Each one is tracked by its packet number and the ACKs are handled
+        in the order they arrive. The ACKs report the ranges the receiver holds, so only missing ranges are sent
+        again. Packets are declared lost by the packet and time thresholds once later packets are acknowledged, or
+        by the probe timeout (derived from the connection's rtt estimation) when no ack arrives at all.
+        With fin, every object ends its stream (the receiver's receive_streams returns it whole), otherwise the next
+        call continues the streams.
+        The connection's stream scheduler decides which objects fill the packets (round robin by default, see
+        scheduler.py), the priorities and weights tell it which objects are urgent.
+        The time every object took until it was acknowledged is kept in send_times.
+        With forward error correction every group of data packets is followed by a parity packet, the receiver
+        rebuilds a packet lost from a group without waiting for its retransmission (see fec.py).
+        The objects may be files or iterators instead of bytes: they are read only as their packets are sent and
+        released once acknowledged, so the memory they take is bounded by the window instead of their size.
+        A connection with several paths (see open_path) sends on all of them, its path scheduler picks the path of
+        every packet (the lowest rtt ready by default, see multipath.py).
         :param address: destination address
-        :param ser_obj_dict: objects to send represented by (stream_id:int : object:bytes)
+        :param ser_obj_dict: objects to send represented by (stream_id:int : object), an object is bytes (or any
+        buffer), a file path, a binary file object (sent from its position) or an iterator of chunks
+        :param fin: the objects end their streams
+        :param priorities: the urgency of the objects by (stream_id: priority), lower is sent first (default 3)
+        :param weights: the bandwidth share of the objects of the same priority by (stream_id: weight) (default 1)
+        :param stream_scheduler: the connection's stream scheduler from this call on (name or class), None to keep it
+        :param fec_group_size: the connection's forward error correction from this call on: data packets per parity
+        packet (0 for none) or "adaptive" (by the loss rate), None to keep it
+        :param path_scheduler: the connection's path scheduler from this call on (name or class), None to keep it
         :return: number of bytes sent
         """
         # handling connection:
+        address = resolve_address(address)
         curr_connection = self.__connection_handling(address)
+        for stream_id in ser_obj_dict:
+            if stream_id in curr_connection.finished_send_streams or stream_id in curr_connection.send_streams:
+                raise ValueError(f"stream {stream_id} to {address} was already finished or is being sent")
+        if stream_scheduler is not None:
+            curr_connection.set_scheduler(stream_scheduler)
+        if fec_group_size is not None:
+            curr_connection.set_fec(fec_group_size)
+        if path_scheduler is not None:
+            curr_connection.set_path_scheduler(path_scheduler)
+        if not curr_connection.send_streams:  # packets left from previous calls
+            curr_connection.discard_sent_packets()
+        curr_connection.take_completed_send_streams()  # (objects of previous calls)
+        priorities = priorities or {}
+        weights = weights or {}
 
-        # stream sizes setting and frames building:
-        streams_sizes = {}  # represent the sizes of each stream
+        # frames building:
         frames = []  # represent the total frames needed in this sending process ( = number of objects to send)
-        frames_to_send = []  # represent a list of pointers to the frames that actually needs to send
-        streams_times = {}  # for times measuring and containing
-        max_stream_time = 0  # will represent the total time of sending process
+        send_streams = {}  # represent the sending state of every stream by (stream_id: SendStream)
+        self.send_times = {}  # the time every object took until it was acknowledged
 
         for stream_id, ser_obj in ser_obj_dict.items():
-            # randomizing stream sizes as required:
-            stream_size = random.randint(MIN_STREAM_SIZE, MAX_STREAM_SIZE)
-            streams_sizes[stream_id] = stream_size
-            # building frame:
-            frames.append(DQUICFrame(stream_id, DATA, 0, stream_size))
-            frames_to_send.append(frames[-1])  # appending the last frames appended to frames
-            if stream_id not in curr_connection.stream_bytes_sent:  # creating received bytes for connection by streams
-                curr_connection.stream_bytes_sent[stream_id] = 0
-            # TIMES HANDLING: allocating memory for time recording:
-            streams_times[stream_id] = 0
+            # the object continues the stream after the bytes sent before: (its frames fill the packets)
+            send_streams[stream_id] = curr_connection.queue_object(
+                stream_id, ser_obj, fin, priority=priorities.get(stream_id, scheduler.DEFAULT_PRIORITY),
+                weight=weights.get(stream_id, scheduler.DEFAULT_WEIGHT))
+            # building frame: (its offset represent the bytes acknowledged from the object)
+            frames.append(DQUICFrame(stream_id, DATA, 0, 0))
+        # represent the streams that still has unacknowledged data:
+        streams_to_send = {stream_id for stream_id in send_streams if not send_streams[stream_id].is_complete()}
 
         # loop over the packets to send:
-        total_bytes_sent_udp = 0
-        total_bytes_sent_objs = 0
-        while frames_to_send:  # checking if the list to send isn't empty
+        start_time = time.perf_counter()
+        while streams_to_send:  # checking if there are still unacknowledged objects
 
-            packet_payload = b""
-
-            # randomize frames according to the max frames in packet:
-            streams_ids_to_send = []  # represent the streams that will be sent in this packet
-            if len(frames_to_send) <= MAX_FRAMES_IN_PACKET:
-                streams_ids_to_send = [frame.stream_id for frame in frames_to_send]  # getting all streams to send
-            else:
-                streams_ids_to_send = random.sample([frame.stream_id for frame in frames_to_send], MAX_FRAMES_IN_PACKET)
-
-            frames_to_send_copy = frames_to_send.copy()  # copying the list to iterate over
-            # loop over the needed frames:
-            for frame in frames_to_send_copy:  # note: the loop is only over the streams that has more data to send
-                if frame.stream_id not in streams_ids_to_send:  # skipping the streams that are not in the current packet
-                    continue
-                # building the stream data payload:
-                bytes_to_send = min(streams_sizes[frame.stream_id], len(ser_obj_dict[frame.stream_id])-frame.offset)  # calculating the minimum between the stream size and the remaining bytes to send
-                if bytes_to_send == 0:  # in case the object was already fully transmitted
-                    frames_to_send.remove(frame)  # removing the frame from the list
-                    # TIMES HANDLING: calculating time for stream:
-                    streams_times[frame.stream_id] = time.perf_counter() - streams_times[frame.stream_id]
-                    max_stream_time = streams_times[frame.stream_id]  # it will get the last stream time
-                    continue
-                # cutting the data to send from the relevant object:
-                stream_data = ser_obj_dict[frame.stream_id][frame.offset:frame.offset+bytes_to_send]
-
-                # building the frame:
-                frame.set_length(bytes_to_send)  # setting the actual length of the stream data
-
-                # appending frame to packet:
-                packet_payload += frame.to_bytes()  # appending serialized frame
-                packet_payload += stream_data  # appending serialized stream data
-
-            if not frames_to_send:  # means there is no more frames to send
-                break
-
-            # building the packet header:
-            packet_header = DQUICHeader(SHORT, curr_connection.sent_packet_number)
-            curr_connection.sent_packet_number += 1  # updating the number of packets sent to this address
-            packet_to_send = packet_header.to_bytes() + packet_payload
-
-            # TIMES HANDLING: setting start time for all frames:
-            if total_bytes_sent_udp == 0:  # means we measure only from the first DQUIC packet sent:
-                for frame in frames:
-                    streams_times[frame.stream_id] = time.perf_counter()  # setting start time
-
-            # sending packet and handling ACK:
-            tries = 0
-            while tries <= MAX_TRIES:
+            # filling the window: (after handling every ack of a train received at once, GRO)
+            while not self.__pending():
+                # before sending, the ack may arrive before sendto returns:
+                packet = curr_connection.next_packet(time.perf_counter(), self.window_size)
+                if packet is None:  # the window, congestion controller or pacer holds the next packet
+                    break
                 # sending over UDP socket:
-                tries += 1
-                total_bytes_sent_udp += self.sock.sendto(packet_to_send, address)
-
-                # ack receiving:
-                try:
-                    self.sock.settimeout(ACK_TIMEOUT)
-                    received_bytes, acking_address = self.sock.recvfrom(65536)
-                except socket.timeout:
-                    continue
-                len_recv_bytes = len(received_bytes)
-
-                # extracting packet header:
-                received_packet_header: DQUICHeader = DQUICHeader.from_bytes(received_bytes[:self.__header_len])
-                deser_pointer = self.__header_len  # pointer for deserialization of header and frames
-
-                if received_packet_header.packet_number != packet_header.packet_number \
-                        or received_packet_header.packet_type != ACK:  # means the packet didn't acked the sent data
-                    continue
-
-                # extracting frames:
-                while len_recv_bytes - deser_pointer >= self.__frame_len:
-                    curr_frame: DQUICFrame = DQUICFrame.from_bytes(received_bytes[deser_pointer:deser_pointer + self.__frame_len])
-                    deser_pointer += self.__frame_len  # updating pointer
-
-                    if curr_frame.frame_type == ACK:
-                        # loop over sender sent frames:
-                        for sent_frame in frames_to_send:  # finding the correct frame by stream_id
-                            if sent_frame.stream_id == curr_frame.stream_id:
-                                sent_frame.offset = curr_frame.offset  # updating offset to: how many sequenced bytes this stream received
-                                curr_connection.stream_bytes_sent[sent_frame.stream_id] += sent_frame.length  # updating actual bytes sent and acked for every connection streams
-
-                    # ensuring data skipping:
-                    deser_pointer += curr_frame.length  # updating pointer according to stream data length
+                self.__send_packet(curr_connection, SHORT, *packet)
+            ack_deadline = self.__send_delayed_acks()  # (acks of data received from other peers meanwhile)
+            self.__flush_packets()  # the packets collected while filling the window (GSO)
 
-                break
-            # handling too many tries:
-            if tries > MAX_TRIES:
-                print(f"DQUIC PRINT: Not responding receiver (address: {address})")
-                break
+            # packets receiving: (until the loss timer expires, the pacer allows the next packet or an ack is due)
+            now = time.perf_counter()
+            deadline = curr_connection.timer_deadline(now, self.window_size)
+            if ack_deadline is not None:
+                deadline = min(deadline, ack_deadline)
+            try:
+                received = self.__recvfrom(max(0.0001, deadline - now))  # never 0 (non-blocking)
+            except socket.timeout:
+                if not curr_connection.on_timeout(time.perf_counter()):  # handling too many tries
+                    print(f"DQUIC PRINT: Not responding receiver (address: {curr_connection.addr})")
+                    break
+                continue
+            self.__handle_datagram(*received)  # acks, or data of other senders
+
+            # updating the acknowledged objects: (only the ones this ack completed)
+            for stream_id in curr_connection.take_completed_send_streams():
+                if stream_id in streams_to_send:
+                    streams_to_send.remove(stream_id)  # the object was fully acknowledged
+                    self.send_times[stream_id] = time.perf_counter() - start_time
 
-            # print(f"packet with {frames_num} frames sent")
+        for frame in frames:
+            frame.offset = send_streams[frame.stream_id].acked_offset  # the bytes acknowledged
 
         # resetting timeout:
         self.sock.settimeout(None)
+        if streams_to_send:  # the receiver is not responding
+            curr_connection.abandon_send_streams()
+        curr_connection.discard_sent_packets()  # the rest are not waited for anymore
 
-        # print(f"\nDQUIC PRINT: total packets sent to {address}: {curr_connection.sent_packet_number}")
-        # print(f"DQUIC PRINT: total bytes sent (udp): {total_bytes_sent_udp}")
-        # print(f"DQUIC PRINT: total bytes sent (objs): {total_bytes_sent_objs}\n")
-
-        # printing for assignment: NOTE: this printing are manipulative (referring only to requested object)
-        if frames[0].offset > 50:  # means dont print request and fin msg
-            frames_sum = 0
-            print("\n-------------------------------------- STATES --------------------------------------")
-            print("\n(a)+(b)+(c): Streams info")
-            for i, flow in enumerate(frames):  # calculating states for each stream:
-                stream_id = flow.stream_id  # getting the stream id
-                stream_size = streams_sizes[stream_id]  # getting the stream size (randomized)
-                total_bytes = flow.offset  # getting the total bytes sent via this stream
-                total_bytes_sent_objs += total_bytes  # updating the total bytes sent to this address
-                stream_frames = math.ceil(total_bytes//stream_size)  # calculating the total frames sent via this stream
-                frames_sum += stream_frames
-                print(f"Stream: {stream_id}, Stream size: {stream_size} bytes, Total bytes sent: {total_bytes},"
-                      f" Pace: {(total_bytes/streams_times[stream_id]):.2f} B/s, "
-                      f"{(stream_frames/streams_times[stream_id]):.2f} Packet/s")
-
-            print("\n(d)+(e): Connection info:")
-            print(f"Received data pace: {(total_bytes_sent_objs/max_stream_time):.2f} Bytes/s, {(curr_connection.sent_packet_number/max_stream_time):.2f} Packets/s")
-            print("\n------------------------------------------------------------------------------------\n")
-
-        return total_bytes_sent_objs
+        return sum(frame.offset for frame in frames)  # the bytes sent to this address (acknowledged)
 
-    def receive_from(self, max_bytes: int = MAX_RECV_BYTES):
+    def __read_streams(self, connection: Connection, max_bytes: int) -> dict[int, bytes]:
         """
-        The function receives data from src
-        :param max_bytes: maximum bytes willing to accept
-        :return: sender address and serialized objects represented by (stream_id:int : object:bytes)
+        The function reads the data received in order from the connection's streams (see Connection.read_streams).
+        :param connection: the connection to read from
+        :param max_bytes: maximum bytes to read (from all streams together)
+        :return: serialized objects represented by (stream_id:int : object:bytes)
         """
-        received_bytes, sender_address = self.sock.recvfrom(65536)
-        len_recv_bytes = len(received_bytes)
+        objs_dict = connection.read_streams(max_bytes)
+        self.connections.update_readable(connection)
+        self.__send_credit_update(connection)
+        return objs_dict
 
-        # handling connection:
-        curr_connection: Connection = self.__connection_handling(sender_address)
+    def __send_credit_update(self, connection: Connection):
+        """
+        The function sends the credit the application's reading raised to a peer waiting for it.
+        """
+        credit_frames = connection.credit_update()
+        if credit_frames:
+            self.__send_packet(connection, MAX_DATA, 0, credit_frames, connection.paths[0])
 
+    def __handle_datagram(self, received_bytes, address, local: int = 0) -> Connection:
+        """
+        The function passes a received packet to its connection: data packets are acknowledged (on their path) and
+        ACK packets update the sending.
+        :param received_bytes: the packet
+        :param address: the packet's source
+        :param local: the local socket it arrived at
+        :return: the sender's connection for a packet of stream data, None otherwise
+        """
         # extracting packet header:
-        packet_header: DQUICHeader = DQUICHeader.from_bytes(received_bytes[:self.__header_len])
-
-        deser_pointer = self.__header_len  # pointer for deserialization of header and frames
-        objs_dict = {}  # the returning dict
-        objects_bytes = 0
+        packet_header: DQUICHeader = DQUICHeader.from_bytes(received_bytes)
+        if packet_header is None or packet_header.version not in self.connections.versions:  # not a DQUIC packet
+            return None  # (or a version not spoken here, the sender falls back to another one)
+        if packet_header.packet_type not in (ACK, SHORT, MAX_DATA):
+            return None
+        now = time.perf_counter()
+        if now >= self.next_eviction:  # (on a timer, not on every packet)
+            self.connections.evict_idle(now)
+            self.next_eviction = now + self.connections.idle_timeout
+        # handling connection: (acks of unknown connections are late, a new peer's data opens a connection)
+        path_id = packet_path_id(received_bytes)
+        curr_connection = self.connections.route(packet_header, address, now, packet_header.packet_type == SHORT,
+                                                 path_id)
+        if curr_connection is None:  # a late ack, or the table is full of active connections
+            return None
+        if packet_header.packet_type == ACK:
+            curr_connection.on_ack_packet(packet_header.packet_number, received_bytes, now)
+            return None
+        if packet_header.packet_type == MAX_DATA:
+            curr_connection.on_credit_packet(received_bytes)
+            return None
 
-        # handling object transition:
-        if packet_header.packet_type == SHORT:
-            curr_connection.recv_packet_number += 1
-
-            # here can be checksum and sequence number validation
-
-            # print(f"received packet number: {packet_header.packet_number}")
-
-            # generating ack packet payload:
-            ack_packet_payload = b""
-            # unpacking packet payload frame by frame:
-            while len(received_bytes) - deser_pointer >= self.__frame_len:
-                # extracting frame:
-                curr_frame: DQUICFrame = DQUICFrame.from_bytes(received_bytes[deser_pointer:deser_pointer+self.__frame_len])
-                deser_pointer += self.__frame_len  # updating pointer
-
-                # extracting stream data:
-                stream_data: bytes = received_bytes[deser_pointer:deser_pointer+curr_frame.length]
-                deser_pointer += curr_frame.length  # updating pointer
-                objects_bytes += curr_frame.length  # updating the total amount of object bytes received
-
-                # ack packet handling: (we sent back the received frames with different type and updated fields
-                if curr_frame.stream_id not in curr_connection.stream_bytes_ack:  # checking if any bytes already received via this stream
-                    curr_connection.stream_bytes_ack[curr_frame.stream_id] = 0
-                if curr_frame.offset == curr_connection.stream_bytes_ack[curr_frame.stream_id]:  # means the stream data begins in the right place
-                    curr_frame.append_offset(curr_frame.length)  # updating frame's offset
-                    curr_connection.stream_bytes_ack[curr_frame.stream_id] += curr_frame.length  # updating connection offset by stream
-                else:
-                    curr_frame.offset = curr_connection.stream_bytes_ack[curr_frame.stream_id]  # sending the actual received offset
-                curr_frame.length = 0
-                curr_frame.frame_type = ACK
-                ack_packet_payload += curr_frame.to_bytes()
+        stream_frames = curr_connection.on_data_packet(received_bytes, now, address, local)
+        self.connections.update_readable(curr_connection)
+        self.__send_ack(curr_connection, now)  # (when it's due, otherwise it covers the next packets too)
+        if not stream_frames:  # a path MTU probe
+            return None
+        return curr_connection
 
-                # print(f"ack frame offset: {curr_frame.offset}")
+    def __receive_packet(self, deadline: float = None) -> Connection:
+        """
+        The function receives one packet and handles it (see __handle_datagram).
+        With GRO a train of packets is received at once, and their acks are sent together (GSO) once the whole
+        train was handled, or before returning to the application. The delayed acks are sent while waiting.
+        :param deadline: the time to give up waiting (socket.timeout is raised), None to wait forever
+        :return: the sender's connection, None for a packet that isn't data (late acks of previous sendings)
+        """
+        while not self.__pending():  # the acks collected must be sent before waiting for packets
+            ack_deadline = self.__send_delayed_acks()
+            self.__flush_packets()
+            wait_until = deadline if ack_deadline is None else min(ack_deadline, deadline or ack_deadline)
+            if wait_until is None:
+                break
+            try:
+                received = self.__recvfrom(max(0.0001, wait_until - time.perf_counter()))
+            except socket.timeout:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    raise
+                continue  # a delayed ack is due
+            return self.__handle_datagram(*received)
+        return self.__handle_datagram(*self.__recvfrom())
 
-                if objects_bytes <= max_bytes:  # in case bytes received is too large don't append to dict
-                    objs_dict[curr_frame.stream_id] = stream_data  # appending object to returning dict
+    def receive_from(self, max_bytes: int = MAX_RECV_BYTES):
+        """
+        The function receives data from src
+        Only data that continues its stream in order is returned: out of order data is buffered until the gap before
+        it is filled, and duplicates are dropped.
+        Data beyond max_bytes stays buffered and is returned by the next calls (before receiving new packets).
+        :param max_bytes: maximum bytes willing to accept
+        :return: sender address and serialized objects represented by (stream_id:int : object:bytes)
+        """
+        for conn in list(self.connections.readable.values()):  # data that didn't fit in the previous calls
+            objs_dict = self.__read_streams(conn, max_bytes)
+            if objs_dict:
+                return conn.addr, objs_dict
 
-            # print(f"packets till now: {self.recv_order-1}")
-            # sending ack:
-            ack_packet_header = DQUICHeader(ACK, packet_header.packet_number)
-            curr_connection.sent_packet_number += 1  # doing this in including of the ack packet
-            self.sock.sendto(ack_packet_header.to_bytes()+ack_packet_payload, sender_address)
+        curr_connection = None
+        while curr_connection is None:
+            curr_connection = self.__receive_packet()
+        self.__flush_packets()
+        return curr_connection.addr, self.__read_streams(curr_connection, max_bytes)
 
-        return sender_address, objs_dict
+    def receive_streams(self, stream_ids=None, timeout: float = None):
+        """
+        The function receives until whole streams (ended by the sender's fin) are received, and returns them.
+        Each frame is written once, in place at its offset, into its stream's buffer and the buffer itself is
+        returned (no joining of chunks), so large objects cost one copy and little more memory than their size.
+        Don't mix with receive_from on the same streams (the data it reads is not returned here).
+        :param stream_ids: the streams to wait for (from the same sender), None for any completed stream
+        :param timeout: maximum seconds to wait, None to wait forever
+        :return: sender address and the completed streams represented by (stream_id:int : object:memoryview),
+        (None, {}) on timeout
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        if not self.connections.hold_streams:  # the streams are held whole from now on, credited as they arrive
+            self.connections.hold_streams = True
+            for conn in self.connections:
+                conn.hold_streams = True
+                self.__send_credit_update(conn)
+        try:
+            for conn in list(self.connections.readable.values()):  # streams completed by the previous calls
+                completed = conn.take_completed_streams(stream_ids)
+                self.connections.update_readable(conn)
+                if completed:
+                    self.__send_credit_update(conn)
+                    return conn.addr, completed
+            while True:
+                if deadline is not None and deadline <= time.perf_counter():
+                    return None, {}
+                curr_connection = self.__receive_packet(deadline)  # only the packet's connection may complete streams
+                if curr_connection is not None:
+                    completed = curr_connection.take_completed_streams(stream_ids)
+                    self.connections.update_readable(curr_connection)
+                    if completed:
+                        self.__send_credit_update(curr_connection)
+                        return curr_connection.addr, completed
+        except socket.timeout:
+            return None, {}
+        finally:
+            self.__flush_packets()
+            self.sock.settimeout(None)
 
     def close(self):
         self.sock.close()
+        for sock, _, _ in self.path_sockets:
+            sock.close()
@@ -0,0 +1,469 @@
+import asyncio
+import socket
+import struct
+import time
+
+import congestion
+import fec
+import multipath
+import pmtud
+import scheduler
+import sources
+from DQUIC import (Connection, ConnectionTable, DQUICHeader, SHORT, ACK, WINDOW_SIZE, CONGESTION_CONTROL,
+                   SOCKET_BUFFER_SIZE, IDLE_TIMEOUT, MAX_CONNECTIONS, UNKNOWN_CONN_ID, MAX_DATA, STREAM_WINDOW,
+                   CONNECTION_WINDOW, STREAM_SCHEDULER, VERSIONS, ACK_EVERY, MAX_ACK_DELAY, FEC_GROUP_SIZE,
+                   PATH_SCHEDULER, conn_id_worker, packet_path_id)
+
+FORWARD_HEADER = struct.Struct("!4sH")  # the source address of a packet forwarded to another worker (IPv4, port)
+FEED_AHEAD = 256 * 1024  # the bytes of an async iterator read ahead of the sending (per stream)
+
+
+class ForwardProtocol(asyncio.DatagramProtocol):
+    """
+    A class receiving the packets the other workers of a sharded server forwarded to this worker (their connection
+    belongs to it), passing them to the endpoint as if they arrived at its socket from the peer.
+    """
+
+    def __init__(self, endpoint: 'AsyncDQUIC'):
+        self.endpoint = endpoint
+
+    def datagram_received(self, data, addr):
+        ip, port = FORWARD_HEADER.unpack_from(data)
+        self.endpoint.datagram_received(data[FORWARD_HEADER.size:], (socket.inet_ntoa(ip), port))
+
+
+class AsyncDQUIC(asyncio.DatagramProtocol):
+    """
+    A class representing a DQUIC endpoint on the asyncio event loop: one socket serving any number of connections
+    at once without threads. Every received packet is passed to its connection's state machine (Connection), and
+    each connection's loss and pacing timer is scheduled on the loop, so the sending of all connections progresses
+    together while the coroutines wait.
+    """
+
+    def __init__(self, window_size: int = WINDOW_SIZE, congestion_control=CONGESTION_CONTROL,
+                 idle_timeout: float = IDLE_TIMEOUT, max_connections: int = MAX_CONNECTIONS,
+                 stream_window: int = STREAM_WINDOW, connection_window: int = CONNECTION_WINDOW,
+                 stream_scheduler=STREAM_SCHEDULER, versions=VERSIONS, ack_every: int = ACK_EVERY,
+                 max_ack_delay: float = MAX_ACK_DELAY, metrics: bool = False, trace=None,
+                 fec_group_size=FEC_GROUP_SIZE, path_scheduler=PATH_SCHEDULER):
+        self.window_size = max(1, window_size)  # maximum packets in flight (per connection)
+        congestion.create_congestion_controller(congestion_control)  # validating the controller before using it
+        self.congestion_control = congestion_control  # congestion controller of every connection
+        scheduler.create_scheduler(stream_scheduler)  # validating the scheduler before using it
+        fec.FecEncoder(fec_group_size)  # validating the group size before using it
+        multipath.create_path_scheduler(path_scheduler)  # validating the path scheduler before using it
+        self.transport = None
+        self.sock = None  # the transport's socket, the path MTU probes are sent with it directly
+        # the send_to calls waiting, indexed by their streams: (conn_id: {stream_id: (streams left, future)})
+        self.__send_waiters = {}
+        self.__receive_waiters = []  # the receive_streams calls waiting represented by [(stream_ids, future)]
+        # the async iterators waiting for their streams to send the bytes read: (conn_id: {stream_id: event})
+        self.__feeders = {}
+        self.__timers = {}  # the timer of every connection by (conn_id: asyncio.TimerHandle)
+        self.__eviction_timer = None  # the periodic check for idle connections
+        self.__forward_transport = None  # the channel receiving the packets forwarded by the other workers
+        self.forward_socks = None  # the channels to every worker of a sharded server (see bind_worker)
+        self.forwarded_packets = 0  # packets of the other workers' connections passed to them
+        # representing the connections by this socket: (by connection id and address, the path MTU search is
+        # enabled by bind, the streams are only taken whole)
+        self.connections = ConnectionTable(congestion_control, idle_timeout=idle_timeout,
+                                           max_connections=max_connections, stream_window=stream_window,
+                                           connection_window=connection_window,
+                                           stream_scheduler=stream_scheduler, versions=versions,
+                                           ack_every=ack_every, max_ack_delay=max_ack_delay, metrics=metrics,
+                                           trace=trace, fec_group_size=fec_group_size,
+                                           path_scheduler=path_scheduler, hold_streams=True)
+
+    async def bind(self, local_address=('0.0.0.0', 0), reuse_port: bool = False):
+        """
+        The function opens the endpoint's socket on the running loop.
+        :param local_address: address to bind (any port by default, for clients)
+        :param reuse_port: share the address with the other sockets binding it with reuse_port (SO_REUSEPORT)
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):  # room for the windows of all the connections
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFFER_SIZE)
+            except OSError:
+                pass  # the kernel keeps its default size
+        if pmtud.enable_probing(sock):  # the packets grow up to the path MTU found
+            self.connections.max_plpmtu = pmtud.MAX_PLPMTU
+        sock.bind(local_address)
+        self.sock = sock
+        await asyncio.get_running_loop().create_datagram_endpoint(lambda: self, sock=sock)
+
+    async def bind_worker(self, local_address, worker: int, channels: list):
+        """
+        The function opens the socket of a sharded server's worker (see sharding.py): every worker binds the same
+        address (the kernel spreads the peers between them by their address), chooses the connection ids in its own
+        slice of the id space and forwards the packets of the other workers' connections to them (a peer whose
+        address changed is steered by the kernel to another worker).
+        :param local_address: the server's address
+        :param worker: the worker's index
+        :param channels: the (receiving socket, sending socket) of every worker (see sharding.create_channels)
+        """
+        self.connections.worker = worker
+        self.forward_socks = [send_sock for _, send_sock in channels]
+        for send_sock in self.forward_socks:
+            send_sock.setblocking(False)
+        await self.bind(local_address, reuse_port=True)
+        self.__forward_transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: ForwardProtocol(self), sock=channels[worker][0])
+
+    def __forward(self, worker: int, data, addr):
+        """
+        The function passes a packet to the worker holding its connection, with the peer's address.
+        """
+        if worker >= len(self.forward_socks):  # not a connection id of this server
+            return
+        try:
+            self.forward_socks[worker].sendmsg([FORWARD_HEADER.pack(socket.inet_aton(addr[0]), addr[1]), data])
+        except OSError:
+            return  # the channel is full, the packet is lost (and sent again by the peer)
+        self.forwarded_packets += 1
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.__evict_idle()
+
+    def error_received(self, exc):
+        pass  # an ICMP error of a sent packet (the peer is gone), the packet is handled as lost
+
+    def connection_lost(self, exc):
+        for timer in self.__timers.values():
+            timer.cancel()
+        self.__timers.clear()
+        if self.__eviction_timer is not None:
+            self.__eviction_timer.cancel()
+        for waiters in self.__send_waiters.values():
+            for _, future in waiters.values():
+                if not future.done():
+                    future.cancel()
+        self.__send_waiters.clear()
+        for _, future in self.__receive_waiters:
+            if not future.done():
+                future.cancel()
+
+    def __connection_handling(self, address) -> Connection:
+        """
+        The function handles the connection by the address.
+        :param address: the address to handle
+        :return: the connection object
+        """
+        now = time.perf_counter()
+        connection = self.connections.get(address)
+        if connection is None:
+            connection = self.connections.create(address, now)
+            if connection is None:
+                raise ConnectionError(f"too many active connections ({self.connections.max_connections})")
+        self.connections.touch(connection, now)
+        return connection
+
+    def __evict_idle(self):
+        """
+        The function forgets the idle connections (see ConnectionTable.evict_idle), every idle_timeout.
+        """
+        for connection in self.connections.evict_idle(time.perf_counter()):
+            if connection.conn_id in self.__timers:
+                self.__timers.pop(connection.conn_id).cancel()
+        self.__eviction_timer = asyncio.get_running_loop().call_later(self.connections.idle_timeout,
+                                                                      self.__evict_idle)
+
+    def datagram_received(self, data, addr):
+        """
+        The function passes a received packet to its connection: data packets are acknowledged (waking up the
+        receive_streams calls whose streams are complete), ACK packets move the connection's sending on.
+        """
+        packet_header = DQUICHeader.from_bytes(data)
+        if packet_header is None or packet_header.version not in self.connections.versions:  # not a DQUIC packet
+            return  # (or a version not spoken here)
+        if packet_header.packet_type not in (ACK, SHORT, MAX_DATA):
+            return
+        if self.forward_socks is not None and packet_header.dst_conn_id != UNKNOWN_CONN_ID \
+                and conn_id_worker(packet_header.dst_conn_id) != self.connections.worker:
+            self.__forward(conn_id_worker(packet_header.dst_conn_id), data, addr)  # another worker's connection
+            return
+        now = time.perf_counter()
+        # acks of unknown connections are late, a new peer's data opens a connection (if the table has room):
+        path_id = packet_path_id(data)  # (the paths the peer opened are acknowledged on their own addresses)
+        connection = self.connections.route(packet_header, addr, now, packet_header.packet_type == SHORT, path_id)
+        if connection is None:
+            return
+        if packet_header.packet_type == ACK:
+            connection.on_ack_packet(packet_header.packet_number, data, now)
+            self.__service(connection)
+        elif packet_header.packet_type == MAX_DATA:
+            connection.on_credit_packet(data)
+            self.__service(connection)
+        else:
+            ack_deadline = connection.ack_deadline
+            connection.on_data_packet(data, now, addr)
+            self.connections.update_readable(connection)
+            self.__send_ack(connection, now)
+            self.__wake_receivers(connection)
+            if connection.ack_deadline is not None and connection.ack_deadline != ack_deadline:
+                self.__service(connection)  # scheduling the delayed ack
+
+    def __service(self, connection: Connection):
+        """
+        The function sends the packets the connection allows now, wakes up the send_to calls whose objects were
+        acknowledged and schedules the connection's next timer.
+        """
+        now = time.perf_counter()
+        self.__send_ack(connection, now)
+        while True:
+            packet = connection.next_packet(now, self.window_size)
+            if packet is None:  # the window, congestion controller or pacer holds the next packet
+                break
+            if connection.is_mtu_probe(packet[0], connection.packet_path.path_id):
+                self.__send_probe(connection, *packet)
+            else:
+                self.transport.sendto(connection.build_packet(SHORT, *packet), connection.packet_path.addr)
+            now = time.perf_counter()
+
+        # waking up the send_to calls whose objects were acknowledged: (only the streams the acks completed)
+        waiters = self.__send_waiters.get(connection.conn_id)
+        for stream_id in connection.take_completed_send_streams():
+            if waiters and stream_id in waiters:
+                streams_left, future = waiters.pop(stream_id)
+                streams_left.discard(stream_id)
+                if not streams_left and not future.done():
+                    future.set_result(None)
+        if not waiters:
+            self.__send_waiters.pop(connection.conn_id, None)
+        for stream_id, event in self.__feeders.get(connection.conn_id, {}).items():  # (room for the next chunks)
+            send_stream = connection.send_streams.get(stream_id)
+            if send_stream is None or send_stream.end - send_stream.send_offset < FEED_AHEAD:
+                event.set()
+
+        if connection.conn_id in self.__timers:
+            self.__timers.pop(connection.conn_id).cancel()
+        deadline = connection.timer_deadline(now, self.window_size)
+        if deadline is not None:
+            self.__timers[connection.conn_id] = asyncio.get_running_loop().call_later(
+                max(0.0, deadline - now), self.__on_timer, connection)
+
+    def __send_ack(self, connection: Connection, now: float):
+        """
+        The function sends the connection's ack if it's due (see Connection.next_ack).
+        """
+        ack = connection.next_ack(now)
+        if ack is not None:
+            self.transport.sendto(connection.build_packet(ACK, *ack), connection.packet_path.addr)
+
+    def __send_probe(self, connection: Connection, packet_number: int, frames: list):
+        """
+        The function sends a path MTU probe with the socket itself, so a probe bigger than the local device's MTU
+        is refused at once (the transport would only report the error later, without the packet).
+        """
+        path = connection.packet_path
+        try:
+            self.sock.sendto(connection.build_packet(SHORT, packet_number, frames), path.addr)
+        except BlockingIOError:
+            pass  # the socket buffer is full, the probe is handled as lost
+        except OSError as error:
+            if error.errno != pmtud.PACKET_TOO_BIG:
+                raise
+            connection.on_packet_too_big(packet_number, path.path_id)
+
+    def __on_timer(self, connection: Connection):
+        """
+        The function handles a connection's timer: loss detection and probes, the pacer's time to send, or a
+        delayed ack.
+        """
+        self.__timers.pop(connection.conn_id, None)
+        if not connection.on_timeout(time.perf_counter()):  # handling too many tries
+            print(f"DQUIC PRINT: Not responding receiver (address: {connection.addr})")
+            connection.abandon_send_streams()
+            for _, future in self.__send_waiters.pop(connection.conn_id, {}).values():
+                if not future.done():
+                    future.set_result(None)
+            for event in self.__feeders.get(connection.conn_id, {}).values():  # (their streams were abandoned)
+                event.set()
+            return
+        self.__service(connection)
+
+    def __take_completed_streams(self, stream_ids):
+        """
+        The function takes completed streams from the first connection that has them (see
+        Connection.take_completed_streams).
+        :return: sender address and the completed streams, (None, {}) if no connection has them
+        """
+        for connection in list(self.connections.readable.values()):
+            completed = connection.take_completed_streams(stream_ids)
+            self.connections.update_readable(connection)
+            if completed:
+                self.__send_credit_update(connection)
+                return connection.addr, completed
+        return None, {}
+
+    def __wake_receivers(self, connection: Connection):
+        """
+        The function wakes up the receive_streams calls whose streams the connection completed.
+        """
+        for stream_ids, future in self.__receive_waiters.copy():
+            if future.done():
+                continue
+            completed = connection.take_completed_streams(stream_ids)
+            if completed:
+                self.connections.update_readable(connection)
+                future.set_result((connection.addr, completed))
+                self.__send_credit_update(connection)
+
+    def __send_credit_update(self, connection: Connection):
+        """
+        The function sends the credit the application's reading raised to a peer waiting for it.
+        """
+        credit_frames = connection.credit_update()
+        if credit_frames:
+            self.transport.sendto(connection.build_packet(MAX_DATA, 0, credit_frames), connection.addr)
+
+    def __abandon_send_streams(self, connection: Connection, send_streams: dict, future: asyncio.Future):
+        """
+        The function gives up on the objects of a send_to call that didn't end with their acknowledgement (an
+        iterator's error, or the call was cancelled): their streams leave the connection and their waiters are
+        dropped, so the connection may become idle and the streams may be sent on again.
+        :param send_streams: the call's streams represented by (stream_id: SendStream)
+        :param future: the call's future, set once all of them were acknowledged
+        """
+        waiters = self.__send_waiters.get(connection.conn_id, {})
+        for stream_id, send_stream in send_streams.items():
+            if connection.send_streams.get(stream_id) is send_stream:
+                connection.abandon_send_stream(stream_id)
+            if stream_id in waiters and waiters[stream_id][1] is future:
+                del waiters[stream_id]
+        if not waiters:
+            self.__send_waiters.pop(connection.conn_id, None)
+        if not future.done():
+            future.cancel()
+
+    async def __feed(self, connection: Connection, stream_id: int, chunks, source: sources.ChunkSource):
+        """
+        The function reads an async iterator's chunks into its stream's source, up to FEED_AHEAD bytes ahead of the
+        sending, until it's exhausted (or the stream was abandoned).
+        """
+        event = asyncio.Event()
+        self.__feeders.setdefault(connection.conn_id, {})[stream_id] = event
+        try:
+            async for chunk in chunks:
+                source.append(chunk)
+                connection.resume_stream(stream_id)
+                self.__service(connection)
+                send_stream = connection.send_streams.get(stream_id)
+                while send_stream is not None and send_stream.end - send_stream.send_offset >= FEED_AHEAD:
+                    event.clear()
+                    await event.wait()
+                    send_stream = connection.send_streams.get(stream_id)
+                if send_stream is None:  # (abandoned)
+                    return
+            source.finish()
+            connection.resume_stream(stream_id)
+            self.__service(connection)
+        finally:
+            feeders = self.__feeders[connection.conn_id]
+            del feeders[stream_id]
+            if not feeders:
+                del self.__feeders[connection.conn_id]
+
+    async def send_to(self, address, ser_obj_dict: dict[int, object], fin: bool = True,
+                      priorities: dict[int, int] = None, weights: dict[int, int] = None, stream_scheduler=None,
+                      fec_group_size=None, path_scheduler=None) -> int:
+        """
+        The function sends the objects to the address, returning once the receiver acknowledged all of them (or
+        stopped responding). The other connections keep sending and receiving meanwhile.
+        The objects of concurrent calls to the same address share the connection's stream scheduler (see
+        DQUIC.send_to).
+        An object may also be an async iterator of chunks, read up to FEED_AHEAD bytes ahead of the sending while
+        the loop runs (the other kinds of objects are read as their packets are sent, see DQUIC.send_to).
+        :param address: destination address
+        :param ser_obj_dict: objects to send represented by (stream_id:int : object), an object is bytes (or any
+        buffer), a file path, a binary file object, an iterator or an async iterator of chunks
+        :param fin: the objects end their streams
+        :param priorities: the urgency of the objects by (stream_id: priority), lower is sent first (default 3)
+        :param weights: the bandwidth share of the objects of the same priority by (stream_id: weight) (default 1)
+        :param stream_scheduler: the connection's stream scheduler from this call on (name or class), None to keep it
+        :param fec_group_size: the connection's forward error correction from this call on: data packets per parity
+        packet (0 for none) or "adaptive" (by the loss rate), None to keep it
+        :param path_scheduler: the connection's path scheduler from this call on (name or class), None to keep it
+        :return: number of bytes sent (acknowledged)
+        """
+        if self.transport is None:
+            await self.bind()
+        loop = asyncio.get_running_loop()
+        address = (await loop.getaddrinfo(address[0], address[1], family=socket.AF_INET,
+                                          type=socket.SOCK_DGRAM))[0][4]
+        connection = self.__connection_handling(address)
+        for stream_id in ser_obj_dict:
+            if stream_id in connection.finished_send_streams or stream_id in connection.send_streams:
+                raise ValueError(f"stream {stream_id} to {address} was already finished or is being sent")
+        if stream_scheduler is not None:
+            connection.set_scheduler(stream_scheduler)
+        if fec_group_size is not None:
+            connection.set_fec(fec_group_size)
+        if path_scheduler is not None:
+            connection.set_path_scheduler(path_scheduler)
+        priorities = priorities or {}
+        weights = weights or {}
+        async_iterators = {stream_id: ser_obj for stream_id, ser_obj in ser_obj_dict.items()
+                           if hasattr(ser_obj, "__aiter__")}
+        send_streams = {stream_id: connection.queue_object(
+                            stream_id, sources.ChunkSource() if stream_id in async_iterators else ser_obj, fin,
+                            priority=priorities.get(stream_id, scheduler.DEFAULT_PRIORITY),
+                            weight=weights.get(stream_id, scheduler.DEFAULT_WEIGHT))
+                        for stream_id, ser_obj in ser_obj_dict.items()}
+        feeding_tasks = [asyncio.create_task(self.__feed(connection, stream_id, chunks, send_streams[stream_id].source))
+                         for stream_id, chunks in async_iterators.items()]
+        future = loop.create_future()
+        streams_left = {stream_id for stream_id, send_stream in send_streams.items() if not send_stream.is_complete()}
+        if streams_left:
+            waiters = self.__send_waiters.setdefault(connection.conn_id, {})
+            for stream_id in streams_left:
+                waiters[stream_id] = (streams_left, future)
+            self.__service(connection)
+        else:
+            future.set_result(None)
+        try:
+            await asyncio.gather(future, *feeding_tasks)  # (an iterator's error is raised here)
+        finally:
+            for task in feeding_tasks:
+                task.cancel()
+            self.__abandon_send_streams(connection, send_streams, future)
+        return sum(send_stream.acked_offset for send_stream in send_streams.values())
+
+    async def receive_streams(self, stream_ids=None, timeout: float = None):
+        """
+        The function waits until whole streams (ended by the sender's fin) are received, and returns them (see
+        DQUIC.receive_streams).
+        :param stream_ids: the streams to wait for (from the same sender), None for any completed stream
+        :param timeout: maximum seconds to wait, None to wait forever
+        :return: sender address and the completed streams represented by (stream_id:int : object:memoryview),
+        (None, {}) on timeout
+        """
+        if self.transport is None:
+            await self.bind()
+        address, completed = self.__take_completed_streams(stream_ids)
+        if completed:
+            return address, completed
+        future = asyncio.get_running_loop().create_future()
+        waiter = (stream_ids, future)
+        self.__receive_waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None, {}
+        finally:
+            self.__receive_waiters.remove(waiter)
+
+    def stats(self) -> list:
+        """
+        The function returns the metrics of every connection (see DQUIC.stats), not a coroutine.
+        """
+        return [connection.stats() for connection in self.connections if connection.metrics is not None]
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+        if self.__forward_transport is not None:
+            self.__forward_transport.close()
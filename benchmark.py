@@ -0,0 +1,138 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+import random
+import time
+
+import DQUIC
+
+BENCH_ADDRESS = ('127.0.0.1', 9990)  # the receiver's address
+NUM_OBJECTS = 10
+MIN_OBJECT_SIZE = 1 * 1024 * 1024  # 1 MB
+MAX_OBJECT_SIZE = 2 * 1024 * 1024  # 2 MB
+
+
+class LossySocket:
+    """
+    A wrapper of a UDP socket dropping a fraction of the received datagrams (the rest is passed to the socket).
+    """
+
+    def __init__(self, sock, loss: float):
+        self.sock = sock
+        self.loss = loss
+
+    def recvfrom_into(self, buffer, nbytes: int = 0):
+        while True:
+            received = self.sock.recvfrom_into(buffer, nbytes)
+            if random.random() >= self.loss:
+                return received
+
+    def recvmsg_into(self, buffers, ancbufsize: int = 0):  # a train received at once (GRO) is dropped as a whole
+        while True:
+            received = self.sock.recvmsg_into(buffers, ancbufsize)
+            if random.random() >= self.loss:
+                return received
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+
+def generate_objects(num_objects: int = NUM_OBJECTS) -> dict[int, bytes]:
+    """
+    The function generates random objects the same way server.py does (1-2 MB each).
+    :param num_objects: number of objects
+    :return: objects represented by (stream_id:int : object:bytes)
+    """
+    return {stream_id: os.urandom(random.randint(MIN_OBJECT_SIZE, MAX_OBJECT_SIZE)) for stream_id in range(num_objects)}
+
+
+def receiver(address, ready, loss: float, expected_objects: dict[int, bytes], batch_io: bool, cpu_times):
+    """
+    The function receives the objects up to their streams' end, the same way client.py does.
+    :param address: address to bind
+    :param ready: event to set once the socket is bound
+    :param loss: fraction of the received packets to drop
+    :param expected_objects: the objects that should be received (checked)
+    :param batch_io: receiving with GRO (and acking with GSO)
+    :param cpu_times: queue to put the receiving cpu time in
+    """
+    receiver_socket = DQUIC.DQUIC(batch_io=batch_io)
+    receiver_socket.bind(address)
+    if loss > 0:
+        receiver_socket.sock = LossySocket(receiver_socket.sock, loss)
+    ready.set()
+    start_time = time.process_time()
+    _, ser_objs_dict = receiver_socket.receive_streams(list(expected_objects))
+    cpu_times.put(time.process_time() - start_time)
+    receiver_socket.close()
+    if any(ser_objs_dict[stream_id] != obj for stream_id, obj in expected_objects.items()):
+        print("BENCHMARK PRINT: the received objects are corrupted")
+
+
+def run_transfer(objects: dict[int, bytes], window_size: int, congestion_control=DQUIC.CONGESTION_CONTROL,
+                 loss: float = 0.0, batch_io: bool = False):
+    """
+    The function sends the objects to a receiver process and measures the transfer time.
+    :param objects: objects to send represented by (stream_id:int : object:bytes)
+    :param window_size: maximum packets in flight
+    :param congestion_control: the sender's congestion controller
+    :param loss: fraction of the packets the receiver drops
+    :param batch_io: both sides send and receive trains of packets (GSO/GRO)
+    :return: seconds until the last object was acknowledged, packets sent, and the cpu seconds of the sender and
+    of the receiver
+    """
+    ready = multiprocessing.Event()
+    cpu_times = multiprocessing.Queue()
+    receiver_process = multiprocessing.Process(target=receiver,
+                                               args=(BENCH_ADDRESS, ready, loss, objects, batch_io, cpu_times))
+    receiver_process.start()
+    ready.wait()
+
+    sender_socket = DQUIC.DQUIC(window_size=window_size, congestion_control=congestion_control, batch_io=batch_io)
+    start_time, start_cpu_time = time.perf_counter(), time.process_time()
+    sender_socket.send_to(BENCH_ADDRESS, objects)
+    total_time, sender_cpu_time = time.perf_counter() - start_time, time.process_time() - start_cpu_time
+    packets_sent = next(iter(sender_socket.connections)).sent_packet_number
+    sender_socket.close()
+    receiver_cpu_time = cpu_times.get()
+    receiver_process.join()
+    return total_time, packets_sent, sender_cpu_time, receiver_cpu_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DQUIC loopback throughput benchmark")
+    parser.add_argument("--window", type=int, nargs="+", default=[1, DQUIC.WINDOW_SIZE],
+                        help="maximum packets in flight (1 means stop-and-wait)")
+    parser.add_argument("--congestion-control", nargs="+", default=[DQUIC.CONGESTION_CONTROL],
+                        help="congestion controllers (newreno, cubic, bbr)")
+    parser.add_argument("--loss", type=float, nargs="+", default=[0.0],
+                        help="fractions of the packets the receiver drops")
+    parser.add_argument("--batch-io", nargs="+", choices=["off", "on"], default=["off"],
+                        help="sending and receiving trains of packets (linux GSO/GRO)")
+    parser.add_argument("--runs", type=int, default=1, help="transfers of every configuration")
+    arguments = parser.parse_args()
+
+    objects = generate_objects()
+    total_size = sum(len(obj) for obj in objects.values())
+    print(f"Transferring {len(objects)} objects, total size: {total_size} bytes")
+
+    results = {}
+    for configuration in itertools.product(arguments.window, arguments.congestion_control, arguments.loss,
+                                           arguments.batch_io):
+        results[configuration] = sorted(run_transfer(objects, *configuration[:3], configuration[3] == "on")
+                                        for _ in range(arguments.runs))
+
+    print("\n------------------------------------- THROUGHPUT -------------------------------------")
+    for (window_size, congestion_control, loss, batch_io), transfers in results.items():
+        mode = "stop-and-wait" if window_size == 1 else f"window of {window_size} packets"
+        median_time, packets_sent, sender_cpu_time, receiver_cpu_time = transfers[len(transfers) // 2]
+        print(f"{mode:>26} ({congestion_control}, {loss:.0%} loss, batch io {batch_io}): {median_time:.3f} s"
+              f" (max {transfers[-1][0]:.3f} s), {total_size / median_time / 1e6:.2f} MB/s,"
+              f" {packets_sent / median_time:.0f} packets/s,"
+              f" cpu: sender {sender_cpu_time / median_time:.0%} ({sender_cpu_time / packets_sent * 1e6:.0f} us/packet)"
+              f" receiver {receiver_cpu_time / median_time:.0%} ({receiver_cpu_time / packets_sent * 1e6:.0f} us/packet)")
+
+
+if __name__ == '__main__':
+    main()
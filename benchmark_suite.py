@@ -0,0 +1,241 @@
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import platform
+import random
+import time
+
+import DQUIC
+import impairment
+import multipath
+
+SERVER_ADDRESS = ('127.0.0.1', 9996)  # the receiver's address
+RECEIVE_TIMEOUT = 120  # the longest wait of the receiver for the objects (in seconds)
+LINGER_TIME = 1.0  # the receiver keeps acknowledging after the last object (its last acks may be lost)
+MB = 1024 * 1024
+# the objects of every workload represented by [(number of objects, object size)]
+WORKLOADS = {
+    "bulk": [(2, 8 * MB)],
+    "objects": [(10, 1 * MB)],
+    "small": [(200, 16 * 1024)],
+    "mixed": [(2, 4 * MB), (50, 32 * 1024)],
+    "response": [(1, 64 * 1024)],  # a latency sensitive object (its completion time)
+}
+# the impairments of every network (both directions) represented by the impairment.Impairment arguments
+NETWORKS = {
+    "loopback": {},
+    "lan": {"delay": 0.0005, "bandwidth": 125e6},  # 1 Gbit/s
+    "wan": {"delay": 0.02, "jitter": 0.002, "bandwidth": 12.5e6},  # 100 Mbit/s, 40 ms rtt
+    "lossy": {"delay": 0.01, "jitter": 0.001, "loss": 0.01, "reorder": 0.01, "bandwidth": 12.5e6},
+}
+FIELDS = ["label", "workload", "network", "fec", "paths", "run", "objects", "bytes", "completed", "seconds", "goodput_mbps",
+          "packets", "packets_per_second", "sender_cpu_ms_per_mb", "receiver_cpu_ms_per_mb", "retransmission_ratio",
+          "completion_p50", "completion_p90", "completion_p99", "completion_max", "proxy_lost", "proxy_queue_drops",
+          "proxy_reordered"]
+
+
+def generate_objects(workload: list, seed: int) -> dict[int, bytes]:
+    """
+    The function generates the objects of a workload (the same seed generates the same objects).
+    :param workload: the objects represented by [(number of objects, object size)]
+    :param seed: random seed
+    :return: objects represented by (stream_id:int : object:bytes)
+    """
+    rng = random.Random(seed)
+    objects = {}
+    for count, size in workload:
+        for _ in range(count):
+            objects[len(objects) + 1] = rng.randbytes(size)
+    return objects
+
+
+def percentile(values: list, fraction: float) -> float:
+    """
+    The function returns the value below which the fraction of the values lies (nearest rank).
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+
+def receiver(expected_objects: dict[int, bytes], ready, results):
+    """
+    The function receives the objects up to their streams' end and checks them.
+    :param expected_objects: the objects that should be received
+    :param ready: event to set once the socket is bound
+    :param results: queue to put the receiving cpu time and whether every object arrived intact in
+    """
+    receiver_socket = DQUIC.DQUIC()
+    receiver_socket.bind(SERVER_ADDRESS)
+    ready.set()
+    received = {}
+    while len(received) < len(expected_objects):
+        _, completed = receiver_socket.receive_streams(timeout=RECEIVE_TIMEOUT)
+        if not completed:
+            break
+        received.update(completed)
+    cpu_time = time.process_time()  # (the process was forked for the transfer)
+    intact = received.keys() == expected_objects.keys() \
+        and all(received[stream_id] == obj for stream_id, obj in expected_objects.items())
+    results.put((cpu_time, intact))
+    receiver_socket.receive_streams(timeout=LINGER_TIME)  # (the sender may still wait for the acks)
+    receiver_socket.close()
+
+
+def proxy(uplink: impairment.Impairment, downlink: impairment.Impairment, seed: int, ready, stop, results):
+    """
+    The function runs the impairment proxy in front of the receiver until it's stopped (in a process of its own, so
+    it doesn't take the cpu of the measured processes).
+    :param ready: queue to put the proxy's address in
+    :param stop: event telling the proxy to stop
+    :param results: queue to put the proxy's counters in
+    """
+    impairment_proxy = impairment.ImpairmentProxy(SERVER_ADDRESS, uplink, downlink, seed=seed)
+    impairment_proxy.start()
+    ready.put(impairment_proxy.address)
+    stop.wait()
+    impairment_proxy.stop()
+    results.put(impairment_proxy.stats())
+
+
+def parse_fec(value: str):
+    """
+    The function parses a --fec value: data packets per parity packet, or "adaptive".
+    """
+    return value if value == "adaptive" else int(value)
+
+
+def run_case(objects: dict[int, bytes], network: dict, seed: int, fec_group_size=0, paths: int = 1,
+             path_scheduler=DQUIC.PATH_SCHEDULER) -> dict:
+    """
+    The function sends the objects through the proxy impairing the network to a receiver process, and measures
+    the transfer.
+    :param objects: objects to send represented by (stream_id:int : object:bytes)
+    :param network: the impairment.Impairment arguments of both directions
+    :param seed: random seed of the proxy
+    :param fec_group_size: the sender's forward error correction (see DQUIC.send_to)
+    :param paths: the sender's paths, each through a proxy of its own impairing the network (see DQUIC.open_path)
+    :param path_scheduler: the sender's path scheduler
+    :return: the measures represented by (field: value) (see FIELDS)
+    """
+    receiver_ready = multiprocessing.Event()
+    receiver_results = multiprocessing.Queue()
+    receiver_process = multiprocessing.Process(target=receiver, args=(objects, receiver_ready, receiver_results))
+    receiver_process.start()
+    receiver_ready.wait()
+    proxy_ready, proxy_stop, proxy_results = multiprocessing.Queue(), multiprocessing.Event(), multiprocessing.Queue()
+    proxy_processes, proxy_addresses = [], []
+    for path in range(paths):
+        proxy_process = multiprocessing.Process(target=proxy, args=(impairment.Impairment(**network),
+                                                                    impairment.Impairment(**network), seed + path,
+                                                                    proxy_ready, proxy_stop, proxy_results))
+        proxy_process.start()
+        proxy_processes.append(proxy_process)
+        proxy_addresses.append(proxy_ready.get())
+    proxy_address = proxy_addresses[0]
+
+    sender_socket = DQUIC.DQUIC(fec_group_size=fec_group_size, path_scheduler=path_scheduler)
+    for path_address in proxy_addresses[1:]:
+        sender_socket.open_path(proxy_address, path_address)
+    start_time, start_cpu_time = time.perf_counter(), time.process_time()
+    bytes_sent = sender_socket.send_to(proxy_address, objects)
+    total_time, sender_cpu_time = time.perf_counter() - start_time, time.process_time() - start_cpu_time
+    connection = next(iter(sender_socket.connections))
+    packets_sent, data_resent = connection.sent_packet_number, connection.data_resent
+    completion_times = list(sender_socket.send_times.values())
+    sender_socket.close()
+
+    receiver_cpu_time, intact = receiver_results.get()
+    receiver_process.join()
+    proxy_stop.set()
+    proxy_stats = [proxy_results.get() for _ in proxy_processes]
+    for proxy_process in proxy_processes:
+        proxy_process.join()
+
+    total_size = sum(len(obj) for obj in objects.values())
+    megabytes = total_size / MB
+    return {
+        "objects": len(objects),
+        "bytes": total_size,
+        "completed": intact and bytes_sent == total_size,
+        "seconds": round(total_time, 6),
+        "goodput_mbps": round(bytes_sent * 8 / total_time / 1e6, 3),
+        "packets": packets_sent,
+        "packets_per_second": round(packets_sent / total_time),
+        "sender_cpu_ms_per_mb": round(sender_cpu_time * 1e3 / megabytes, 3),
+        "receiver_cpu_ms_per_mb": round(receiver_cpu_time * 1e3 / megabytes, 3),
+        "retransmission_ratio": round(data_resent / total_size, 6),
+        "completion_p50": round(percentile(completion_times, 0.5), 6),
+        "completion_p90": round(percentile(completion_times, 0.9), 6),
+        "completion_p99": round(percentile(completion_times, 0.99), 6),
+        "completion_max": round(max(completion_times, default=0.0), 6),
+        "proxy_lost": sum(stats["uplink"]["lost"] + stats["downlink"]["lost"] for stats in proxy_stats),
+        "proxy_queue_drops": sum(stats["uplink"]["queue_drops"] + stats["downlink"]["queue_drops"]
+                                 for stats in proxy_stats),
+        "proxy_reordered": sum(stats["uplink"]["reordered"] + stats["downlink"]["reordered"] for stats in proxy_stats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DQUIC benchmark suite over an impaired loopback network")
+    parser.add_argument("--workload", nargs="+", choices=list(WORKLOADS), default=list(WORKLOADS),
+                        help="object size and stream count mixes")
+    parser.add_argument("--network", nargs="+", choices=list(NETWORKS) + ["custom"], default=list(NETWORKS),
+                        help="network impairments (custom: by the options below)")
+    parser.add_argument("--delay", type=float, default=0.0, help="custom network: one way delay (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="custom network: random delay up to (seconds)")
+    parser.add_argument("--loss", type=float, default=0.0, help="custom network: fraction of the packets dropped")
+    parser.add_argument("--reorder", type=float, default=0.0, help="custom network: fraction of the packets reordered")
+    parser.add_argument("--bandwidth", type=float, default=None, help="custom network: rate (bytes/s)")
+    parser.add_argument("--mtu", type=int, default=None, help="custom network: largest UDP payload carried")
+    parser.add_argument("--fec", nargs="+", type=parse_fec, default=[0],
+                        help="the sender's forward error correction: data packets per parity packet (0 for none) "
+                             "or adaptive")
+    parser.add_argument("--paths", nargs="+", type=int, default=[1],
+                        help="the sender's paths, each through a proxy of its own (the network's bandwidth each)")
+    parser.add_argument("--path-scheduler", choices=list(multipath.PATH_SCHEDULERS), default=DQUIC.PATH_SCHEDULER,
+                        help="the sender's path scheduler (with several paths)")
+    parser.add_argument("--runs", type=int, default=3, help="transfers of every workload and network")
+    parser.add_argument("--seed", type=int, default=1, help="random seed of the objects and the impairments")
+    parser.add_argument("--label", default="", help="the version measured (a commit, for comparing the results)")
+    parser.add_argument("--json", help="file to write the results to as JSON")
+    parser.add_argument("--csv", help="file to write the results to as CSV")
+    arguments = parser.parse_args()
+    networks = dict(NETWORKS, custom={"delay": arguments.delay, "jitter": arguments.jitter, "loss": arguments.loss,
+                                      "reorder": arguments.reorder, "bandwidth": arguments.bandwidth,
+                                      "mtu": arguments.mtu})
+
+    results = []
+    for workload in arguments.workload:
+        objects = generate_objects(WORKLOADS[workload], arguments.seed)
+        for network, fec_group_size, paths in itertools.product(arguments.network, arguments.fec, arguments.paths):
+            for run in range(arguments.runs):
+                result = {"label": arguments.label, "workload": workload, "network": network, "fec": fec_group_size,
+                          "paths": paths, "run": run}
+                result.update(run_case(objects, networks[network], arguments.seed + run, fec_group_size, paths,
+                                       arguments.path_scheduler))
+                results.append(result)
+                print(f"{workload:>8} {network:>8} fec {fec_group_size} paths {paths} run {run}: "
+                      f"{result['seconds']:.3f} s, "
+                      f"{result['goodput_mbps']:.1f} Mbit/s, {result['packets_per_second']} packets/s, "
+                      f"cpu {result['sender_cpu_ms_per_mb']:.1f}/{result['receiver_cpu_ms_per_mb']:.1f} ms/MB, "
+                      f"resent {result['retransmission_ratio']:.2%}, completion p50 {result['completion_p50']:.3f} s"
+                      f" p99 {result['completion_p99']:.3f} s" + ("" if result["completed"] else " (INCOMPLETE)"))
+
+    if arguments.json:
+        with open(arguments.json, "w") as file:
+            json.dump({"label": arguments.label, "python": platform.python_version(), "seed": arguments.seed,
+                       "networks": {network: networks[network] for network in arguments.network},
+                       "results": results}, file, indent=2)
+    if arguments.csv:
+        with open(arguments.csv, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == '__main__':
+    main()
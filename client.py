@@ -39,37 +39,21 @@ def main():
     print(f"Sending request: {str_request}")
     client_socket.send_to(server_address, client_request)  # sending request
 
-    # building the dict to hold the response of serialized objects by stream id's:
+    # the streams holding the response of serialized objects:
     requests_list = str_request.split(" ")
-    ser_objs_dict = {}  # building dict with stream id's as keys
-    for string in requests_list:
-        tmp = string.split(":")  # splitting (stream id: object's number)
-        ser_objs_dict[int(tmp[0])] = b""  # room for incoming bytes
-    # building stream foe ack from server:
-    ser_objs_dict[77] = b""
+    stream_ids = [int(string.split(":")[0]) for string in requests_list]  # (stream id: object's number)
 
     # starting to receive response:
     print("Waiting for response...\n")
-    packets_received = 0
 
-    # debug print:
-    # print(f"number of objects: {len(ser_objs_dict)}, size: {len(ser_objs_dict[1])}")
-
-    # while loop to consume all sent data:
+    # receiving until every requested stream is received up to its end:
     print("Start receiving")
-    while ser_objs_dict[77] != "fin".encode():  # 77 represent the stream used to set delivery status
-        server_address, response = client_socket.receive_from(65536)
-        packets_received += 1
-        # consuming each serialized piece into the correct stream:
-        for stream_id in response:
-            ser_objs_dict[stream_id] += response[stream_id]
-            # print(f"In stream:{stream_id}, received by now:{len(ser_objs_dict[stream_id])} bytes")
+    server_address, ser_objs_dict = client_socket.receive_streams(stream_ids)
 
     print("Receiving completed!\n")
-    print(f"total packets received: {packets_received}")
     # printing states:
-    del ser_objs_dict[77]
-    for i, (stream_id, ser_obj) in enumerate(ser_objs_dict.items()):
+    for i, stream_id in enumerate(stream_ids):
+        ser_obj = ser_objs_dict[stream_id]
         tmp = requests_list[i].split(":")
         print(f"In stream:{stream_id}, object number:{tmp[1]} object size:{len(ser_obj)}")
 
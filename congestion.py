@@ -0,0 +1,348 @@
+import math
+
+from recovery import RttEstimator
+
+MAX_DATAGRAM_SIZE = 1200  # default size of a full packet, used as the congestion window unit
+INITIAL_WINDOW_PACKETS = 10  # initial congestion window (in full packets)
+MINIMUM_WINDOW_PACKETS = 2  # minimum congestion window (in full packets)
+LOSS_REDUCTION_FACTOR = 0.5  # NewReno window reduction on a congestion event
+CUBIC_C = 0.4  # CUBIC scaling constant
+CUBIC_BETA = 0.7  # CUBIC window reduction on a congestion event
+PACING_GAIN = 1.25  # loss based controllers pace slightly faster than cwnd/rtt to keep the window full
+PACING_BURST_PACKETS = 4  # packets the pacer allows to send back to back after being idle
+
+
+class CongestionController:
+    """
+    A base class for congestion controllers.
+    The controller counts the bytes in flight and decides how many of them the path can take (cwnd) and how fast
+    they should be paced (pacing rate). Implementations override the reaction to acks and congestion events.
+    """
+    name = "base"
+
+    def __init__(self, max_datagram_size: int = MAX_DATAGRAM_SIZE, rtt: RttEstimator = None):
+        self.max_datagram_size = max_datagram_size
+        self.rtt = rtt if rtt is not None else RttEstimator()  # the connection's rtt estimation
+        self.cwnd = INITIAL_WINDOW_PACKETS * max_datagram_size  # congestion window (in bytes)
+        self.ssthresh = math.inf  # slow start threshold (in bytes)
+        self.bytes_in_flight = 0  # bytes sent and not acknowledged or lost yet
+        self.recovery_start_time = -math.inf  # packets sent before this time don't cause another window reduction
+        self.window_limited = False  # was the last packet sent when the window was full (else the window doesn't grow)
+
+    @property
+    def minimum_window(self) -> int:
+        return MINIMUM_WINDOW_PACKETS * self.max_datagram_size
+
+    def can_send(self) -> bool:
+        """
+        The function checks if another packet is allowed into the network.
+        """
+        return self.bytes_in_flight < self.cwnd
+
+    @property
+    def pacing_rate(self):
+        """
+        The pacing rate in bytes per second, None means packets are not paced (no rtt sample yet).
+        """
+        if not self.rtt.has_sample:
+            return None
+        return PACING_GAIN * self.cwnd / max(self.rtt.smoothed_rtt, 1e-6)
+
+    def on_packet_sent(self, packet_number: int, sent_bytes: int, now: float):
+        self.bytes_in_flight += sent_bytes
+        self.window_limited = self.bytes_in_flight >= self.cwnd
+
+    def on_packet_acked(self, packet_number: int, acked_bytes: int, sent_time: float, now: float):
+        """
+        The function handles an acknowledged packet (the rtt estimation is already updated by its ack).
+        :param packet_number: number of the acknowledged packet
+        :param acked_bytes: size of the acknowledged packet
+        :param sent_time: time the packet was sent
+        :param now: current time
+        """
+        self.bytes_in_flight = max(0, self.bytes_in_flight - acked_bytes)
+        # the window doesn't grow during recovery or when the application doesn't fill it:
+        if sent_time > self.recovery_start_time and self.window_limited:
+            self.increase_window(acked_bytes, now)
+
+    def on_packet_lost(self, packet_number: int, lost_bytes: int, sent_time: float, now: float):
+        """
+        The function handles a packet declared lost (it is not in flight anymore).
+        """
+        self.bytes_in_flight = max(0, self.bytes_in_flight - lost_bytes)
+        self.on_congestion_event(sent_time, now)
+
+    def on_packet_discarded(self, packet_number: int, sent_bytes: int):
+        """
+        The function removes a packet that is not waited for anymore from the bytes in flight (no congestion sign).
+        """
+        self.bytes_in_flight = max(0, self.bytes_in_flight - sent_bytes)
+
+    def on_congestion_event(self, sent_time: float, now: float):
+        """
+        The function handles a sign of congestion (loss or data the receiver had to drop) of a packet sent at
+        sent_time. One reduction is made per recovery period.
+        """
+        if sent_time <= self.recovery_start_time:  # already reacted to this congestion
+            return
+        self.recovery_start_time = now
+        self.reduce_window(now)
+
+    def increase_window(self, acked_bytes: int, now: float):
+        raise NotImplementedError
+
+    def reduce_window(self, now: float):
+        raise NotImplementedError
+
+    def state(self) -> dict:
+        """
+        The function returns the observable state of the controller.
+        """
+        return {"name": self.name, "cwnd": self.cwnd, "ssthresh": self.ssthresh,
+                "bytes_in_flight": self.bytes_in_flight, "pacing_rate": self.pacing_rate,
+                "smoothed_rtt": self.rtt.smoothed_rtt if self.rtt.has_sample else None}
+
+
+class NewReno(CongestionController):
+    """
+    A loss based controller: slow start, additive increase of one packet per window, halving on congestion.
+    """
+    name = "newreno"
+
+    def increase_window(self, acked_bytes: int, now: float):
+        if self.cwnd < self.ssthresh:  # slow start
+            self.cwnd += acked_bytes
+        else:  # congestion avoidance
+            self.cwnd += self.max_datagram_size * acked_bytes / self.cwnd
+
+    def reduce_window(self, now: float):
+        self.ssthresh = max(self.cwnd * LOSS_REDUCTION_FACTOR, self.minimum_window)
+        self.cwnd = self.ssthresh
+
+
+class Cubic(CongestionController):
+    """
+    A loss based controller growing the window by a cubic function of the time since the last congestion event,
+    so it returns quickly to the window where the loss happened (RFC 9438).
+    """
+    name = "cubic"
+
+    def __init__(self, max_datagram_size: int = MAX_DATAGRAM_SIZE, rtt: RttEstimator = None):
+        super().__init__(max_datagram_size, rtt)
+        self.w_max = 0  # window before the last reduction (in bytes)
+        self.w_est = 0  # window a reno controller would have (in bytes)
+        self.k = 0.0  # time to get back to w_max (in seconds)
+        self.epoch_start = None  # start of the current congestion avoidance epoch
+
+    def increase_window(self, acked_bytes: int, now: float):
+        if self.cwnd < self.ssthresh:  # slow start
+            self.cwnd += acked_bytes
+            return
+        if self.epoch_start is None:  # first ack of congestion avoidance
+            self.epoch_start = now
+            self.w_est = self.cwnd
+            if self.w_max < self.cwnd:
+                self.w_max = self.cwnd
+            self.k = ((self.w_max - self.cwnd) / self.max_datagram_size / CUBIC_C) ** (1 / 3)
+        # the cubic window one rtt from now (in bytes):
+        t = now - self.epoch_start + self.rtt.smoothed_rtt
+        target = (CUBIC_C * (t - self.k) ** 3) * self.max_datagram_size + self.w_max
+        target = min(max(target, self.cwnd), 1.5 * self.cwnd)
+        # the reno friendly window:
+        alpha = 3 * (1 - CUBIC_BETA) / (1 + CUBIC_BETA)
+        self.w_est += alpha * self.max_datagram_size * acked_bytes / self.cwnd
+        if self.w_est > target:
+            self.cwnd = self.w_est
+        else:
+            self.cwnd += (target - self.cwnd) * acked_bytes / self.cwnd
+
+    def reduce_window(self, now: float):
+        if self.cwnd < self.w_max:  # fast convergence, releasing bandwidth for new flows
+            self.w_max = self.cwnd * (1 + CUBIC_BETA) / 2
+        else:
+            self.w_max = self.cwnd
+        self.epoch_start = None
+        self.cwnd = max(self.cwnd * CUBIC_BETA, self.minimum_window)
+        self.ssthresh = self.cwnd
+
+
+class BBR(CongestionController):
+    """
+    A model based controller (BBR-like): it estimates the bottleneck bandwidth (max delivery rate) and the minimum
+    rtt, paces at the estimated bandwidth and keeps about two bandwidth-delay products in flight. Losses don't
+    reduce the window.
+    """
+    name = "bbr"
+    STARTUP_GAIN = 2.885  # 2/ln(2), doubles the delivery rate every round
+    PROBE_BW_GAINS = (1.25, 0.75, 1, 1, 1, 1, 1, 1)  # pacing gain cycle once the pipe is full
+    CWND_GAIN = 2
+    BANDWIDTH_WINDOW_ROUNDS = 10  # rounds a bandwidth sample stays in the max filter
+    MIN_RTT_WINDOW = 10  # seconds a min rtt sample stays valid
+    FULL_BANDWIDTH_GROWTH = 1.25  # startup ends when the bandwidth didn't grow by 25% ...
+    FULL_BANDWIDTH_ROUNDS = 3  # ... for 3 rounds
+    MINIMUM_WINDOW_PACKETS = 4  # keeps acks flowing when the model is small
+
+    def __init__(self, max_datagram_size: int = MAX_DATAGRAM_SIZE, rtt: RttEstimator = None):
+        super().__init__(max_datagram_size, rtt)
+        self.mode = "startup"
+        self.pacing_gain = self.STARTUP_GAIN
+        self.delivered = 0  # total bytes acknowledged
+        self.delivered_time = None  # time of the last acknowledgment
+        self.sent_states = {}  # delivery state at sending time by (packet_number: (delivered, delivered_time))
+        self.round_count = 0
+        self.next_round_delivered = 0  # delivered bytes that will end the current round
+        self.bandwidth_samples = []  # represented by [(round, delivery_rate)]
+        self.btl_bw = 0.0  # bottleneck bandwidth estimation (in bytes per second)
+        self.min_rtt = math.inf  # minimum rtt in the last MIN_RTT_WINDOW seconds
+        self.min_rtt_time = 0.0  # time the min rtt was measured
+        self.full_bandwidth = 0.0
+        self.full_bandwidth_rounds = 0
+        self.cycle_index = 0
+        self.cycle_start = 0.0
+
+    @property
+    def minimum_window(self) -> int:
+        return self.MINIMUM_WINDOW_PACKETS * self.max_datagram_size
+
+    @property
+    def bdp(self) -> float:
+        if self.btl_bw == 0 or self.min_rtt == math.inf:
+            return INITIAL_WINDOW_PACKETS * self.max_datagram_size
+        return self.btl_bw * self.min_rtt
+
+    @property
+    def pacing_rate(self):
+        if self.btl_bw == 0:
+            return None
+        return self.pacing_gain * self.btl_bw
+
+    def on_packet_sent(self, packet_number: int, sent_bytes: int, now: float):
+        super().on_packet_sent(packet_number, sent_bytes, now)
+        if self.delivered_time is None:
+            self.delivered_time = now
+        self.sent_states[packet_number] = (self.delivered, self.delivered_time)
+
+    def on_packet_acked(self, packet_number: int, acked_bytes: int, sent_time: float, now: float):
+        rtt_sample = self.rtt.latest_rtt
+        if rtt_sample <= self.min_rtt or now - self.min_rtt_time > self.MIN_RTT_WINDOW:
+            self.min_rtt = rtt_sample
+            self.min_rtt_time = now
+        self.delivered += acked_bytes
+        self.delivered_time = now
+        delivered_at_send, delivered_time_at_send = self.sent_states.pop(packet_number, (None, None))
+        if delivered_at_send is not None:
+            # round counting, a round ends when a packet sent after the previous round end is acknowledged:
+            if delivered_at_send >= self.next_round_delivered:
+                self.next_round_delivered = self.delivered
+                self.round_count += 1
+                self.check_full_bandwidth()
+            # delivery rate sample:
+            interval = max(now - delivered_time_at_send, rtt_sample, 1e-6)
+            self.update_bandwidth((self.delivered - delivered_at_send) / interval)
+        super().on_packet_acked(packet_number, acked_bytes, sent_time, now)
+        self.update_mode(now)
+
+    def on_packet_lost(self, packet_number: int, lost_bytes: int, sent_time: float, now: float):
+        self.sent_states.pop(packet_number, None)
+        super().on_packet_lost(packet_number, lost_bytes, sent_time, now)
+
+    def on_packet_discarded(self, packet_number: int, sent_bytes: int):
+        self.sent_states.pop(packet_number, None)
+        super().on_packet_discarded(packet_number, sent_bytes)
+
+    def update_bandwidth(self, delivery_rate: float):
+        self.bandwidth_samples.append((self.round_count, delivery_rate))
+        self.bandwidth_samples = [(round_count, rate) for round_count, rate in self.bandwidth_samples
+                                  if self.round_count - round_count < self.BANDWIDTH_WINDOW_ROUNDS]
+        self.btl_bw = max(rate for _, rate in self.bandwidth_samples)
+
+    def check_full_bandwidth(self):
+        if self.mode != "startup":
+            return
+        if self.btl_bw >= self.full_bandwidth * self.FULL_BANDWIDTH_GROWTH:
+            self.full_bandwidth = self.btl_bw
+            self.full_bandwidth_rounds = 0
+            return
+        self.full_bandwidth_rounds += 1
+        if self.full_bandwidth_rounds >= self.FULL_BANDWIDTH_ROUNDS:  # the pipe is full, draining the queue
+            self.mode = "drain"
+            self.pacing_gain = 1 / self.STARTUP_GAIN
+
+    def update_mode(self, now: float):
+        """
+        The function moves the controller between its modes, on every ack (also when the sender is not limited by
+        the window, otherwise the drain could never end).
+        """
+        if self.mode == "drain" and self.bytes_in_flight <= self.bdp:  # the queue is drained, probing bandwidth
+            self.mode = "probe_bw"
+            self.cycle_index = 0
+            self.cycle_start = now
+        if self.mode == "probe_bw" and now - self.cycle_start > self.min_rtt:  # next phase of the gain cycle
+            self.cycle_index = (self.cycle_index + 1) % len(self.PROBE_BW_GAINS)
+            self.cycle_start = now
+        if self.mode == "probe_bw":
+            self.pacing_gain = self.PROBE_BW_GAINS[self.cycle_index]
+
+    def increase_window(self, acked_bytes: int, now: float):
+        target = max(self.CWND_GAIN * self.bdp, self.minimum_window)
+        if self.mode == "startup":
+            self.cwnd += acked_bytes
+        else:
+            self.cwnd = min(self.cwnd + acked_bytes, target)
+
+    def on_congestion_event(self, sent_time: float, now: float):
+        pass  # the model, not the losses, sets the window
+
+    def state(self) -> dict:
+        state = super().state()
+        state.update({"mode": self.mode, "btl_bw": self.btl_bw, "min_rtt": self.min_rtt})
+        return state
+
+
+class Pacer:
+    """
+    A leaky bucket pacer, spreading the packets of a window over the rtt instead of sending them in a burst.
+    """
+
+    def __init__(self, burst_packets: int = PACING_BURST_PACKETS):
+        self.burst_packets = burst_packets
+        self.next_send_time = 0.0  # the earliest time the next packet may be sent
+
+    def delay(self, now: float) -> float:
+        """
+        The function returns how long to wait before sending the next packet.
+        """
+        return max(0.0, self.next_send_time - now)
+
+    def on_packet_sent(self, sent_bytes: int, pacing_rate, now: float):
+        """
+        The function charges the bucket for a sent packet.
+        :param sent_bytes: size of the packet
+        :param pacing_rate: bytes per second, None means no pacing
+        :param now: current time
+        """
+        if pacing_rate is None:
+            self.next_send_time = now
+            return
+        interval = sent_bytes / pacing_rate
+        # an idle sender may send up to burst_packets back to back:
+        self.next_send_time = max(self.next_send_time, now - self.burst_packets * interval) + interval
+
+
+CONGESTION_CONTROLLERS = {controller.name: controller for controller in (NewReno, Cubic, BBR)}
+
+
+def create_congestion_controller(congestion_control, max_datagram_size: int = MAX_DATAGRAM_SIZE,
+                                 rtt: RttEstimator = None) -> CongestionController:
+    """
+    The function creates a congestion controller.
+    :param congestion_control: controller name (newreno, cubic, bbr) or a CongestionController subclass
+    :param max_datagram_size: size of a full packet
+    :param rtt: the connection's rtt estimation (a new one if None)
+    :return: the controller object
+    """
+    if isinstance(congestion_control, str):
+        if congestion_control not in CONGESTION_CONTROLLERS:
+            raise ValueError(f"unknown congestion control: {congestion_control}")
+        congestion_control = CONGESTION_CONTROLLERS[congestion_control]
+    return congestion_control(max_datagram_size, rtt)
@@ -0,0 +1,125 @@
+import collections
+import errno
+import socket
+import struct
+
+SOL_UDP = getattr(socket, "SOL_UDP", 17)
+UDP_SEGMENT = getattr(socket, "UDP_SEGMENT", 103)  # linux: the datagram size of a train sent in one call (GSO)
+UDP_GRO = getattr(socket, "UDP_GRO", 104)  # linux: receiving a train of datagrams coalesced in one call (GRO)
+MAX_SEGMENTS = 64  # maximum datagrams in one GSO send (the kernel's limit)
+MAX_BATCH_SIZE = 65000  # maximum bytes in one GSO send (it's sent as one UDP datagram up to the device)
+MAX_IOV = 1024  # maximum buffers in one sendmsg call
+MAX_RECV_SIZE = 65536  # size of the receive buffer (a coalesced train fits in it)
+GSO_ERRORS = (errno.EIO, errno.EINVAL, errno.ENOPROTOOPT, errno.EOPNOTSUPP)  # GSO not supported on the route
+
+
+def enable_option(sock, option: int, value: int) -> bool:
+    """
+    The function sets a UDP socket option, if the OS supports it.
+    :return: True if the option was set
+    """
+    if not hasattr(sock, "sendmsg") or not hasattr(sock, "recvmsg_into"):  # no ancillary data (windows)
+        return False
+    try:
+        sock.setsockopt(SOL_UDP, option, value)
+    except OSError:
+        return False
+    return True
+
+
+class DatagramBatch:
+    """
+    A class collecting the packets to send to one address and sending them in one sendmsg call with UDP GSO: the
+    kernel splits the train into datagrams of the first packet's size, so only the last packet may be shorter.
+    Without GSO support nothing is collected and every packet is sent by itself.
+    """
+
+    def __init__(self, sock, enabled: bool = True):
+        self.gso = enabled and enable_option(sock, UDP_SEGMENT, 0)  # 0: only the trains are split
+        self.packets = []  # the segments of every packet collected
+        self.address = None  # the destination of the collected packets
+        self.segment_size = 0  # the size of the first packet (every datagram of the train)
+        self.size = 0  # bytes collected
+        self.buffers = 0  # segments collected
+        self.closed = False  # a shorter packet was collected, it must be the last
+
+    def add(self, sock, segments: list, size: int, address):
+        """
+        The function collects a packet, sending the packets collected before if it can't join their train.
+        :param sock: the socket to send with
+        :param segments: the packet's segments in order
+        :param size: the packet's size
+        :param address: destination address
+        """
+        if self.packets and (address != self.address or size > self.segment_size or self.closed
+                             or len(self.packets) == MAX_SEGMENTS or self.size + size > MAX_BATCH_SIZE
+                             or self.buffers + len(segments) > MAX_IOV):
+            self.flush(sock)
+        if not self.packets:
+            self.address = address
+            self.segment_size = size
+        self.packets.append(segments)
+        self.size += size
+        self.buffers += len(segments)
+        if size < self.segment_size:
+            self.closed = True
+
+    def flush(self, sock):
+        """
+        The function sends the packets collected, as one train.
+        :param sock: the socket to send with
+        """
+        if not self.packets:
+            return
+        packets, address = self.packets, self.address
+        self.packets, self.size, self.buffers, self.closed = [], 0, 0, False
+        if len(packets) == 1:
+            sock.sendmsg(packets[0], (), 0, address)
+            return
+        try:
+            sock.sendmsg([segment for segments in packets for segment in segments],
+                         [(SOL_UDP, UDP_SEGMENT, struct.pack("=H", self.segment_size))], 0, address)
+        except OSError as error:
+            if error.errno not in GSO_ERRORS:
+                raise
+            self.gso = False  # sending one by one from now on
+            for segments in packets:
+                sock.sendmsg(segments, (), 0, address)
+
+
+class DatagramReceiver:
+    """
+    A class receiving datagrams one by one into a reusable buffer (nothing is allocated per datagram but its view):
+    with UDP GRO the kernel returns a train of datagrams coalesced in one buffer, which is split back by the segment
+    size reported in the ancillary data.
+    """
+
+    def __init__(self, sock, enabled: bool = True):
+        self.gro = enabled and enable_option(sock, UDP_GRO, 1)
+        self.pending = collections.deque()  # datagrams of the last train not returned yet, by (data, address)
+        self.buffer = bytearray(MAX_RECV_SIZE)  # the datagrams are received into it (the last one or train)
+        self.view = memoryview(self.buffer)
+
+    def recvfrom(self, sock):
+        """
+        The function returns the next datagram (blocking by the socket's timeout if none was received before).
+        The datagram is a view of the receive buffer: it's valid until the next call (a datagram kept longer must
+        be copied).
+        :param sock: the socket to receive with
+        :return: the datagram (memoryview) and its source address
+        """
+        if self.pending:
+            return self.pending.popleft()
+        if not self.gro:
+            size, address = sock.recvfrom_into(self.buffer)
+            return self.view[:size], address
+        size, ancillary_data, _, address = sock.recvmsg_into([self.buffer], socket.CMSG_SPACE(4))
+        segment_size = size
+        for level, option, option_data in ancillary_data:
+            if level == SOL_UDP and option == UDP_GRO:
+                segment_size = struct.unpack("=i", option_data[:4])[0]
+        if segment_size >= size:
+            return self.view[:size], address
+        for start in range(segment_size, size, segment_size):  # (returned before the buffer is used again)
+            self.pending.append((self.view[start:min(start + segment_size, size)], address))
+        return self.view[:segment_size], address
@@ -0,0 +1,105 @@
+import argparse
+import time
+
+import DQUIC
+
+SENDER_ADDRESS = ('127.0.0.1', 9994)  # (no socket is used, the packets are passed between the connections)
+RECEIVER_ADDRESS = ('127.0.0.1', 9995)
+
+
+def transfer(version: int, objects: dict[int, bytes], packet_size: int):
+    """
+    The function transfers the objects between two connections speaking the version (without sockets or loss),
+    recording every packet sent (the receiver acks by its default policy, see DQUIC.Connection.next_ack).
+    :param version: the wire encoding (DQUIC.FIXED_VERSION or DQUIC.COMPACT_VERSION)
+    :param objects: objects to send represented by (stream_id:int : object:bytes)
+    :param packet_size: the packets' size (the path MTU)
+    :return: the packets represented by [(packet_type, packet_number, frames)] and the bytes sent of every packet
+    type by (packet_type: bytes)
+    """
+    sender = DQUIC.Connection(RECEIVER_ADDRESS, 1, max_datagram_size=packet_size, versions=(version,))
+    receiver = DQUIC.Connection(SENDER_ADDRESS, 2, max_datagram_size=packet_size, versions=(version,))
+    sender.peer_conn_id, receiver.peer_conn_id = 2, 1
+    for stream_id, obj in objects.items():
+        sender.queue_object(stream_id, obj, True)
+    packets = []
+    wire_bytes = {DQUIC.SHORT: 0, DQUIC.ACK: 0}
+    now = 0.0
+    while sender.send_streams:
+        packet = sender.next_packet(now, 10 ** 6)
+        if packet is None:  # the congestion window waits for the delayed ack
+            now = receiver.ack_deadline
+        else:
+            packet_number, frames = packet
+            data = bytes(sender.build_packet(DQUIC.SHORT, packet_number, frames))
+            receiver.on_data_packet(data, now)
+            packets.append((DQUIC.SHORT, packet_number, frames))
+            wire_bytes[DQUIC.SHORT] += len(data)
+        ack = receiver.next_ack(now)
+        if ack is None:
+            continue
+        ack_data = bytes(receiver.build_packet(DQUIC.ACK, *ack))
+        # the first packets tell the peers' ids, the headers omit them afterwards (like ConnectionTable.route):
+        sender.peer_uses_conn_id = receiver.peer_uses_conn_id = True
+        now += 0.0001
+        sender.on_ack_packet(ack[0], ack_data, now)
+        packets.append((DQUIC.ACK, *ack))
+        wire_bytes[DQUIC.ACK] += len(ack_data)
+    return packets, wire_bytes
+
+
+def measure(version: int, packets: list, runs: int):
+    """
+    The function measures the encoding (Connection.build_packet) and decoding (unpack_frames, like the receive path)
+    of the packets.
+    :return: the best cpu seconds of encoding and of decoding all the packets
+    """
+    connection = DQUIC.Connection(RECEIVER_ADDRESS, 1, versions=(version,))
+    connection.peer_conn_id = 2
+    encoded = [bytes(connection.build_packet(*packet)) for packet in packets]
+    encode_time = decode_time = None
+    for _ in range(runs):
+        start_time = time.process_time()
+        for packet in packets:
+            connection.build_packet(*packet)
+        run_time = time.process_time() - start_time
+        encode_time = run_time if encode_time is None else min(encode_time, run_time)
+        start_time = time.process_time()
+        for data in encoded:
+            for _ in DQUIC.unpack_frames(data):
+                pass
+        run_time = time.process_time() - start_time
+        decode_time = run_time if decode_time is None else min(decode_time, run_time)
+    return encode_time, decode_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DQUIC wire encoding benchmark (fixed and compact versions)")
+    parser.add_argument("--streams", type=int, default=7, help="objects sent at once")
+    parser.add_argument("--object-size", type=int, default=1024 * 1024, help="bytes of every object")
+    parser.add_argument("--packet-size", type=int, default=1200, help="packet size (path MTU)")
+    parser.add_argument("--runs", type=int, default=5, help="runs of every measure (the best is reported)")
+    arguments = parser.parse_args()
+
+    objects = {stream_id: bytes(arguments.object_size) for stream_id in range(1, arguments.streams + 1)}
+    payload_mb = arguments.streams * arguments.object_size / 1e6
+    print(f"Transferring {arguments.streams} objects of {arguments.object_size} bytes in packets of "
+          f"{arguments.packet_size} bytes")
+    overheads = {}
+    for name, version in (("fixed", DQUIC.FIXED_VERSION), ("compact", DQUIC.COMPACT_VERSION)):
+        packets, wire_bytes = transfer(version, objects, arguments.packet_size)
+        encode_time, decode_time = measure(version, packets, arguments.runs)
+        data_overhead = wire_bytes[DQUIC.SHORT] - payload_mb * 1e6
+        overheads[name] = (data_overhead + wire_bytes[DQUIC.ACK]) / payload_mb
+        print(f"\n{name} (version {version}):")
+        data_packets = sum(packet[0] == DQUIC.SHORT for packet in packets)
+        print(f"  data packets: {data_packets}, headers and frames {data_overhead / payload_mb:.0f} bytes/MB, "
+              f"acks: {len(packets) - data_packets}, {wire_bytes[DQUIC.ACK] / payload_mb:.0f} bytes/MB")
+        print(f"  encode: {len(packets) / encode_time / 1e3:.1f} k packets/s, "
+              f"decode: {len(packets) / decode_time / 1e3:.1f} k packets/s")
+    print(f"\nbytes saved per MB transferred: {overheads['fixed'] - overheads['compact']:.0f} "
+          f"({1 - overheads['compact'] / overheads['fixed']:.0%} of the overhead)")
+
+
+if __name__ == '__main__':
+    main()
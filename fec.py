@@ -0,0 +1,143 @@
+MIN_GROUP_SIZE = 4  # the fewest data packets protected by a parity packet (adaptive mode)
+MAX_GROUP_SIZE = 32  # the most data packets protected by a parity packet
+MIN_LOSS_RATE = 0.002  # below this loss rate the adaptive mode sends no parity packets
+LOSS_RATE_GAIN = 1 / 64  # the weight of every packet's fate in the loss rate estimate (adaptive mode)
+HISTORY = 4 * MAX_GROUP_SIZE  # the packet numbers back the receiver keeps the packets and groups of
+
+
+class FecEncoder:
+    """
+    A class building the parity of the sender's data packets: every group of consecutive data packets is followed
+    by a parity packet carrying the XOR of their payloads (the bytes after the header, padded to the longest) and
+    of their lengths, so the receiver rebuilds one packet lost from the group without waiting for its
+    retransmission. The group size is fixed, or adapted to the loss rate observed (about one loss every two groups).
+    """
+
+    def __init__(self, group_size=0):
+        """
+        :param group_size: data packets per parity packet (0 disables the parity), or "adaptive"
+        """
+        self.adaptive = group_size == "adaptive"
+        if not self.adaptive and not (group_size == 0 or 2 <= group_size <= MAX_GROUP_SIZE):
+            raise ValueError(f"FEC group size must be 0, \"adaptive\" or in range(2, {MAX_GROUP_SIZE + 1}), "
+                             f"got {group_size}")
+        self.group_size = 0 if self.adaptive else group_size  # (0: the data packets are not protected)
+        self.loss_rate = 0.0  # the fraction of the packets lost, smoothed (adaptive mode)
+        self.first = 0  # the packet number of the group's first packet
+        self.count = 0  # the packets in the group so far
+        self.parity = 0  # the XOR of the group's payloads (as little endian integers)
+        self.length_xor = 0  # the XOR of the group's payload lengths
+        self.max_length = 0  # the longest payload of the group
+        self.flush = False  # the group ends now (no more data to send), its parity is sent at once
+        self.parity_packets = 0  # parity packets sent
+
+    def on_packet_acked(self):
+        if self.adaptive:
+            self.loss_rate -= self.loss_rate * LOSS_RATE_GAIN
+            self.__adapt()
+
+    def on_packet_lost(self):
+        if self.adaptive:
+            self.loss_rate += (1.0 - self.loss_rate) * LOSS_RATE_GAIN
+            self.__adapt()
+
+    def __adapt(self):
+        if self.loss_rate < MIN_LOSS_RATE:
+            self.group_size = 0
+        else:
+            self.group_size = max(MIN_GROUP_SIZE, min(MAX_GROUP_SIZE, round(0.5 / self.loss_rate)))
+
+    def add(self, packet_number: int, payload: bytes):
+        """
+        The function adds a data packet to the group (the group must be closed by take_parity before a packet that
+        doesn't follow it, see parity_due).
+        :param payload: the packet's bytes after its header
+        """
+        if self.count == 0:
+            self.first = packet_number
+        self.count += 1
+        self.parity ^= int.from_bytes(payload, "little")
+        self.length_xor ^= len(payload)
+        self.max_length = max(self.max_length, len(payload))
+
+    def parity_due(self, next_packet_number: int) -> bool:
+        """
+        The function checks if the group's parity must be sent before the next packet: the group is full, ends
+        (flush), or the next packet doesn't follow it (another packet took the packet number).
+        """
+        return self.count > 0 and (self.count >= self.group_size or self.flush
+                                   or next_packet_number != self.first + self.count)
+
+    def take_parity(self):
+        """
+        The function closes the group.
+        :return: the group's first packet number, its packet count, the XOR of the payload lengths and the parity
+        """
+        parity = (self.first, self.count, self.length_xor, self.parity.to_bytes(self.max_length, "little"))
+        self.count = self.parity = self.length_xor = self.max_length = 0
+        self.flush = False
+        self.parity_packets += 1
+        return parity
+
+
+class FecDecoder:
+    """
+    A class rebuilding the receiver's lost data packets: the payloads of the protected packets are kept (HISTORY
+    packet numbers back) until the parity of their group arrives, a group missing one packet rebuilds it.
+    """
+
+    def __init__(self):
+        self.packets = {}  # the protected payloads received by (packet_number: payload)
+        self.groups = {}  # the parities waiting for packets by (first packet number: (count, length_xor, parity))
+        self.recovered = 0  # packets rebuilt
+
+    def on_source(self, packet_number: int, payload: bytes) -> list:
+        """
+        The function keeps a protected packet's payload (a packet arriving after its group's parity may complete
+        the group).
+        :return: the packets rebuilt represented by [(packet_number, payload)]
+        """
+        self.packets[packet_number] = payload
+        if len(self.packets) > 2 * HISTORY:
+            self.__expire(packet_number)
+        for first, (count, _, _) in self.groups.items():
+            if first <= packet_number < first + count:
+                return self.__recover(first)
+        return []
+
+    def on_parity(self, first: int, count: int, length_xor: int, parity: bytes) -> list:
+        """
+        The function handles a group's parity.
+        :return: the packets rebuilt represented by [(packet_number, payload)]
+        """
+        self.groups[first] = (count, length_xor, bytes(parity))
+        return self.__recover(first)
+
+    def __recover(self, first: int) -> list:
+        count, length_xor, parity = self.groups[first]
+        missing = [packet_number for packet_number in range(first, first + count)
+                   if packet_number not in self.packets]
+        if len(missing) > 1:  # (kept, reordered packets may still arrive)
+            return []
+        del self.groups[first]
+        if not missing:
+            return []
+        value = int.from_bytes(parity, "little")
+        for packet_number in range(first, first + count):
+            if packet_number != missing[0]:
+                payload = self.packets[packet_number]
+                value ^= int.from_bytes(payload, "little")
+                length_xor ^= len(payload)
+        if length_xor > len(parity):  # (a corrupted parity)
+            return []
+        self.recovered += 1
+        return [(missing[0], value.to_bytes(len(parity), "little")[:length_xor])]
+
+    def __expire(self, largest: int):
+        """
+        The function forgets the packets and groups too old to be completed.
+        """
+        oldest = largest - HISTORY
+        self.packets = {packet_number: payload for packet_number, payload in self.packets.items()
+                        if packet_number >= oldest}
+        self.groups = {first: group for first, group in self.groups.items() if first + group[0] > oldest}
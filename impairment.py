@@ -0,0 +1,184 @@
+import heapq
+import itertools
+import random
+import select
+import socket
+import threading
+import time
+
+QUEUE_BYTES = 1024 * 1024  # the bytes a bandwidth limited link holds before dropping the next packets (drop tail)
+REORDER_DELAY = 0.002  # the least time a reordered packet is held back (in seconds)
+POLL_INTERVAL = 0.05  # the longest wait for packets, the proxy checks whether it was stopped (in seconds)
+MAX_DATAGRAM_SIZE = 65535
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+class Impairment:
+    """
+    A class describing the impairments of one direction of a link (like netem): a fixed delay, a random jitter,
+    random loss and reordering, a bandwidth limit with a drop tail queue, and an MTU.
+    """
+
+    def __init__(self, delay: float = 0.0, jitter: float = 0.0, loss: float = 0.0, reorder: float = 0.0,
+                 bandwidth: float = None, queue_bytes: int = QUEUE_BYTES, mtu: int = None):
+        self.delay = delay  # one way delay (in seconds)
+        self.jitter = jitter  # a random delay up to jitter is added to every packet (packets may pass each other)
+        self.loss = loss  # fraction of the packets dropped
+        self.reorder = reorder  # fraction of the packets held back behind the next ones
+        self.bandwidth = bandwidth  # the link's rate (in bytes/s), None for unlimited
+        self.queue_bytes = queue_bytes  # the bytes queued for the link at most (with a bandwidth limit)
+        self.mtu = mtu  # the largest UDP payload the link carries (bigger packets are dropped), None for any
+
+
+class Link:
+    """
+    A class representing one direction of an impaired link: it tells when every packet is delivered (or that it's
+    dropped), and counts what it did to the packets.
+    """
+
+    def __init__(self, impairment: Impairment, rng: random.Random):
+        self.impairment = impairment
+        self.rng = rng
+        self.free_time = 0.0  # the time the link finishes sending the packets queued (with a bandwidth limit)
+        self.packets = 0  # packets received from the sender
+        self.bytes = 0
+        self.lost = 0  # packets dropped by the random loss
+        self.queue_drops = 0  # packets dropped by the full queue
+        self.reordered = 0  # packets held back behind the next ones
+        self.too_big = 0  # packets dropped by the MTU (path MTU probes)
+
+    def deliver_time(self, size: int, now: float):
+        """
+        The function passes a packet through the link.
+        :param size: the packet's size
+        :param now: the time the packet entered the link
+        :return: the time the packet is delivered, None if it's dropped
+        """
+        impairment = self.impairment
+        self.packets += 1
+        self.bytes += size
+        if impairment.mtu is not None and size > impairment.mtu:
+            self.too_big += 1
+            return None
+        if impairment.bandwidth:  # waiting for the packets queued before it, then for its own serialization
+            start_time = max(now, self.free_time)
+            if (start_time - now) * impairment.bandwidth + size > impairment.queue_bytes:
+                self.queue_drops += 1
+                return None
+            self.free_time = now = start_time + size / impairment.bandwidth
+        if impairment.loss and self.rng.random() < impairment.loss:
+            self.lost += 1
+            return None
+        deliver_time = now + impairment.delay
+        if impairment.jitter:
+            deliver_time += self.rng.uniform(0.0, impairment.jitter)
+        if impairment.reorder and self.rng.random() < impairment.reorder:
+            self.reordered += 1
+            deliver_time += max(2 * impairment.jitter, REORDER_DELAY)
+        return deliver_time
+
+    def stats(self) -> dict:
+        """
+        The function returns the link's counters.
+        """
+        return {"packets": self.packets, "bytes": self.bytes, "lost": self.lost, "queue_drops": self.queue_drops,
+                "reordered": self.reordered, "too_big": self.too_big}
+
+
+class ImpairmentProxy:
+    """
+    A class representing a UDP proxy in front of a server: the clients send to the proxy's address, their packets
+    pass through the uplink to the server (from a socket of the proxy per client, so the server tells them apart)
+    and the server's packets pass through the downlink back to the client. The proxy runs in a thread of the
+    process (start and stop), the packets waiting for their delivery time are kept in a heap.
+    """
+
+    def __init__(self, server_address, uplink: Impairment = None, downlink: Impairment = None,
+                 local_address=('127.0.0.1', 0), seed: int = None):
+        rng = random.Random(seed)  # (the same seed impairs the same packets the same way)
+        self.server_address = server_address
+        self.uplink = Link(uplink or Impairment(), rng)  # clients to the server
+        self.downlink = Link(downlink or Impairment(), rng)  # the server to the clients
+        self.sock = self.__open_socket(local_address)
+        self.address = self.sock.getsockname()  # the address the clients send to
+        self.upstreams = {}  # the socket sending to the server for every client by (client address: socket)
+        self.clients = {}  # the client of every upstream socket by (socket: client address)
+        self.queue = []  # the packets waiting for their delivery by (deliver_time, sequence, socket, data, address)
+        self.sequence = itertools.count()  # (packets due at the same time keep their order)
+        self.running = False
+        self.thread = None
+
+    @staticmethod
+    def __open_socket(local_address) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):  # room for the windows passing through
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFFER_SIZE)
+            except OSError:
+                pass  # the kernel keeps its default size
+        sock.bind(local_address)
+        sock.setblocking(False)
+        return sock
+
+    def start(self):
+        """
+        The function starts forwarding in a thread.
+        """
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        The function stops forwarding (the packets still queued are dropped) and closes the sockets.
+        """
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        for sock in [self.sock, *self.clients]:
+            sock.close()
+
+    def stats(self) -> dict:
+        """
+        The function returns the counters of both directions.
+        """
+        return {"uplink": self.uplink.stats(), "downlink": self.downlink.stats()}
+
+    def run(self):
+        """
+        The function forwards the packets until the proxy is stopped.
+        """
+        while self.running:
+            now = time.perf_counter()
+            while self.queue and self.queue[0][0] <= now:  # delivering the packets due
+                _, _, sock, data, address = heapq.heappop(self.queue)
+                try:
+                    sock.sendto(data, address)
+                except OSError:
+                    pass  # (a full buffer, or no one listens) the packet is lost
+            timeout = POLL_INTERVAL if not self.queue else min(POLL_INTERVAL, self.queue[0][0] - now)
+            readable, _, _ = select.select([self.sock, *self.clients], [], [], max(0.0, timeout))
+            for sock in readable:
+                self.__receive(sock)
+
+    def __receive(self, sock: socket.socket):
+        """
+        The function passes every packet the socket received to its link.
+        """
+        while True:
+            try:
+                data, address = sock.recvfrom(MAX_DATAGRAM_SIZE)
+            except (BlockingIOError, ConnectionRefusedError):  # (refused: an ICMP of a packet sent before)
+                return
+            if sock is self.sock:  # a client's packet to the server
+                if address not in self.upstreams:
+                    upstream = self.__open_socket(('127.0.0.1', 0))
+                    self.upstreams[address] = upstream
+                    self.clients[upstream] = address
+                link, out_sock, destination = self.uplink, self.upstreams[address], self.server_address
+            else:  # the server's packet to the client
+                link, out_sock, destination = self.downlink, self.sock, self.clients[sock]
+            deliver_time = link.deliver_time(len(data), time.perf_counter())
+            if deliver_time is not None:
+                heapq.heappush(self.queue, (deliver_time, next(self.sequence), out_sock, data, destination))
@@ -0,0 +1,202 @@
+import bisect
+import json
+import time
+
+# the bucket bounds of the time histograms: 10 us doubling up to about 84 s (in seconds)
+TIME_BUCKETS = tuple(1e-5 * 2 ** i for i in range(24))
+QLOG_VERSION = "0.4"
+
+
+class Histogram:
+    """
+    A class counting values into buckets (the values up to every bound), with their count, sum, minimum and
+    maximum. Recording a value costs a binary search, the percentiles are estimated by the bucket bounds.
+    """
+
+    def __init__(self, bounds=TIME_BUCKETS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)  # (the last one counts the values beyond the last bound)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value: float):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, fraction: float):
+        """
+        The function returns the bound of the bucket holding the fraction of the values (the maximum beyond the
+        last bound), None when no value was recorded.
+        """
+        if not self.count:
+            return None
+        rank = max(1, round(fraction * self.count))
+        seen = 0
+        for i, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {"count": self.count, "sum": self.total, "mean": self.total / self.count if self.count else None,
+                "min": self.min, "max": self.max, "p50": self.percentile(0.5), "p90": self.percentile(0.9),
+                "p99": self.percentile(0.99)}
+
+
+class StreamMetrics:
+    """
+    A class counting the progress of an object being sent on a stream.
+    """
+
+    def __init__(self, now: float):
+        self.start_time = now  # the time its first frame was sent
+        self.bytes_sent = 0  # stream bytes sent, resent ones included
+        self.bytes_resent = 0
+        self.highest_offset = 0  # the end of the data sent (lower data sent again is resent)
+        self.complete_time = None  # the time the whole object was acknowledged
+
+    def snapshot(self) -> dict:
+        return {"bytes_sent": self.bytes_sent, "bytes_resent": self.bytes_resent,
+                "time_to_complete": None if self.complete_time is None else self.complete_time - self.start_time}
+
+
+class ConnectionMetrics:
+    """
+    A class keeping the counters and histograms of a connection, fed by the connection's events, and passing the
+    events to the trace (a callable taking the event name, time and data, like QlogWriter) when there is one.
+    A connection without metrics (the default) skips all of it.
+    """
+
+    def __init__(self, conn_id: int, trace=None):
+        self.conn_id = conn_id
+        self.trace = trace
+        self.packets_sent = self.bytes_sent = 0
+        self.packets_received = self.bytes_received = 0
+        self.packets_acked = self.bytes_acked = 0
+        self.packets_lost = self.bytes_lost = 0
+        self.probe_timeouts = 0  # probe timeouts (the packets in flight were sent again)
+        self.acks_sent = 0
+        self.rtt = Histogram()  # the rtt samples
+        self.ack_delay = Histogram()  # the time the peer held the acks of the packets sent (as it reported)
+        self.local_ack_delay = Histogram()  # the time the acks sent were held
+        self.time_to_complete = Histogram()  # the time of the objects from their first frame to their last ack
+        self.streams = {}  # the objects being sent or sent by (stream_id: StreamMetrics), the last one of a stream
+
+    def __event(self, name: str, now: float, data: dict):
+        data["conn_id"] = self.conn_id
+        self.trace(name, now, data)
+
+    def on_packet_sent(self, packet_number: int, size: int, packet_frames: list, now: float):
+        """
+        :param packet_frames: the (stream_id, offset, length, fin) the packet carries
+        """
+        self.packets_sent += 1
+        self.bytes_sent += size
+        for stream_id, offset, length, _ in packet_frames:
+            stream_metrics = self.streams.get(stream_id)
+            if stream_metrics is None or stream_metrics.complete_time is not None:  # (a new object of the stream)
+                stream_metrics = self.streams[stream_id] = StreamMetrics(now)
+            stream_metrics.bytes_sent += length
+            if offset < stream_metrics.highest_offset:
+                stream_metrics.bytes_resent += min(length, stream_metrics.highest_offset - offset)
+            stream_metrics.highest_offset = max(stream_metrics.highest_offset, offset + length)
+        if self.trace is not None:
+            self.__event("transport:packet_sent", now, {
+                "header": {"packet_type": "1RTT", "packet_number": packet_number}, "raw": {"length": size},
+                "frames": [{"frame_type": "stream", "stream_id": stream_id, "offset": offset, "length": length,
+                            "fin": fin} for stream_id, offset, length, fin in packet_frames]})
+
+    def on_packet_received(self, packet_type: str, packet_number: int, size: int, now: float):
+        """
+        :param packet_type: "1RTT" for a data packet, "ack" for an ACK packet
+        """
+        self.packets_received += 1
+        self.bytes_received += size
+        if self.trace is not None:
+            self.__event("transport:packet_received", now, {
+                "header": {"packet_type": packet_type, "packet_number": packet_number}, "raw": {"length": size}})
+
+    def on_ack_sent(self, packet_number: int, ack_delay: float, now: float):
+        self.acks_sent += 1
+        self.local_ack_delay.record(ack_delay)
+
+    def on_packet_acked(self, packet_number: int, size: int, send_time: float, now: float):
+        self.packets_acked += 1
+        self.bytes_acked += size
+        if self.trace is not None:
+            self.__event("recovery:packet_acked", now, {
+                "header": {"packet_number": packet_number}, "raw": {"length": size}, "time_in_flight": now - send_time})
+
+    def on_rtt_sample(self, rtt_sample: float, ack_delay: float, smoothed_rtt: float, now: float):
+        self.rtt.record(rtt_sample)
+        self.ack_delay.record(ack_delay)
+        if self.trace is not None:
+            self.__event("recovery:metrics_updated", now, {"latest_rtt": rtt_sample, "smoothed_rtt": smoothed_rtt,
+                                                           "ack_delay": ack_delay})
+
+    def on_packet_lost(self, packet_number: int, size: int, trigger: str, now: float):
+        """
+        :param trigger: "threshold" (later packets were acknowledged), "pto_expired" or "mtu_probe"
+        """
+        self.packets_lost += 1
+        self.bytes_lost += size
+        if self.trace is not None:
+            self.__event("recovery:packet_lost", now, {"header": {"packet_number": packet_number},
+                                                       "raw": {"length": size}, "trigger": trigger})
+
+    def on_probe_timeout(self, pto_count: int, now: float):
+        self.probe_timeouts += 1
+        if self.trace is not None:
+            self.__event("recovery:loss_timer_updated", now, {"event_type": "expired", "timer_type": "pto",
+                                                              "pto_count": pto_count})
+
+    def on_stream_completed(self, stream_id: int, now: float):
+        stream_metrics = self.streams.get(stream_id)
+        if stream_metrics is not None and stream_metrics.complete_time is None:
+            stream_metrics.complete_time = now
+            self.time_to_complete.record(now - stream_metrics.start_time)
+
+    def snapshot(self) -> dict:
+        """
+        The function returns the counters, histograms and streams (JSON serializable).
+        """
+        return {"packets_sent": self.packets_sent, "bytes_sent": self.bytes_sent,
+                "packets_received": self.packets_received, "bytes_received": self.bytes_received,
+                "packets_acked": self.packets_acked, "bytes_acked": self.bytes_acked,
+                "packets_lost": self.packets_lost, "bytes_lost": self.bytes_lost,
+                "probe_timeouts": self.probe_timeouts, "acks_sent": self.acks_sent,
+                "rtt": self.rtt.snapshot(), "ack_delay": self.ack_delay.snapshot(),
+                "local_ack_delay": self.local_ack_delay.snapshot(),
+                "time_to_complete": self.time_to_complete.snapshot(),
+                "streams": {stream_id: stream_metrics.snapshot() for stream_id, stream_metrics in self.streams.items()}}
+
+
+class QlogWriter:
+    """
+    A class writing the events of the connections as qlog JSON lines (a header record, then an event per line
+    with its time in milliseconds since the first event), a trace for ConnectionMetrics.
+    """
+
+    def __init__(self, file, title: str = "DQUIC", vantage_point: str = "unknown"):
+        """
+        :param file: a text file open for writing (flushed by its owner)
+        :param vantage_point: "client", "server" or "unknown"
+        """
+        self.file = file
+        self.reference_time = None
+        self.file.write(json.dumps({"qlog_version": QLOG_VERSION, "qlog_format": "JSON-SEQ", "title": title,
+                                    "trace": {"vantage_point": {"type": vantage_point},
+                                              "common_fields": {"time_format": "relative",
+                                                                "reference_time": time.time() * 1e3}}}) + "\n")
+
+    def __call__(self, name: str, now: float, data: dict):
+        if self.reference_time is None:
+            self.reference_time = now
+        self.file.write(json.dumps({"time": (now - self.reference_time) * 1e3, "name": name,
+                                    "group_id": f"{data.pop('conn_id'):x}", "data": data}) + "\n")
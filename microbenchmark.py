@@ -0,0 +1,226 @@
+import argparse
+import functools
+import socket
+import time
+import tracemalloc
+
+import DQUIC
+import datagrams
+
+OBJECT_SIZE = 16 * 1024 * 1024  # 16 MB
+NUM_STREAMS = DQUIC.MAX_FRAMES_IN_PACKET  # every packet carries a frame of every stream
+SINK_ADDRESS = ('127.0.0.1', 9992)  # a bound socket that never reads (the kernel drops what doesn't fit)
+RECV_ADDRESS = ('127.0.0.1', 9997)  # the socket the receive path reads the packets from
+RECV_BATCH = 128  # packets queued in the receiving socket at a time (they must fit in its buffer)
+RECV_PACKETS = 4096  # packets received and decoded in every run of a receive path
+
+
+def concat_packets(objects: dict[int, bytes], sock=None):
+    """
+    The function builds the packets the way send_to did before the send buffer: bytes concatenation of every
+    frame and a sliced copy of the object's data.
+    :param objects: objects to send represented by (stream_id:int : object:bytes)
+    :param sock: socket to send the packets with (None only builds them)
+    """
+    offsets = {stream_id: 0 for stream_id in objects}
+    packet_number = 0
+    while offsets:
+        packet_payload = b""
+        for stream_id in list(offsets):
+            offset = offsets[stream_id]
+            stream_data = objects[stream_id][offset:offset + DQUIC.MAX_STREAM_SIZE]
+            packet_payload += DQUIC.DQUICFrame(stream_id, DQUIC.DATA, offset, len(stream_data)).to_bytes()
+            packet_payload += stream_data
+            offsets[stream_id] += len(stream_data)
+            if offsets[stream_id] == len(objects[stream_id]):
+                del offsets[stream_id]
+        packet_to_send = DQUIC.DQUICHeader(DQUIC.SHORT, packet_number).to_bytes() + packet_payload
+        packet_number += 1
+        if sock is not None:
+            sock.sendto(packet_to_send, SINK_ADDRESS)
+
+
+def view_packets(objects: dict[int, bytes], sock=None, gather: bool = False):
+    """
+    The function builds the packets the way send_to does, from views of the objects: packed into the connection's
+    send buffer (Connection.build_packet), or as segments gathered by sendmsg (Connection.packet_segments).
+    :param objects: objects to send represented by (stream_id:int : object:bytes)
+    :param sock: socket to send the packets with (None only builds them)
+    :param gather: scatter/gather sending instead of the send buffer
+    """
+    connection = DQUIC.Connection(SINK_ADDRESS, 0, max_datagram_size=DQUIC.DQUICHeader.HEADER_STRUCT.size
+                                  + NUM_STREAMS * (DQUIC.DQUICFrame.FRAME_STRUCT.size + DQUIC.MAX_STREAM_SIZE),
+                                  versions=(DQUIC.FIXED_VERSION,))  # (the same packets as concat_packets)
+    views = {stream_id: memoryview(obj) for stream_id, obj in objects.items()}
+    offsets = {stream_id: 0 for stream_id in objects}
+    packet_number = 0
+    while offsets:
+        packet_payload = []
+        for stream_id in list(offsets):
+            offset = offsets[stream_id]
+            stream_data = views[stream_id][offset:offset + DQUIC.MAX_STREAM_SIZE]
+            packet_payload.append((stream_id, DQUIC.DATA, offset, len(stream_data), stream_data))
+            offsets[stream_id] += len(stream_data)
+            if offsets[stream_id] == len(objects[stream_id]):
+                del offsets[stream_id]
+        if gather:
+            segments = connection.packet_segments(DQUIC.SHORT, packet_number, packet_payload)
+            if sock is not None:
+                sock.sendmsg(segments, (), 0, SINK_ADDRESS)
+        else:
+            packet_to_send = connection.build_packet(DQUIC.SHORT, packet_number, packet_payload)
+            if sock is not None:
+                sock.sendto(packet_to_send, SINK_ADDRESS)
+        packet_number += 1
+
+
+def encoded_packets(objects: dict[int, bytes], version: int) -> list:
+    """
+    The function returns the packets view_packets sends (a frame of every stream), as bytes.
+    :param version: the wire encoding (DQUIC.FIXED_VERSION or DQUIC.COMPACT_VERSION)
+    """
+    connection = DQUIC.Connection(SINK_ADDRESS, 0, max_datagram_size=DQUIC.MAX_RECV_BYTES, versions=(version,))
+    offsets = {stream_id: 0 for stream_id in objects}
+    packets = []
+    while offsets:
+        packet_payload = []
+        for stream_id in list(offsets):
+            offset = offsets[stream_id]
+            stream_data = objects[stream_id][offset:offset + DQUIC.MAX_STREAM_SIZE]
+            packet_payload.append((stream_id, DQUIC.DATA, offset, len(stream_data), stream_data))
+            offsets[stream_id] += len(stream_data)
+            if offsets[stream_id] == len(objects[stream_id]):
+                del offsets[stream_id]
+        packets.append(bytes(connection.build_packet(DQUIC.SHORT, len(packets), packet_payload)))
+    return packets
+
+
+def copy_decode(sock, receiver, count: int):
+    """
+    The function receives and decodes packets the way receive_from did before the reusable receive buffer: a new
+    64 KB buffer for every recvfrom, and the header, every frame and every frame's data unpacked from sliced copies.
+    :param sock: the socket the packets are queued in
+    :param receiver: unused (see view_decode)
+    :param count: packets to receive
+    """
+    header_len = DQUIC.DQUICHeader.HEADER_STRUCT.size
+    frame_len = DQUIC.DQUICFrame.FRAME_STRUCT.size
+    for _ in range(count):
+        received_bytes, _ = sock.recvfrom(65536)
+        packet_type, dst_conn_id, src_conn_id, packet_number = \
+            DQUIC.DQUICHeader.HEADER_STRUCT.unpack(received_bytes[:header_len])
+        DQUIC.DQUICHeader(packet_type, packet_number, dst_conn_id, src_conn_id)
+        pointer = header_len
+        while len(received_bytes) - pointer >= frame_len:
+            frame = DQUIC.DQUICFrame.from_bytes(received_bytes[pointer:pointer + frame_len])
+            pointer += frame_len
+            stream_data = received_bytes[pointer:pointer + frame.length]
+            pointer += len(stream_data)
+
+
+def view_decode(sock, receiver, count: int):
+    """
+    The function receives and decodes packets the way DQUIC does: into the receiver's reusable buffer
+    (datagrams.DatagramReceiver), the frames unpacked in place into plain records (DQUIC.FixedEncoding.unpack_frames)
+    and their data handed out as views of the buffer.
+    :param sock: the socket the packets are queued in
+    :param receiver: the datagrams.DatagramReceiver of the socket
+    :param count: packets to receive
+    """
+    for _ in range(count):
+        received_bytes, _ = receiver.recvfrom(sock)
+        encoding = DQUIC.packet_encoding(received_bytes)
+        header, pointer = encoding.parse_header(received_bytes)
+        for stream_id, frame_type, offset, length, stream_data in encoding.unpack_frames(received_bytes, pointer):
+            pass
+
+
+def measure_receive(decode, packets: list, sock, runs: int):
+    """
+    The function measures the cpu time and the memory allocated by receiving and decoding the packets (queued
+    RECV_BATCH at a time in the socket, the sending isn't measured). The memory is the peak traced while every
+    packet is decoded (tracemalloc), so a buffer allocated for a packet counts even when it's freed at once.
+    :return: the best decoded packets per second and the mean bytes allocated per packet
+    """
+    receiver = datagrams.DatagramReceiver(sock, False)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    best_time = None
+    for _ in range(runs):
+        run_time = 0.0
+        for i in range(0, RECV_PACKETS, RECV_BATCH):
+            for j in range(RECV_BATCH):
+                sender.sendto(packets[(i + j) % len(packets)], RECV_ADDRESS)
+            start_time = time.process_time()
+            decode(sock, receiver, RECV_BATCH)
+            run_time += time.process_time() - start_time
+        best_time = run_time if best_time is None else min(best_time, run_time)
+    for packet in packets[:RECV_BATCH]:
+        sender.sendto(packet, RECV_ADDRESS)
+    decode(sock, receiver, 1)  # (the first packet allocates the reusable buffer)
+    allocated = 0
+    tracemalloc.start()
+    for _ in range(RECV_BATCH - 1):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        decode(sock, receiver, 1)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    sender.close()
+    return RECV_PACKETS / best_time, allocated / (RECV_BATCH - 1)
+
+
+def measure(build_packets, objects: dict[int, bytes], sock, runs: int) -> float:
+    """
+    The function measures the cpu time of building (and sending) the packets of the objects.
+    :return: the best cpu seconds per MB of objects
+    """
+    total_size = sum(len(obj) for obj in objects.values())
+    best_time = None
+    for _ in range(runs):
+        start_time = time.process_time()
+        build_packets(objects, sock)
+        run_time = time.process_time() - start_time
+        best_time = run_time if best_time is None else min(best_time, run_time)
+    return best_time / (total_size / 1e6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DQUIC send path microbenchmark (cpu time per MB)")
+    parser.add_argument("--runs", type=int, default=5, help="runs of every path (the best is reported)")
+    arguments = parser.parse_args()
+
+    objects = {stream_id: bytes(OBJECT_SIZE // NUM_STREAMS) for stream_id in range(NUM_STREAMS)}
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(SINK_ADDRESS)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    print(f"Building packets of {len(objects)} objects, total size: {OBJECT_SIZE} bytes")
+    print("\n---------------------------------- SEND PATH CPU ----------------------------------")
+    paths = [("bytes concatenation", concat_packets), ("send buffer", view_packets)]
+    if DQUIC.SENDMSG:
+        paths.append(("sendmsg", functools.partial(view_packets, gather=True)))
+    for name, build_packets in paths:
+        build_time = measure(build_packets, objects, None, arguments.runs)
+        send_time = measure(build_packets, objects, sock, arguments.runs)
+        print(f"{name:>20}: build {build_time * 1e3:.2f} ms/MB, build and sendto {send_time * 1e3:.2f} ms/MB")
+
+    recv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    recv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, DQUIC.SOCKET_BUFFER_SIZE)
+    recv_sock.bind(RECV_ADDRESS)
+    print("\n-------------------------------- RECEIVE PATH ---------------------------------")
+    fixed_packets = encoded_packets(objects, DQUIC.FIXED_VERSION)
+    compact_packets = encoded_packets(objects, DQUIC.COMPACT_VERSION)
+    print(f"packets of {len(fixed_packets[0])} bytes (fixed layout), {len(compact_packets[0])} bytes (compact)")
+    for name, decode, packets in (("sliced copies", copy_decode, fixed_packets),
+                                  ("receive buffer", view_decode, fixed_packets),
+                                  ("compact", view_decode, compact_packets)):
+        packets_per_second, allocated = measure_receive(decode, packets, recv_sock, arguments.runs)
+        print(f"{name:>20}: {packets_per_second / 1e3:.1f} k packets/s, {allocated:.0f} bytes allocated per packet")
+
+    recv_sock.close()
+    sock.close()
+    sink.close()
+
+
+if __name__ == '__main__':
+    main()
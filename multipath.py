@@ -0,0 +1,163 @@
+import congestion
+import fec
+import pmtud
+import recovery
+import streams
+
+PATH_SCHEDULER = "min_rtt"  # default path scheduler (see PATH_SCHEDULERS)
+DEFAULT_WEIGHT = 1  # a path's share of the packets (weighted round robin)
+PATH_FAILURE_PTOS = 2  # probe timeouts in a row after which a path is taken as failed (while another path works)
+MAX_PROBE_BACKOFF = 4  # a probing path is probed at least every 2 ** MAX_PROBE_BACKOFF probe timeouts
+
+
+class Path:
+    """
+    A class representing one path of a connection: a local socket (the I/O layer's index of it) and the peer's
+    address on that path. Every path has its own packet number space, rtt estimation, congestion control, pacing,
+    path MTU search and forward error correction, with the packets in flight on it, and the packets received on
+    it waiting for their ack (the acks of a path are sent on it). The streams and their flow control belong to the
+    connection: a path scheduler picks the path of every packet, and the data of a lost packet may be sent again
+    on any path.
+    """
+
+    def __init__(self, path_id: int, addr, local: int = 0, congestion_control="cubic",
+                 max_datagram_size: int = congestion.MAX_DATAGRAM_SIZE, max_plpmtu: int = None, fec_group_size=0,
+                 weight: int = DEFAULT_WEIGHT):
+        """
+        :param path_id: the path's number in the connection (0 is the first path, its packets carry no PATH frame)
+        :param addr: the peer's address on the path
+        :param local: the local socket of the path (an index of the I/O layer, 0 is its main socket)
+        :param weight: the path's share of the packets (weighted round robin)
+        """
+        if weight <= 0:
+            raise ValueError(f"weight must be positive, got {weight}")
+        self.path_id = path_id
+        self.addr = addr
+        self.local = local
+        self.weight = weight
+        self.validated = path_id == 0  # an ack arrived on the path since it was opened (the first path needs none)
+        self.failed = False  # silent for PATH_FAILURE_PTOS probe timeouts while another path worked
+        # sending:
+        self.sent_packet_number = 0
+        self.sent_packets = {}  # packets in flight represented by (packet_number: (send_time, size, [(stream_id, offset, length, fin)]))
+        self.rtt = recovery.RttEstimator()  # rtt estimation from the ack timing
+        self.congestion_controller = congestion.create_congestion_controller(congestion_control, max_datagram_size,
+                                                                             self.rtt)
+        self.pacer = congestion.Pacer()
+        self.pmtud = pmtud.PathMtuDiscovery(max_datagram_size, max_plpmtu)
+        self.mtu_probe = None  # the probe in flight represented by its packet number
+        self.pto_count = 0  # probe timeouts in a row without any ack
+        self.silent_since = 0.0  # the send time of the first packet unanswered (set at the first probe timeout)
+        self.largest_acked = -1  # the largest packet number acknowledged
+        self.loss_time = None  # the time a packet in flight will be lost by the time threshold
+        self.last_send_time = 0.0
+        self.fec_encoder = fec.FecEncoder(fec_group_size)
+        # receiving: (one ack covers the packets received on the path since its previous ack)
+        self.unacked_packets = streams.RangeSet()  # the packet numbers received since the previous ack
+        self.unacked_count = 0
+        self.largest_unacked_time = 0.0  # the time the largest packet number of unacked_packets was received
+        self.largest_received = -1  # the largest packet number received
+        self.ack_deadline = None  # the time the pending ack must be sent, None when no ack is pending
+        self.fec_decoder = fec.FecDecoder()
+
+    @property
+    def probing(self) -> bool:
+        """
+        The path carries only probes (an IMMEDIATE_ACK packet at a time) until an ack arrives on it: it's not
+        validated yet, or it failed.
+        """
+        return self.failed or not self.validated
+
+    def can_send(self, now: float, window_size: int) -> bool:
+        """
+        The function checks if the path may send a packet now: the window, congestion controller and pacer allow it.
+        """
+        return len(self.sent_packets) < window_size and self.congestion_controller.can_send() \
+            and self.pacer.delay(now) <= 0
+
+    def loss_deadline(self):
+        """
+        The function returns when the packets in flight are checked for loss: by the time threshold, or the probe
+        timeout (backing off exponentially, up to 2 ** MAX_PROBE_BACKOFF for a probing path) when no ack arrives, at
+        the latest GIVE_UP_TIMEOUT after the first packet unanswered (a working path gives up then).
+        :return: the time, None if nothing is in flight
+        """
+        if not self.sent_packets:
+            return None
+        if self.loss_time is not None:
+            return self.loss_time
+        if self.probing:
+            return self.last_send_time + self.rtt.pto() * (2 ** min(self.pto_count, MAX_PROBE_BACKOFF))
+        deadline = self.last_send_time + self.rtt.pto() * (2 ** self.pto_count)
+        return min(deadline, self.silent_since + recovery.GIVE_UP_TIMEOUT) if self.pto_count > 0 else deadline
+
+    def stats(self) -> dict:
+        return {"path_id": self.path_id, "address": self.addr, "local": self.local, "validated": self.validated,
+                "failed": self.failed,
+                "packets_sent": self.sent_packet_number, "path_mtu": self.pmtud.plpmtu,
+                "smoothed_rtt": self.rtt.smoothed_rtt, "cwnd": self.congestion_controller.cwnd,
+                "bytes_in_flight": self.congestion_controller.bytes_in_flight}
+
+
+class PathScheduler:
+    """
+    A base class for path schedulers: the scheduler picks the path of the next data packet among the paths ready
+    to send it (not probing, and their window, congestion controller and pacer allow a packet now).
+    """
+    name = "base"
+
+    def select(self, paths: list) -> Path:
+        """
+        The function picks the path of the next data packet.
+        :param paths: the paths ready to send (at least one)
+        """
+        raise NotImplementedError
+
+
+class MinRttScheduler(PathScheduler):
+    """
+    A class sending on the ready path of the lowest smoothed rtt: the fastest path is filled first, the slower ones
+    take the packets its congestion window (or pacing) holds back, so they add their bandwidth without delaying
+    what the fastest path can carry.
+    """
+    name = "min_rtt"
+
+    def select(self, paths: list) -> Path:
+        return min(paths, key=lambda path: (path.rtt.smoothed_rtt, path.path_id))
+
+
+class WeightedRoundRobinScheduler(PathScheduler):
+    """
+    A class sending on the ready paths in turns by their weights (smooth weighted round robin: a path of weight 2
+    sends twice as many packets as a path of weight 1, interleaved), whatever their rtt.
+    """
+    name = "weighted_round_robin"
+
+    def __init__(self):
+        self.credits = {}  # the turns every path has earned by (path_id: credit)
+
+    def select(self, paths: list) -> Path:
+        total_weight = 0
+        for path in paths:
+            self.credits[path.path_id] = self.credits.get(path.path_id, 0) + path.weight
+            total_weight += path.weight
+        selected = max(paths, key=lambda path: (self.credits[path.path_id], -path.path_id))
+        self.credits[selected.path_id] -= total_weight
+        return selected
+
+
+PATH_SCHEDULERS = {path_scheduler.name: path_scheduler for path_scheduler in (MinRttScheduler,
+                                                                             WeightedRoundRobinScheduler)}
+
+
+def create_path_scheduler(path_scheduler) -> PathScheduler:
+    """
+    The function creates a path scheduler.
+    :param path_scheduler: scheduler name (min_rtt, weighted_round_robin) or a PathScheduler subclass
+    :return: the scheduler object
+    """
+    if isinstance(path_scheduler, str):
+        if path_scheduler not in PATH_SCHEDULERS:
+            raise ValueError(f"unknown path scheduler: {path_scheduler}")
+        path_scheduler = PATH_SCHEDULERS[path_scheduler]
+    return path_scheduler()
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import mmap
+import os
+import random
+import tempfile
+
+INDEX_FILE = "index.json"  # the names of the objects by (name: digest)
+COPY_SIZE = 1024 * 1024  # the bytes copied at a time from a file put in the store
+
+
+class ObjectStore:
+    """
+    A class representing a content addressed object store in a directory: every object is a file named by the
+    SHA-256 of its content (written once, whatever number of names it has), mapped to memory when it's opened, so
+    the objects are served as views of the page cache without loading or copying them. An index maps the names of
+    the objects (the generated ones by their size and seed) to their digests, so a restarted server finds them
+    without generating or hashing anything.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.objects_directory = os.path.join(directory, "objects")
+        os.makedirs(self.objects_directory, exist_ok=True)
+        try:
+            with open(os.path.join(directory, INDEX_FILE)) as file:
+                self.index = json.load(file)
+        except FileNotFoundError:
+            self.index = {}
+        self.maps = {}  # the objects opened by (digest: mmap)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.objects_directory, digest)
+
+    def __contains__(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def put(self, data) -> str:
+        """
+        The function stores an object (bytes or any buffer), unless the store has it already.
+        :return: the object's digest
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        if digest not in self:
+            self.__write(digest, [data])
+        return digest
+
+    def put_file(self, path: str) -> str:
+        """
+        The function stores a file's content, hashing it while it's copied (it's never loaded whole).
+        :return: the object's digest
+        """
+        sha256 = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=self.objects_directory)
+        try:
+            with open(path, "rb") as source, os.fdopen(fd, "wb") as file:
+                for chunk in iter(lambda: source.read(COPY_SIZE), b""):
+                    sha256.update(chunk)
+                    file.write(chunk)
+            digest = sha256.hexdigest()
+            if digest in self:  # (the same content was stored before)
+                os.unlink(temp_path)
+            else:
+                os.replace(temp_path, self.path(digest))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return digest
+
+    def __write(self, digest: str, chunks: list):
+        """
+        The function writes an object's file atomically (a partly written object is never found by its digest).
+        """
+        fd, temp_path = tempfile.mkstemp(dir=self.objects_directory)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                for chunk in chunks:
+                    file.write(chunk)
+            os.replace(temp_path, self.path(digest))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def get(self, digest: str) -> memoryview:
+        """
+        The function returns an object as a read only view of its mapped file (the OS reads its pages as they are
+        used).
+        :raise KeyError: the store doesn't have the object
+        """
+        if digest not in self.maps:
+            try:
+                with open(self.path(digest), "rb") as file:
+                    if os.fstat(file.fileno()).st_size == 0:  # (an empty file can't be mapped)
+                        return memoryview(b"")
+                    self.maps[digest] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except FileNotFoundError:
+                raise KeyError(digest) from None
+        return memoryview(self.maps[digest])
+
+    def verify(self, digest: str) -> bool:
+        """
+        The function checks that an object's content still matches its digest.
+        """
+        return hashlib.sha256(self.get(digest)).hexdigest() == digest
+
+    def lookup(self, name: str):
+        """
+        The function returns the digest of the object stored by the name, None if there's none.
+        """
+        digest = self.index.get(name)
+        return digest if digest is not None and digest in self else None
+
+    def name(self, name: str, digest: str):
+        """
+        The function names a stored object (the index is saved at once).
+        """
+        self.index[name] = digest
+        fd, temp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "w") as file:
+            json.dump(self.index, file, indent=1)
+        os.replace(temp_path, os.path.join(self.directory, INDEX_FILE))
+
+    def generate(self, size: int, seed) -> str:
+        """
+        The function returns the digest of a random object, generating and storing it only when the store doesn't
+        have it (the same size and seed are the same object).
+        :param seed: random seed (int or str)
+        """
+        name = f"random-{size}-{seed}"
+        digest = self.lookup(name)
+        if digest is None:
+            digest = self.put(random.Random(seed).randbytes(size))  # (in bulk, not byte by byte)
+            self.name(name, digest)
+        return digest
+
+    def close(self):
+        """
+        The function closes the mapped objects that are no longer referenced (the others are closed with their views).
+        """
+        for digest, object_map in list(self.maps.items()):
+            try:
+                object_map.close()
+            except BufferError:
+                continue
+            del self.maps[digest]
@@ -0,0 +1,131 @@
+import errno
+import socket
+import sys
+
+BASE_PLPMTU = 1200  # packet size every path is assumed to carry (the size before the search, and after a black hole)
+MAX_PLPMTU = 65507  # largest UDP payload over IPv4, the top of the search
+MAX_PROBES = 3  # probes of a size lost in a row before the size is taken as too big for the path
+SEARCH_PRECISION = 32  # the search ends when the confirmed size is this close to the smallest failed size
+RAISE_INTERVAL = 600.0  # seconds after which a finished search starts again (the path may carry more now)
+BLACK_HOLE_PROBES = 3  # probe timeouts in a row of full size packets before falling back to BASE_PLPMTU
+# linux socket options, missing in the socket module: probing the path with the don't fragment bit, regardless of
+# the kernel's path MTU cache (sends bigger than the local device's MTU fail at once with EMSGSIZE)
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10)
+IP_PMTUDISC_PROBE = getattr(socket, "IP_PMTUDISC_PROBE", 3)
+PACKET_TOO_BIG = errno.EMSGSIZE  # the errno of a packet bigger than the local device's MTU
+
+
+def enable_probing(sock) -> bool:
+    """
+    The function sets the don't fragment bit on the socket's packets, so too big packets are dropped (or refused
+    locally) instead of fragmented, which the search relies on.
+    :return: True if the option was set (linux), otherwise the packets stay at BASE_PLPMTU
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_PROBE)
+    except OSError:
+        return False
+    return True
+
+
+class PathMtuDiscovery:
+    """
+    A class representing the packetization layer path MTU discovery of a connection (DPLPMTUD, RFC 8899), without
+    any I/O: the largest packet size confirmed by the peer's acks (plpmtu) is raised by a binary search of padded
+    probe packets. A probe that's lost MAX_PROBES times in a row, or refused by the local device, bounds the search
+    from above, and the loss of probes never counts as congestion. A path that stops carrying packets of plpmtu (a
+    black hole) falls back to BASE_PLPMTU and is searched again.
+    """
+
+    def __init__(self, base_plpmtu: int = BASE_PLPMTU, max_plpmtu: int = None):
+        """
+        :param base_plpmtu: the packet size before the search
+        :param max_plpmtu: the largest size searched, None for no search (every packet is base_plpmtu)
+        """
+        self.base_plpmtu = base_plpmtu
+        self.max_plpmtu = base_plpmtu if max_plpmtu is None else max(base_plpmtu, max_plpmtu)
+        self.plpmtu = base_plpmtu  # the largest packet size confirmed
+        self.failed_size = self.max_plpmtu + 1  # the smallest size the path didn't carry
+        self.probe_size = None  # the size of the probe in flight
+        self.probe_losses = 0  # probes of the next probe size lost in a row
+        self.search_done_time = None  # the time the search ended, None while searching
+
+    def is_searching(self) -> bool:
+        """
+        The function checks if the search didn't end yet.
+        """
+        return self.failed_size - self.plpmtu > SEARCH_PRECISION
+
+    def next_probe(self, now: float):
+        """
+        The function returns the size of the next probe to send, if a probe should be sent now (one at a time),
+        and marks it as in flight.
+        :param now: current time
+        :return: the probe size, None for no probe
+        """
+        if self.probe_size is not None:
+            return None
+        if not self.is_searching():
+            if self.search_done_time is None:
+                self.search_done_time = now
+            if now - self.search_done_time < RAISE_INTERVAL or self.plpmtu == self.max_plpmtu:
+                return None
+            self.failed_size = self.max_plpmtu + 1  # searching for a raised path MTU
+            self.search_done_time = None
+        self.probe_size = (self.plpmtu + self.failed_size) // 2
+        return self.probe_size
+
+    def on_probe_acked(self):
+        """
+        The function handles the ack of the probe in flight: the path carries its size.
+        :return: the new plpmtu
+        """
+        if self.probe_size is not None:  # (not forgotten by a black hole meanwhile)
+            self.plpmtu = max(self.plpmtu, self.probe_size)
+        self.probe_size = None
+        self.probe_losses = 0
+        return self.plpmtu
+
+    def on_probe_lost(self):
+        """
+        The function handles the loss of the probe in flight (too big for the path, or an ordinary loss, so it's
+        tried MAX_PROBES times).
+        """
+        if self.probe_size is None:
+            return
+        self.probe_losses += 1
+        if self.probe_losses >= MAX_PROBES:
+            self.on_packet_too_big()
+            return
+        self.probe_size = None
+
+    def on_probe_discarded(self):
+        """
+        The function forgets the probe in flight, its ack isn't waited for anymore (the same size is probed again).
+        """
+        self.probe_size = None
+
+    def on_packet_too_big(self):
+        """
+        The function handles a probe the path surely can't carry (refused by the local device).
+        """
+        if self.probe_size is not None:
+            self.failed_size = min(self.failed_size, self.probe_size)
+        self.probe_size = None
+        self.probe_losses = 0
+
+    def on_black_hole(self):
+        """
+        The function falls back to BASE_PLPMTU when packets of plpmtu stopped getting through, and searches again.
+        :return: the new plpmtu
+        """
+        if self.plpmtu == self.base_plpmtu:  # nothing smaller to fall back to
+            return self.plpmtu
+        self.failed_size = self.plpmtu
+        self.plpmtu = self.base_plpmtu
+        self.probe_size = None
+        self.probe_losses = 0
+        self.search_done_time = None
+        return self.plpmtu
@@ -0,0 +1,73 @@
+INITIAL_RTT = 0.333  # rtt assumed before the first sample (in seconds)
+GRANULARITY = 0.001  # timer granularity (in seconds)
+PACKET_THRESHOLD = 3  # a packet is lost when a packet sent this much later is acknowledged
+TIME_THRESHOLD = 9 / 8  # a packet is lost when it's older than this many rtts and a later packet is acknowledged
+MAX_ACK_DELAY = 0.025  # the longest time the receiver may delay an ack (in seconds, the probe timeout allows it)
+GIVE_UP_TIMEOUT = 10.0  # seconds without any ack after which the receiver is given up on, whatever the probe backoff
+
+
+class RttEstimator:
+    """
+    A class estimating the rtt of a connection from the ack timing (RFC 9002): the latest and minimum rtt, the
+    smoothed rtt and its variation, and the timeouts derived from them.
+    """
+
+    def __init__(self, initial_rtt: float = INITIAL_RTT):
+        self.latest_rtt = 0.0
+        self.min_rtt = None
+        self.smoothed_rtt = initial_rtt
+        self.rttvar = initial_rtt / 2
+        self.has_sample = False
+
+    def update(self, rtt_sample: float, ack_delay: float = 0.0):
+        """
+        The function updates the estimation with a new rtt sample.
+        :param rtt_sample: time between sending a packet and receiving its ack
+        :param ack_delay: time the receiver held the ack
+        """
+        self.latest_rtt = rtt_sample
+        if not self.has_sample:
+            self.has_sample = True
+            self.min_rtt = rtt_sample
+            self.smoothed_rtt = rtt_sample
+            self.rttvar = rtt_sample / 2
+            return
+        self.min_rtt = min(self.min_rtt, rtt_sample)
+        if rtt_sample - ack_delay >= self.min_rtt:  # the ack delay is not part of the path
+            rtt_sample -= ack_delay
+        self.rttvar = 3 / 4 * self.rttvar + 1 / 4 * abs(self.smoothed_rtt - rtt_sample)
+        self.smoothed_rtt = 7 / 8 * self.smoothed_rtt + 1 / 8 * rtt_sample
+
+    def pto(self, max_ack_delay: float = MAX_ACK_DELAY) -> float:
+        """
+        The function returns the probe timeout: how long to wait for an ack before probing the receiver.
+        """
+        return self.smoothed_rtt + max(4 * self.rttvar, GRANULARITY) + max_ack_delay
+
+    def loss_delay(self) -> float:
+        """
+        The function returns the time after which an unacknowledged packet, sent before an acknowledged one, is lost.
+        """
+        return max(TIME_THRESHOLD * max(self.smoothed_rtt, self.latest_rtt), GRANULARITY)
+
+
+def detect_lost_packets(sent_packets: dict, largest_acked: int, loss_delay: float, now: float):
+    """
+    The function finds the packets in flight that are lost, by the packet threshold or by the time threshold.
+    :param sent_packets: packets in flight represented by (packet_number: (send_time, ...))
+    :param largest_acked: the largest packet number acknowledged
+    :param loss_delay: the time threshold (see RttEstimator.loss_delay)
+    :param now: current time
+    :return: the lost packet numbers and the time the next packet will be lost by the time threshold (or None)
+    """
+    lost_packets = []
+    loss_time = None
+    lost_send_time = now - loss_delay
+    for packet_number, packet in sent_packets.items():
+        if packet_number > largest_acked:
+            continue
+        if packet[0] <= lost_send_time or largest_acked - packet_number >= PACKET_THRESHOLD:
+            lost_packets.append(packet_number)
+        elif loss_time is None or packet[0] + loss_delay < loss_time:
+            loss_time = packet[0] + loss_delay
+    return lost_packets, loss_time
@@ -0,0 +1,208 @@
+import collections
+import heapq
+import itertools
+
+DEFAULT_PRIORITY = 3  # the urgency of a stream, lower is sent first (like the HTTP priority urgencies 0-7)
+DEFAULT_WEIGHT = 1  # a stream's share of the bandwidth among the ready streams of its priority
+MAX_SHARES = 4  # the most streams sharing a packet in round robin (more would spend the packet on frame headers)
+
+
+class StreamScheduler:
+    """
+    A base class for stream schedulers.
+    The scheduler holds the streams ready to send (the connection pushes a stream when it has data to send within
+    the peer's credit) and decides which one fills the next frame of a packet, and how much of the packet it may
+    take. Every operation is O(1) or O(log n) in the number of streams, so many streams cost nothing per packet.
+    Implementations override push, pop and the share of the packet.
+    """
+    name = "base"
+
+    def __init__(self):
+        self.streams = {}  # the streams being sent by (stream_id: (SendStream, priority, weight))
+
+    def __len__(self):
+        """
+        The number of streams ready to send.
+        """
+        raise NotImplementedError
+
+    def add_stream(self, stream_id: int, send_stream, priority: int = DEFAULT_PRIORITY, weight: int = DEFAULT_WEIGHT):
+        """
+        The function registers an object being sent (it's scheduled once it's pushed).
+        :param stream_id: the object's stream
+        :param send_stream: the object's sending state (streams.SendStream)
+        :param priority: the stream's urgency, lower is sent first
+        :param weight: the stream's share of the bandwidth among the ready streams of its priority
+        """
+        if weight <= 0:
+            raise ValueError(f"weight must be positive, got {weight}")
+        self.streams[stream_id] = (send_stream, priority, weight)
+
+    def remove_stream(self, stream_id: int):
+        """
+        The function forgets a stream whose object was sent (or abandoned).
+        """
+        self.streams.pop(stream_id, None)
+
+    def push(self, stream_id: int):
+        """
+        The function marks a registered stream as ready to send (nothing if it's ready already).
+        """
+        raise NotImplementedError
+
+    def pop(self):
+        """
+        The function takes the next stream to send out of the ready streams.
+        :return: the stream id, None when no stream is ready
+        """
+        raise NotImplementedError
+
+    def on_sent(self, stream_id: int, length: int):
+        """
+        The function accounts the bytes a popped stream sent (before it's pushed again).
+        """
+
+    def share(self, room: int, taken: int) -> int:
+        """
+        The function returns the bytes of the packet the popped stream may take (its frame included).
+        :param room: the bytes left in the packet
+        :param taken: the frames already in the packet (of the streams popped before)
+        """
+        return room
+
+
+class RoundRobinScheduler(StreamScheduler):
+    """
+    A class sending the ready streams in turns: they share every packet evenly (MAX_SHARES streams at most, the
+    others take the next packets), a stream that needs less leaves its share to the others.
+    """
+    name = "round_robin"
+
+    def __init__(self):
+        super().__init__()
+        self.queue = collections.deque()  # the ready streams in turn order (and streams removed meanwhile)
+        self.ready = set()
+
+    def __len__(self):
+        return len(self.ready)
+
+    def remove_stream(self, stream_id: int):
+        super().remove_stream(stream_id)
+        self.ready.discard(stream_id)  # (its queue entry is skipped)
+
+    def push(self, stream_id: int):
+        if stream_id in self.streams and stream_id not in self.ready:
+            self.ready.add(stream_id)
+            self.queue.append(stream_id)
+
+    def pop(self):
+        while self.queue:
+            stream_id = self.queue.popleft()
+            if stream_id in self.ready:
+                self.ready.remove(stream_id)
+                return stream_id
+        return None
+
+    def share(self, room: int, taken: int) -> int:
+        # the streams sharing the packet: the ones popped for it before, the popped stream and the ones waiting
+        shares = min(taken + 1 + len(self.ready), MAX_SHARES) - taken
+        return room // max(1, shares)  # (the last ones take what the others left)
+
+
+class HeapScheduler(StreamScheduler):
+    """
+    A base class for the schedulers ordering the ready streams by a key in a heap, the lower priorities first.
+    The popped stream may take the whole packet, the next one fills what it leaves.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.heap = []  # the ready streams by (priority, key, sequence, stream_id), with stale entries
+        self.ready = {}  # the sequence of every ready stream's heap entry by (stream_id: sequence)
+        self.sequence = itertools.count()  # ties are sent in the order they got ready
+
+    def __len__(self):
+        return len(self.ready)
+
+    def key(self, stream_id: int):
+        """
+        The function returns the order of a stream among the ready streams of its priority (lower first).
+        """
+        raise NotImplementedError
+
+    def remove_stream(self, stream_id: int):
+        super().remove_stream(stream_id)
+        self.ready.pop(stream_id, None)  # (its heap entry is skipped)
+
+    def push(self, stream_id: int):
+        if stream_id in self.streams and stream_id not in self.ready:
+            sequence = next(self.sequence)
+            self.ready[stream_id] = sequence
+            heapq.heappush(self.heap, (self.streams[stream_id][1], self.key(stream_id), sequence, stream_id))
+
+    def pop(self):
+        while self.heap:
+            _, _, sequence, stream_id = heapq.heappop(self.heap)
+            if self.ready.get(stream_id) == sequence:
+                del self.ready[stream_id]
+                return stream_id
+        return None
+
+
+class WeightedPriorityScheduler(HeapScheduler):
+    """
+    A class sending the ready streams of the lowest priority first, the streams of the same priority share the
+    bandwidth by their weights (weighted fair queuing: the stream that sent the fewest bytes per weight goes next).
+    """
+    name = "priority"
+
+    def __init__(self):
+        super().__init__()
+        self.virtual_times = {}  # the bytes sent per weight by every stream, by (stream_id: virtual time)
+        self.level_times = {}  # the virtual time of the last stream popped of every priority, by (priority: time)
+
+    def key(self, stream_id: int):
+        priority = self.streams[stream_id][1]
+        # a stream that was idle doesn't make up for it: it starts from its priority's current virtual time
+        virtual_time = max(self.virtual_times.get(stream_id, 0.0), self.level_times.get(priority, 0.0))
+        self.virtual_times[stream_id] = virtual_time
+        return virtual_time
+
+    def remove_stream(self, stream_id: int):
+        super().remove_stream(stream_id)
+        self.virtual_times.pop(stream_id, None)
+
+    def on_sent(self, stream_id: int, length: int):
+        if stream_id in self.streams:
+            _, priority, weight = self.streams[stream_id]
+            self.level_times[priority] = self.virtual_times[stream_id]
+            self.virtual_times[stream_id] += length / weight
+
+
+class ShortestFirstScheduler(HeapScheduler):
+    """
+    A class sending the ready stream with the fewest bytes left to send first (shortest remaining processing time),
+    so small interactive objects don't wait behind bulk ones. Priorities are kept, the order applies within each.
+    """
+    name = "shortest_first"
+
+    def key(self, stream_id: int):
+        send_stream = self.streams[stream_id][0]
+        return send_stream.end - send_stream.send_offset  # (the new bytes left, lost bytes are few)
+
+
+STREAM_SCHEDULERS = {scheduler.name: scheduler for scheduler in (RoundRobinScheduler, WeightedPriorityScheduler,
+                                                                 ShortestFirstScheduler)}
+
+
+def create_scheduler(stream_scheduler) -> StreamScheduler:
+    """
+    The function creates a stream scheduler.
+    :param stream_scheduler: scheduler name (round_robin, priority, shortest_first) or a StreamScheduler subclass
+    :return: the scheduler object
+    """
+    if isinstance(stream_scheduler, str):
+        if stream_scheduler not in STREAM_SCHEDULERS:
+            raise ValueError(f"unknown stream scheduler: {stream_scheduler}")
+        stream_scheduler = STREAM_SCHEDULERS[stream_scheduler]
+    return stream_scheduler()
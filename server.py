@@ -1,44 +1,81 @@
+import argparse
+import asyncio
 import random
-import DQUIC
+import time
 
+import aiodquic
+import objectstore
+import sharding
 
-# Function to generate a random object of given size in bytes
-def generate_random_object(size_bytes) -> bytes:
-    # Generate random data of the given size
-    random_data = bytearray(random.getrandbits(8) for _ in range(size_bytes))
-    return bytes(random_data)
+
+def load_objects(store: objectstore.ObjectStore, num_objects: int, min_size_bytes: int, max_size_bytes: int,
+                 seed, files: list = None) -> list:
+    """
+    The function returns the objects to serve as views of the store (generated or copied into it only once, a
+    restarted server maps them from the disk).
+    :param seed: random seed of the objects' sizes and content
+    :param files: files to serve instead of random objects
+    :return: [object:memoryview]
+    """
+    if files:
+        return [store.get(store.put_file(path)) for path in files]
+    rng = random.Random(seed)
+    object_sizes = [rng.randint(min_size_bytes, max_size_bytes) for _ in range(num_objects)]
+    return [store.get(store.generate(size_bytes, f"{seed}:{i}")) for i, size_bytes in enumerate(object_sizes)]
 
 
 def main():
+    parser = argparse.ArgumentParser(description="DQUIC server")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes sharing the port (SO_REUSEPORT), each serving its own clients")
+    parser.add_argument("--store", default="dquic_store", help="directory of the object store (kept for restarts)")
+    parser.add_argument("--seed", default="0", help="random seed of the objects (the same seed serves the same ones)")
+    parser.add_argument("--files", nargs="+", help="files to serve instead of the random objects")
+    arguments = parser.parse_args()
     num_objects = 10
 
     # Convert MB to bytes:
     min_size_bytes = 1 * 1024 * 1024  # 1 MB
     max_size_bytes = 2 * 1024 * 1024  # 2 MB
 
-    print("Generating 10 objects...")
-    # Generate random sizes for the objects
-    object_sizes = [random.randint(min_size_bytes, max_size_bytes) for _ in range(num_objects)]
+    print(f"Loading {len(arguments.files) if arguments.files else num_objects} objects...")
+    start_time = time.perf_counter()
+    store = objectstore.ObjectStore(arguments.store)
+    random_objects = load_objects(store, num_objects, min_size_bytes, max_size_bytes, arguments.seed, arguments.files)
+    object_sizes = [len(obj) for obj in random_objects]
+    print(f"Loading objects complete! ({time.perf_counter() - start_time:.3f} s)")
 
-    # Generate random objects with the generated sizes
-    random_objects = [generate_random_object(size_bytes) for size_bytes in object_sizes]
-    print("Generating objects complete!")
+    server_address = ('localhost', 9999)
+    if arguments.workers > 1:  # every worker serves the clients the kernel steers to it
+        print(f"Starting {arguments.workers} DQUIC workers...")
+        workers = sharding.start_workers(server_address, arguments.workers, serve, random_objects, object_sizes)
+        for worker in workers:
+            worker.join()
+        return
 
     # generating socket:
     print("Generating DQUIC socket...")
-    server_socket = DQUIC.DQUIC()
-    server_address = ('localhost', 9999)
-    server_socket.bind(server_address)
+    asyncio.run(run_server(server_address, random_objects, object_sizes))
+
+
+async def run_server(server_address, random_objects, object_sizes):
+    server_socket = aiodquic.AsyncDQUIC()
+    await server_socket.bind(server_address)
+    await serve(server_socket, random_objects, object_sizes)
+
+
+async def serve(server_socket, random_objects, object_sizes):
     print("DQUIC socket is up!")
 
-    while True:
-        print("Waiting for requests...")
-        # receiving request from client:
-        client_address, data = server_socket.receive_from(65536)
-        total_request_size = 0
-        if 66 in data:  # 66 is the stream that gets requests
-            print("Detailed client request: ")
-            request_str = data[66].decode()
+    sending_tasks = set()  # the clients being served (all of them at once)
+    try:
+        while True:
+            print("Waiting for requests... (Ctrl+C to stop)")
+            # receiving request from client:
+            client_address, data = await server_socket.receive_streams([66])  # 66 is the stream that gets requests
+            total_request_size = 0
+            print(f"Detailed client request: (client: {client_address})")
+            request_str = bytes(data[66]).decode()
             streams_list = request_str.split(" ")  # splitting into pairs of "stream_id: object needed"
             dict_to_send = {}
             # building the dict to send:
@@ -48,19 +85,15 @@ def main():
                 total_request_size += len(dict_to_send[int(tmp[0])])
                 print("Stream:"+tmp[0]+", Object:"+tmp[1]+f", "
                                                           f"Actual size: {object_sizes[int(tmp[1])]}")
-            # sending the dict:
+            # sending the dict: (while receiving the next requests)
             print(f"total objects size: {total_request_size}")
             print("Sending objects...\n")
-            server_socket.send_to(client_address, dict_to_send)  # sending via DQUIC
-
-        print("Sending finishing msg")
-        server_socket.send_to(client_address, {77: "fin".encode()})
-
-        if input("Continue to receive requests?\n1 - YES\n2 - NO\n") != "1":
-            break
-
-    server_socket.close()
-    print("Socket closed")
+            sending_task = asyncio.create_task(server_socket.send_to(client_address, dict_to_send))  # sending via DQUIC (every object ends its stream)
+            sending_tasks.add(sending_task)
+            sending_task.add_done_callback(sending_tasks.discard)
+    finally:
+        server_socket.close()
+        print("Socket closed")
 
     # -------------
     # -------------
@@ -68,4 +101,7 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,75 @@
+import asyncio
+import multiprocessing
+import socket
+
+import aiodquic
+import DQUIC
+
+CHANNEL_BUFFER_SIZE = DQUIC.SOCKET_BUFFER_SIZE  # requested kernel buffer size of the channels between the workers
+
+
+def create_channels(workers: int) -> list:
+    """
+    The function creates the channels the workers forward packets with: a unix datagram socket pair for every
+    worker, it receives with the first socket and the others send to it with the second.
+    :param workers: number of workers
+    :return: list of (receiving socket, sending socket) by worker
+    """
+    channels = []
+    for _ in range(workers):
+        receive_sock, send_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        for sock, option in ((receive_sock, socket.SO_RCVBUF), (send_sock, socket.SO_SNDBUF)):
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, option, CHANNEL_BUFFER_SIZE)
+            except OSError:
+                pass  # the kernel keeps its default size
+        channels.append((receive_sock, send_sock))
+    return channels
+
+
+def run_worker(local_address, worker: int, channels: list, serve, args: tuple, endpoint_options: dict):
+    """
+    The function runs a worker process: its endpoint (see AsyncDQUIC.bind_worker) served by serve until it's
+    terminated.
+    """
+    async def run():
+        endpoint = aiodquic.AsyncDQUIC(**endpoint_options)
+        await endpoint.bind_worker(local_address, worker, channels)
+        try:
+            await serve(endpoint, *args)
+        finally:
+            endpoint.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+def start_workers(local_address, workers: int, serve, *args, **endpoint_options) -> list:
+    """
+    The function forks the worker processes of a sharded server: every one binds local_address (SO_REUSEPORT) and
+    runs serve(endpoint, *args) on its own AsyncDQUIC endpoint, so the packet handling of different connections
+    runs on different cores. A connection stays with the worker that chose its id, the packets the kernel steers to
+    another worker are forwarded to it.
+    :param local_address: the server's address
+    :param workers: number of worker processes
+    :param serve: coroutine function serving the clients of a worker's endpoint
+    :param endpoint_options: the AsyncDQUIC arguments (window_size, congestion_control...)
+    :return: the worker processes (started)
+    """
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise OSError("a sharded server needs SO_REUSEPORT, which this platform doesn't support")
+    if not 1 <= workers <= DQUIC.MAX_WORKERS:
+        raise ValueError(f"workers must be in range(1, {DQUIC.MAX_WORKERS + 1}), got {workers}")
+    channels = create_channels(workers)
+    context = multiprocessing.get_context("fork")  # the workers inherit the channels
+    processes = [context.Process(target=run_worker, args=(local_address, worker, channels, serve, args,
+                                                          endpoint_options), daemon=True)
+                 for worker in range(workers)]
+    for process in processes:
+        process.start()
+    for channel in channels:  # only the workers use them
+        for sock in channel:
+            sock.close()
+    return processes
@@ -0,0 +1,100 @@
+import argparse
+import asyncio
+import multiprocessing
+import time
+
+import aiodquic
+import sharding
+
+BENCH_ADDRESS = ('127.0.0.1', 9993)  # the sharded server's address
+REQUEST_STREAM = 66  # the stream of the requests (the response size), like server.py
+RESPONSE_STREAM = 1
+
+
+async def serve(endpoint, response: bytes):
+    """
+    The function answers every request with the response, concurrently.
+    """
+    sending_tasks = set()
+    while True:
+        address, _ = await endpoint.receive_streams([REQUEST_STREAM])
+        sending_task = asyncio.create_task(endpoint.send_to(address, {RESPONSE_STREAM: response}))
+        sending_tasks.add(sending_task)
+        sending_task.add_done_callback(sending_tasks.discard)
+
+
+def clients(concurrency: int, requests: int, response_size: int, start, results):
+    """
+    The function runs a process of clients: concurrency clients at once, each one sends requests one after the
+    other, a new connection (and port) for every request, so the kernel spreads them over the workers.
+    :param start: event to wait for before the first request
+    :param results: queue to put the (start time, end time, bytes received) of the process in
+    """
+    async def client():
+        received_bytes = 0
+        for _ in range(requests):
+            client_sock = aiodquic.AsyncDQUIC()
+            await client_sock.send_to(BENCH_ADDRESS, {REQUEST_STREAM: b"request"})
+            _, response = await client_sock.receive_streams([RESPONSE_STREAM], timeout=30)
+            client_sock.close()
+            if response and len(response[RESPONSE_STREAM]) == response_size:
+                received_bytes += response_size
+        return received_bytes
+
+    async def run():
+        return sum(await asyncio.gather(*(client() for _ in range(concurrency))))
+
+    start.wait()
+    start_time = time.perf_counter()
+    received_bytes = asyncio.run(run())
+    results.put((start_time, time.perf_counter(), received_bytes))
+
+
+def run_load(workers: int, client_processes: int, concurrency: int, requests: int, response_size: int):
+    """
+    The function starts a sharded server of the workers and loads it with the clients.
+    :return: the total time and bytes received by all the clients
+    """
+    server_processes = sharding.start_workers(BENCH_ADDRESS, workers, serve, bytes(response_size))
+    time.sleep(0.5)  # every worker binds the port
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    client_processes = [multiprocessing.Process(target=clients, args=(concurrency, requests, response_size, start,
+                                                                      results))
+                        for _ in range(client_processes)]
+    for process in client_processes:
+        process.start()
+    start.set()
+    process_results = [results.get() for _ in client_processes]
+    for process in client_processes:
+        process.join()
+    for process in server_processes:
+        process.terminate()
+        process.join()
+    total_time = max(end for _, end, _ in process_results) - min(start for start, _, _ in process_results)
+    return total_time, sum(received_bytes for _, _, received_bytes in process_results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DQUIC sharded server benchmark (many loopback clients)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="server worker processes")
+    parser.add_argument("--client-processes", type=int, default=4, help="client processes")
+    parser.add_argument("--concurrency", type=int, default=8, help="clients at once in every client process")
+    parser.add_argument("--requests", type=int, default=5, help="requests of every client")
+    parser.add_argument("--response-size", type=int, default=256 * 1024, help="bytes of every response")
+    arguments = parser.parse_args()
+
+    total_requests = arguments.client_processes * arguments.concurrency * arguments.requests
+    print(f"{total_requests} requests of {arguments.response_size} bytes, "
+          f"{arguments.client_processes * arguments.concurrency} clients at once")
+    print("\n------------------------------------- THROUGHPUT -------------------------------------")
+    for workers in arguments.workers:
+        total_time, received_bytes = run_load(workers, arguments.client_processes, arguments.concurrency,
+                                              arguments.requests, arguments.response_size)
+        print(f"{workers:>3} workers: {total_time:.3f} s, {received_bytes / total_time / 1e6:.2f} MB/s, "
+              f"{received_bytes // arguments.response_size / total_time:.0f} requests/s"
+              f" ({received_bytes // arguments.response_size}/{total_requests} answered)")
+
+
+if __name__ == '__main__':
+    main()
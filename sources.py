@@ -0,0 +1,205 @@
+import bisect
+import mmap
+import os
+import stat
+
+READ_SIZE = 256 * 1024  # the bytes read at a time from a file object that can't be mapped (a pipe, a socket)
+
+
+class BufferSource:
+    """
+    A class representing an object in memory (bytes or any buffer protocol object), sliced without copying.
+    """
+
+    def __init__(self, data):
+        self.data = memoryview(data).cast("B")  # (the bytes of any format)
+        self.length = len(self.data)  # the object bytes known so far (all of them)
+        self.exhausted = True  # the length is the object's size
+
+    def available(self, end: int) -> int:
+        """
+        The function makes the object's bytes up to end available if it can (pulling them from the source).
+        :return: the object bytes known so far
+        """
+        return self.length
+
+    def read(self, start: int, end: int):
+        """
+        The function returns the object's bytes [start, end) (known, not released).
+        """
+        return self.data[start:end]
+
+    def release(self, end: int):
+        """
+        The function tells the source that the object's bytes up to end won't be read again (acknowledged).
+        """
+
+    def close(self):
+        """
+        The function frees the source once the object was sent (or abandoned).
+        """
+
+
+class FileSource(BufferSource):
+    """
+    A class representing the rest of a regular file (from its position). The file is mapped to memory when it can
+    be, so the OS reads its pages only as the packets need them and the acknowledged pages are dropped from the
+    process, otherwise it's read by positioned reads. Either way the memory it takes is bounded by the bytes in
+    flight instead of the file's size.
+    """
+
+    def __init__(self, file, close_file: bool = False):
+        """
+        :param file: a regular file open for binary reading
+        :param close_file: the file is closed with the source (it was opened for it)
+        """
+        self.file = file
+        self.close_file = close_file
+        self.fd = file.fileno()
+        self.start = file.tell()  # the file offset of the object's first byte
+        self.length = max(0, os.fstat(self.fd).st_size - self.start)
+        self.exhausted = True
+        self.released = 0  # the file bytes dropped from the mapping (whole pages)
+        try:
+            self.mmap = mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ)
+            self.data = memoryview(self.mmap)
+        except (OSError, ValueError):  # (an empty file can't be mapped)
+            self.mmap = self.data = None
+
+    def read(self, start: int, end: int):
+        if self.data is not None:
+            return self.data[self.start + start:self.start + end]
+        if hasattr(os, "pread"):
+            return os.pread(self.fd, end - start, self.start + start)
+        self.file.seek(self.start + start)
+        return self.file.read(end - start)
+
+    def release(self, end: int):
+        if self.mmap is None or not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        page_end = (self.start + end) // mmap.PAGESIZE * mmap.PAGESIZE
+        if page_end > self.released:  # (read from the file again if it's ever needed)
+            self.mmap.madvise(mmap.MADV_DONTNEED, self.released, page_end - self.released)
+            self.released = page_end
+
+    def close(self):
+        if self.mmap is not None:
+            self.data.release()
+            try:
+                self.mmap.close()
+            except BufferError:
+                pass  # slices of it are still referenced, it's closed once they are gone
+        if self.close_file:
+            self.file.close()
+
+
+class ChunkSource(BufferSource):
+    """
+    A class representing an object arriving in chunks (appended by the application, or pulled from an iterator by
+    IteratorSource). The chunks are kept until their bytes are acknowledged, so its memory is bounded by the bytes
+    in flight plus the chunks read ahead. Its size is known once it's finished.
+    """
+
+    def __init__(self):
+        self.chunks = []  # the chunks not released (memoryview)
+        self.starts = []  # the object offset of every chunk (same order)
+        self.first = 0  # the first chunk not released (the released ones are deleted in batches)
+        self.length = 0
+        self.exhausted = False
+
+    def append(self, chunk):
+        """
+        The function adds the next bytes of the object.
+        """
+        chunk = memoryview(chunk).cast("B")
+        if len(chunk) > 0:
+            self.chunks.append(chunk)
+            self.starts.append(self.length)
+            self.length += len(chunk)
+
+    def finish(self):
+        """
+        The function tells that the object has no more bytes.
+        """
+        self.exhausted = True
+
+    def buffered(self) -> int:
+        """
+        The function returns the bytes kept (appended and not released).
+        """
+        return self.length - self.starts[self.first] if self.first < len(self.chunks) else 0
+
+    def read(self, start: int, end: int):
+        if start >= end:  # (an empty fin frame, maybe after every chunk was released)
+            return b""
+        i = bisect.bisect_right(self.starts, start, self.first) - 1
+        chunk_start = self.starts[i]
+        if end - chunk_start <= len(self.chunks[i]):  # (most reads are inside one chunk)
+            return self.chunks[i][start - chunk_start:end - chunk_start]
+        pieces = []
+        while start < end:
+            chunk, chunk_start = self.chunks[i], self.starts[i]
+            pieces.append(chunk[start - chunk_start:end - chunk_start])
+            start = chunk_start + len(chunk)
+            i += 1
+        return b"".join(pieces)
+
+    def release(self, end: int):
+        while self.first < len(self.chunks) and self.starts[self.first] + len(self.chunks[self.first]) <= end:
+            self.chunks[self.first] = None
+            self.first += 1
+        if self.first > 64 and 2 * self.first >= len(self.chunks):  # deleting the released chunks at once
+            del self.chunks[:self.first]
+            del self.starts[:self.first]
+            self.first = 0
+
+    def close(self):
+        self.chunks, self.starts, self.first = [], [], 0
+
+
+class IteratorSource(ChunkSource):
+    """
+    A class representing an object given as an iterator of chunks (bytes-like), pulled only as the packets need them.
+    """
+
+    def __init__(self, chunks):
+        super().__init__()
+        self.iterator = iter(chunks)
+
+    def available(self, end: int) -> int:
+        while self.length < end and not self.exhausted:
+            try:
+                self.append(next(self.iterator))
+            except StopIteration:
+                self.finish()
+        return self.length
+
+    def close(self):
+        super().close()
+        close = getattr(self.iterator, "close", None)  # (a generator's cleanup runs now)
+        if close is not None:
+            close()
+
+
+def open_source(obj) -> BufferSource:
+    """
+    The function returns the source of an object to send.
+    :param obj: a source, a buffer protocol object (bytes, bytearray, memoryview, mmap...), a file path, a binary
+    file object (from its position, mapped when it's a regular file) or an iterator (or iterable) of chunks
+    """
+    if isinstance(obj, BufferSource):
+        return obj
+    if isinstance(obj, (str, os.PathLike)):
+        return FileSource(open(obj, "rb"), close_file=True)
+    try:
+        return BufferSource(obj)
+    except TypeError:
+        pass  # not a buffer
+    if hasattr(obj, "read"):
+        try:
+            if stat.S_ISREG(os.fstat(obj.fileno()).st_mode):
+                return FileSource(obj)
+        except (OSError, ValueError):  # (io.UnsupportedOperation is both)
+            pass  # no file descriptor (BytesIO), read by chunks
+        return IteratorSource(iter(lambda: obj.read(READ_SIZE), b""))
+    return IteratorSource(obj)
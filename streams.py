@@ -0,0 +1,317 @@
+import bisect
+
+import sources
+
+MAX_ACK_RANGES = 4  # maximum received ranges reported for a stream in an ack (beyond the in order offset)
+
+
+class RangeSet:
+    """
+    A class representing a set of byte ranges [start, end) as sorted disjoint ranges.
+    """
+
+    def __init__(self):
+        self.starts = []  # sorted starts of the ranges
+        self.ends = []  # ends of the ranges (same order)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def add(self, start: int, end: int):
+        """
+        The function adds the range [start, end), merging it with the ranges it touches.
+        """
+        if start >= end:
+            return
+        i = bisect.bisect_left(self.starts, start)
+        if i > 0 and self.ends[i - 1] >= start:  # touching the previous range
+            i -= 1
+        j = i
+        while j < len(self.starts) and self.starts[j] <= end:
+            j += 1
+        if i < j:
+            start = min(start, self.starts[i])
+            end = max(end, self.ends[j - 1])
+        self.starts[i:j] = [start]
+        self.ends[i:j] = [end]
+
+    def missing(self, start: int, end: int) -> list:
+        """
+        The function returns the parts of [start, end) that are not in the set.
+        :return: list of (start, end)
+        """
+        pieces = []
+        position = start
+        i = max(bisect.bisect_right(self.starts, start) - 1, 0)
+        while i < len(self.starts) and self.starts[i] < end:
+            if self.ends[i] > position:
+                if self.starts[i] > position:
+                    pieces.append((position, self.starts[i]))
+                position = self.ends[i]
+            i += 1
+        if position < end:
+            pieces.append((position, end))
+        return pieces
+
+    def remove(self, start: int, end: int):
+        """
+        The function removes the range [start, end) from the set, splitting the ranges it cuts.
+        """
+        if start >= end or not self.starts:
+            return
+        i = max(bisect.bisect_right(self.starts, start) - 1, 0)
+        j = i
+        starts, ends = [], []  # the pieces left of the ranges i to j
+        while j < len(self.starts) and self.starts[j] < end:
+            if self.ends[j] <= start:  # (before the range removed)
+                starts.append(self.starts[j])
+                ends.append(self.ends[j])
+            else:
+                if self.starts[j] < start:
+                    starts.append(self.starts[j])
+                    ends.append(start)
+                if self.ends[j] > end:
+                    starts.append(end)
+                    ends.append(self.ends[j])
+            j += 1
+        self.starts[i:j] = starts
+        self.ends[i:j] = ends
+
+    def pop_front(self, max_length: int):
+        """
+        The function removes up to max_length bytes from the start of the first range.
+        :return: the removed (start, end), or None when the set is empty
+        """
+        if not self.starts:
+            return None
+        start = self.starts[0]
+        end = min(self.ends[0], start + max_length)
+        if end == self.ends[0]:
+            del self.starts[0]
+            del self.ends[0]
+        else:
+            self.starts[0] = end
+        return start, end
+
+    def contiguous_end(self, start: int) -> int:
+        """
+        The function returns the end of the range containing start (start itself if it's not in the set).
+        """
+        i = bisect.bisect_right(self.starts, start) - 1
+        if i >= 0 and self.ends[i] >= start:
+            return self.ends[i]
+        return start
+
+
+class SendStream:
+    """
+    A class representing the sending side of a stream for one object: which bytes were acknowledged, which are
+    waiting for retransmission and where the new data starts. A finished stream ends with the object, and its last
+    frame carries the fin (an empty object is sent as an empty fin frame).
+    The object's bytes are taken from its source (see sources.py) only as the chunks are sent, and released once
+    they are acknowledged in order. The size of an object read from an iterator is known once it's exhausted, until
+    then end is the offset after the bytes read so far.
+    """
+
+    def __init__(self, stream_id: int, data, base: int = 0, fin: bool = False):
+        """
+        :param data: the object: bytes or any object sources.open_source takes (a file, an iterator...)
+        """
+        self.stream_id = stream_id
+        self.source = sources.open_source(data)  # the object to send (sliced without copying when it can be)
+        self.base = base  # the stream offset of the object's first byte
+        self.end = base + self.source.length  # the stream offset after the object's bytes known so far
+        self.send_offset = base  # the next new stream offset to send
+        self.acked = RangeSet()  # acknowledged stream ranges
+        self.retransmit = RangeSet()  # lost stream ranges to send again
+        self.fin = fin  # the object ends the stream
+        self.fin_sent = False  # the fin is in flight (or acknowledged)
+        self.fin_acked = False
+
+    @property
+    def acked_offset(self) -> int:
+        """
+        The object bytes acknowledged in order.
+        """
+        return self.acked.contiguous_end(self.base) - self.base
+
+    def is_complete(self) -> bool:
+        return self.source.exhausted and self.acked.contiguous_end(self.base) >= self.end \
+            and (self.fin_acked or not self.fin)
+
+    def __pull(self, end: int):
+        """
+        The function reads the object from its source up to the stream offset end (if it has the bytes).
+        """
+        self.end = self.base + self.source.available(end - self.base)
+
+    def has_data_to_send(self, max_offset: int = None) -> bool:
+        """
+        The function checks if there's data to send: lost data, the fin, or new data below max_offset.
+        :param max_offset: the stream offset new data may reach (the receiver's credit), None for no limit
+        """
+        if self.send_offset >= self.end and not self.source.exhausted:  # (more bytes may be waiting for it)
+            self.__pull(self.send_offset + 1)
+        new_data_end = self.end if max_offset is None else min(self.end, max_offset)
+        return len(self.retransmit) > 0 or self.send_offset < new_data_end \
+            or (self.fin and not self.fin_sent and self.send_offset == self.end and self.source.exhausted)
+
+    def is_blocked(self, max_offset: int) -> bool:
+        """
+        The function checks if new data is waiting for the receiver's credit (max_offset).
+        """
+        return self.send_offset < self.end and max_offset <= self.send_offset
+
+    def ends_stream(self, end: int) -> bool:
+        """
+        The function checks if a chunk ending at the stream offset end carries the fin.
+        """
+        return self.fin and end == self.end and self.source.exhausted
+
+    def next_chunk(self, max_length: int, max_offset: int = None):
+        """
+        The function takes the next chunk to send, lost data before new data.
+        :param max_length: maximum chunk length
+        :param max_offset: the stream offset new data may reach (the receiver's credit), None for no limit
+        :return: the chunk's stream offset and its bytes
+        """
+        chunk = self.retransmit.pop_front(max_length)
+        if chunk is None:
+            if not self.source.exhausted:  # (a byte beyond the chunk tells whether it's the last one, for the fin)
+                self.__pull(self.send_offset + max_length + 1)
+            end = min(self.send_offset + max_length, self.end)
+            chunk = (self.send_offset, end if max_offset is None else max(self.send_offset, min(end, max_offset)))
+            self.send_offset = chunk[1]
+        if self.ends_stream(chunk[1]):
+            self.fin_sent = True
+        return chunk[0], self.source.read(chunk[0] - self.base, chunk[1] - self.base)
+
+    def on_acked(self, start: int, end: int, fin: bool = False):
+        """
+        The function marks the stream range [start, end) as received by the peer.
+        :param fin: the acknowledged range carried the fin
+        """
+        self.acked.add(max(start, self.base), min(end, self.end))
+        if self.retransmit:  # (lost ranges the peer received after all: a late ack, or rebuilt by its FEC)
+            self.retransmit.remove(start, end)
+        if fin:
+            self.fin_acked = True
+        self.source.release(self.acked_offset)  # (never read again)
+
+    def on_lost(self, start: int, end: int, fin: bool = False):
+        """
+        The function queues the parts of the lost range [start, end) that were not acknowledged by other packets.
+        :param fin: the lost range carried the fin
+        """
+        for piece_start, piece_end in self.acked.missing(start, end):
+            self.retransmit.add(piece_start, piece_end)
+        if fin and not self.fin_acked:
+            self.fin_sent = False  # sent again with the last chunk (or alone)
+
+    def resend_unacked(self):
+        """
+        The function queues every unacknowledged byte already sent.
+        """
+        for piece_start, piece_end in self.acked.missing(self.base, self.send_offset):
+            self.retransmit.add(piece_start, piece_end)
+        if not self.fin_acked:
+            self.fin_sent = False
+
+    def close(self):
+        """
+        The function frees the object's source (it was acknowledged or abandoned).
+        """
+        self.source.close()
+
+
+class RecvStream:
+    """
+    A class representing the receiving side of a stream. Every frame is written in place at its offset into one
+    growable buffer (duplicates are dropped), so the stream is reassembled without joining chunks. The buffer holds
+    the stream from buffer_start: the data read by the application is released from its front.
+    """
+
+    def __init__(self):
+        self.offset = 0  # the stream bytes received in order
+        self.read_offset = 0  # the stream bytes read by the application
+        self.final_size = None  # the stream size, known once the fin is received
+        self.received = RangeSet()  # the stream ranges received
+        self.buffer = bytearray()  # the stream data from buffer_start (up to the highest offset received)
+        self.buffer_start = 0  # the stream offset of the buffer's first byte
+
+    def add(self, offset: int, data: bytes, fin: bool = False):
+        """
+        The function writes received stream data into the buffer, ignoring the bytes received before.
+        :param offset: the data's stream offset
+        :param data: the stream data
+        :param fin: the data ends the stream
+        """
+        end = offset + len(data)
+        if fin:
+            self.final_size = end
+        pieces = self.received.missing(offset, end)
+        if not pieces:  # a duplicate
+            return
+        if end - self.buffer_start > len(self.buffer):  # bytearray over-allocates, so the growth is amortized
+            self.buffer.extend(bytes(end - self.buffer_start - len(self.buffer)))
+        with memoryview(data) as view:
+            for start, piece_end in pieces:
+                self.buffer[start - self.buffer_start:piece_end - self.buffer_start] = view[start - offset:piece_end - offset]
+        self.received.add(offset, end)
+        self.offset = self.received.contiguous_end(self.offset)
+
+    def highest_offset(self) -> int:
+        """
+        The function returns the stream offset after the highest byte received.
+        """
+        return self.received.ends[-1] if len(self.received) > 0 else 0
+
+    def is_complete(self) -> bool:
+        """
+        The function checks if the whole stream (up to the fin) was received.
+        """
+        return self.final_size is not None and self.offset >= self.final_size
+
+    def readable(self) -> int:
+        """
+        The function returns the number of bytes that can be read.
+        """
+        return self.offset - self.read_offset
+
+    def read(self, max_bytes: int) -> bytes:
+        """
+        The function reads the data received in order.
+        :param max_bytes: maximum bytes to read
+        :return: up to max_bytes of the stream's data (empty if nothing can be read)
+        """
+        start = self.read_offset - self.buffer_start
+        read_bytes = min(max_bytes, self.readable())
+        with memoryview(self.buffer) as view:
+            data = bytes(view[start:start + read_bytes])
+        self.read_offset += read_bytes
+        if 2 * (start + read_bytes) >= len(self.buffer):  # most of the buffer was read, releasing it
+            del self.buffer[:start + read_bytes]
+            self.buffer_start = self.read_offset
+        return data
+
+    def view(self) -> memoryview:
+        """
+        The function returns the stream data not read yet, without copying (the buffer can't grow afterwards).
+        """
+        return memoryview(self.buffer)[self.read_offset - self.buffer_start:self.offset - self.buffer_start]
+
+    def ack_ranges(self, max_ranges: int = MAX_ACK_RANGES) -> list:
+        """
+        The function returns the ranges received beyond the in order offset (the lowest first).
+        :return: list of (start, end)
+        """
+        ranges = []
+        for start, end in self.received:
+            if start > self.offset:
+                ranges.append((start, end))
+                if len(ranges) == max_ranges:
+                    break
+        return ranges
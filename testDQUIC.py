@@ -1,8 +1,35 @@
+import asyncio
+import errno
+import io
+import json
+import math
+import random
+import socket
+import struct
+import tempfile
 import threading
 import unittest
 from time import sleep
 
-from DQUIC import DQUIC
+import aiodquic
+import congestion
+import datagrams
+import fec
+import impairment
+import metrics
+import multipath
+import objectstore
+import pmtud
+import recovery
+import scheduler
+import sharding
+import sources
+import streams
+import varint
+from DQUIC import DQUIC, DQUICHeader, DQUICFrame, Connection, ConnectionTable, SHORT, DATA, ACK, UNKNOWN_CONN_ID, \
+    MAX_DATA, DATA_BLOCKED, STREAM_DATA_BLOCKED, INITIAL_MAX_DATA, INITIAL_MAX_STREAM_DATA, conn_id_worker, \
+    DATA_FIN, ACK_RANGE, MAX_STREAM_DATA, PADDING, FIXED_VERSION, COMPACT_VERSION, PACKET_RANGE, ACK_DELAY, \
+    PATH, MAX_TRIES, parse_frames, unpack_frames, packet_path_id, resolve_address
 
 TEST_COUNTER = 3
 
@@ -82,5 +109,1087 @@ class TestDQUIC(unittest.TestCase):
         self.assertEqual(bytes_sent, 0)
 
 
+class TestCongestionControl(unittest.TestCase):
+    """
+    This class contains tests for the congestion controllers and the pacer (no network needed).
+    """
+
+    def test_newreno_slow_start_and_loss(self):
+        controller = congestion.NewReno(1000)
+        initial_window = controller.cwnd
+        for packet_number in range(10):
+            controller.on_packet_sent(packet_number, 1000, 0.0)
+        for packet_number in range(10):
+            controller.on_packet_acked(packet_number, 1000, 0.0, 0.01)
+        self.assertEqual(controller.cwnd, 2 * initial_window)  # doubled in one rtt
+        controller.on_packet_sent(10, 1000, 0.02)
+        controller.on_packet_sent(11, 1000, 0.02)
+        controller.on_packet_lost(10, 1000, 0.02, 0.03)
+        controller.on_packet_lost(11, 1000, 0.02, 0.03)  # same recovery period, no second reduction
+        self.assertEqual(controller.cwnd, initial_window)
+        self.assertEqual(controller.bytes_in_flight, 0)
+
+    def test_cubic_reduction(self):
+        controller = congestion.Cubic(1000)
+        window = controller.cwnd
+        controller.on_packet_sent(0, 1000, 0.0)
+        controller.on_packet_lost(0, 1000, 0.0, 0.1)
+        self.assertAlmostEqual(controller.cwnd, window * congestion.CUBIC_BETA)
+
+    def test_pacer_spreads_packets(self):
+        pacer = congestion.Pacer(burst_packets=1)
+        pacer.on_packet_sent(1000, 1_000_000, 0.0)  # 1 ms per packet
+        self.assertAlmostEqual(pacer.delay(0.0), 0.001)
+        pacer.on_packet_sent(1000, 1_000_000, 0.001)
+        self.assertAlmostEqual(pacer.delay(0.001), 0.001)
+
+    def test_unknown_controller(self):
+        with self.assertRaises(ValueError):
+            DQUIC(congestion_control="unknown")
+
+
+class TestLossRecovery(unittest.TestCase):
+    """
+    This class contains tests for the rtt estimation and the loss detection.
+    """
+
+    def test_rtt_estimation(self):
+        rtt = recovery.RttEstimator()
+        rtt.update(0.1)
+        self.assertEqual((rtt.smoothed_rtt, rtt.rttvar, rtt.min_rtt), (0.1, 0.05, 0.1))
+        rtt.update(0.2)
+        self.assertAlmostEqual(rtt.smoothed_rtt, 0.1125)
+        self.assertAlmostEqual(rtt.rttvar, 0.0625)
+        self.assertAlmostEqual(rtt.pto(), 0.1125 + 4 * 0.0625 + recovery.MAX_ACK_DELAY)
+
+    def test_detect_lost_packets(self):
+        sent_packets = {number: (0.1 * number, 100, []) for number in range(6)}
+        # packet 4 acknowledged: 0 and 1 are lost by the packet threshold, 2 and 3 after the loss delay
+        lost_packets, loss_time = recovery.detect_lost_packets(sent_packets, 4, 1.0, 0.5)
+        self.assertEqual(lost_packets, [0, 1])
+        self.assertAlmostEqual(loss_time, 1.2)
+        lost_packets, _ = recovery.detect_lost_packets(sent_packets, 4, 0.25, 0.5)  # time threshold
+        self.assertEqual(lost_packets, [0, 1, 2])
+
+
+class TestStreams(unittest.TestCase):
+    """
+    This class contains tests for the stream ranges bookkeeping of both sides.
+    """
+
+    def test_range_set(self):
+        ranges = streams.RangeSet()
+        ranges.add(10, 20)
+        ranges.add(30, 40)
+        ranges.add(20, 25)  # touching the first range
+        self.assertEqual(list(ranges), [(10, 25), (30, 40)])
+        self.assertEqual(ranges.missing(0, 50), [(0, 10), (25, 30), (40, 50)])
+        ranges.add(0, 35)
+        self.assertEqual(list(ranges), [(0, 40)])
+        ranges.remove(10, 20)
+        ranges.remove(30, 50)
+        self.assertEqual(list(ranges), [(0, 10), (20, 30)])
+
+    def test_recv_stream_reordering(self):
+        recv_stream = streams.RecvStream()
+        recv_stream.add(5, b"fghij")  # out of order, buffered
+        self.assertEqual((recv_stream.readable(), recv_stream.ack_ranges()), (0, [(5, 10)]))
+        recv_stream.add(0, b"abcdefg")  # fills the gap (with overlap)
+        self.assertEqual(recv_stream.read(4), b"abcd")
+        recv_stream.add(3, b"defg")  # duplicate
+        self.assertEqual(recv_stream.read(100), b"efghij")
+        self.assertEqual((recv_stream.offset, recv_stream.ack_ranges()), (10, []))
+
+    def test_send_stream_retransmits_missing_ranges(self):
+        send_stream = streams.SendStream(1, b"0123456789", base=100)
+        self.assertEqual(send_stream.next_chunk(4), (100, b"0123"))
+        self.assertEqual(send_stream.next_chunk(4), (104, b"4567"))
+        self.assertEqual(send_stream.next_chunk(4), (108, b"89"))
+        send_stream.on_acked(106, 110)  # a later packet's ack reports this range
+        send_stream.on_lost(104, 108)  # only 104-106 is missing
+        self.assertEqual(send_stream.next_chunk(4), (104, b"45"))
+        send_stream.on_acked(100, 106)
+        self.assertTrue(send_stream.is_complete())
+
+    def test_recv_stream_fin_and_view(self):
+        recv_stream = streams.RecvStream()
+        recv_stream.add(6, b"ghij", fin=True)  # the end arrives first
+        recv_stream.add(0, b"abc")
+        recv_stream.add(0, b"abc")  # duplicate
+        self.assertFalse(recv_stream.is_complete())
+        recv_stream.add(3, b"def")
+        self.assertTrue(recv_stream.is_complete())
+        self.assertEqual(recv_stream.view(), b"abcdefghij")
+
+    def test_send_stream_fin(self):
+        send_stream = streams.SendStream(1, b"", fin=True)  # an empty object still sends the fin
+        self.assertTrue(send_stream.has_data_to_send())
+        self.assertEqual(send_stream.next_chunk(4), (0, b""))
+        self.assertTrue(send_stream.ends_stream(0))
+        send_stream.on_lost(0, 0, fin=True)
+        self.assertTrue(send_stream.has_data_to_send())
+        send_stream.next_chunk(4)
+        send_stream.on_acked(0, 0, fin=True)
+        self.assertTrue(send_stream.is_complete())
+
+    def test_send_stream_sources(self):
+        pulled = []
+
+        def chunks():
+            for chunk in (b"0123", b"456", b"789"):
+                pulled.append(chunk)
+                yield chunk
+
+        send_stream = streams.SendStream(1, chunks(), fin=True)
+        self.assertEqual(pulled, [])  # nothing is read before it's sent
+        self.assertEqual(send_stream.next_chunk(2), (0, b"01"))
+        self.assertEqual(pulled, [b"0123"])
+        self.assertEqual(send_stream.next_chunk(4), (2, b"2345"))  # (across chunks)
+        self.assertFalse(send_stream.ends_stream(6))
+        send_stream.on_acked(0, 6)
+        self.assertEqual(send_stream.source.buffered(), 3)  # the first chunk was released
+        self.assertEqual(send_stream.next_chunk(4), (6, b"6789"))
+        self.assertTrue(send_stream.fin_sent)  # the iterator's end was found with the last chunk
+        send_stream.on_lost(6, 10, fin=True)
+        self.assertEqual(send_stream.next_chunk(10), (6, b"6789"))
+        send_stream.on_acked(6, 10, fin=True)
+        self.assertTrue(send_stream.is_complete())
+        self.assertEqual(send_stream.source.buffered(), 0)
+
+        with tempfile.TemporaryFile() as file:
+            file.write(b"headerpayload")
+            file.seek(6)  # (sent from the file's position)
+            send_stream = streams.SendStream(2, file)
+            self.assertEqual((send_stream.end, send_stream.next_chunk(100)), (7, (0, b"payload")))
+            send_stream.close()
+        source = sources.open_source(io.BytesIO(b"abc"))  # no file descriptor, read by chunks
+        self.assertEqual((source.available(10), bytes(source.read(0, 3))), (3, b"abc"))
+
+
+class TestPacketAssembly(unittest.TestCase):
+    """
+    This class contains tests for building packets without concatenation.
+    """
+
+    def test_build_packet(self):
+        data = memoryview(b"0123456789")
+        frames = [(1, DATA, 100, 4, data[:4]), (2, ACK, 7, 0, b"")]
+        for version in (FIXED_VERSION, COMPACT_VERSION):
+            expected = (DQUICHeader(SHORT, 9, 0, 5, version).to_bytes() + DQUICFrame(1, DATA, 100, 4).to_bytes(version)
+                        + b"0123" + DQUICFrame(2, ACK, 7, 0).to_bytes(version))
+            connection = Connection(('localhost', 8882), 5, versions=(version,))
+            self.assertEqual(connection.build_packet(SHORT, 9, frames), expected)
+            self.assertEqual(connection.packet_size(9, frames), len(expected))
+            self.assertEqual(b"".join(connection.packet_segments(SHORT, 9, frames)), expected)
+            small_connection = Connection(('localhost', 8882), 5, max_datagram_size=10, versions=(version,))
+            self.assertEqual(small_connection.build_packet(SHORT, 9, frames), expected)  # (too small for the packet)
+        self.assertEqual(len(expected), 18 + 1 + 4 + 4 + 3)  # header, data frame, data and ack frame (compact)
+
+    def test_compact_encoding(self):
+        self.assertEqual([varint.encoded_size(value) for value in (0, 63, 64, 16383, 16384, 2 ** 30, 2 ** 62 - 1)],
+                         [1, 1, 2, 2, 4, 8, 8])
+        buffer = bytearray(8)
+        for value in (0, 37, 15293, 494878333, 151288809941952652):  # (the examples of RFC 9000 A.1)
+            end = varint.pack_into(buffer, 0, value)
+            self.assertEqual(varint.unpack_from(buffer, 0), (value, end))
+        with self.assertRaises(ValueError):
+            varint.encoded_size(2 ** 62)
+        frames = [(3, DATA_FIN, 70000, 5, memoryview(b"hello")), (3, ACK, 2 ** 40, 0, b""),
+                  (3, ACK_RANGE, 100, 50, b""), (0, MAX_DATA, 2 ** 25, 0, b""), (7, MAX_STREAM_DATA, 9, 0, b""),
+                  (0, PADDING, 0, 3, memoryview(bytes(3)))]
+        connection = Connection(('localhost', 8882), 2 ** 63 + 1, versions=(COMPACT_VERSION,))
+        connection.peer_conn_id = 2 ** 64 - 1
+        for peer_uses_conn_id in (False, True):
+            connection.peer_uses_conn_id = peer_uses_conn_id
+            packet = bytes(connection.build_packet(ACK, 300, frames))
+            header = DQUICHeader.from_bytes(packet)
+            self.assertEqual((header.packet_type, header.packet_number, header.dst_conn_id, header.src_conn_id,
+                              header.version),
+                             (ACK, 300, 2 ** 64 - 1, UNKNOWN_CONN_ID if peer_uses_conn_id else 2 ** 63 + 1,
+                              COMPACT_VERSION))
+            self.assertEqual([(frame.stream_id, frame.frame_type, frame.offset, frame.length, bytes(stream_data))
+                              for frame, stream_data in parse_frames(packet)],
+                             [frame[:4] + (bytes(frame[4]),) for frame in frames])
+            self.assertEqual([frame[:4] + (bytes(frame[4]),) for frame in unpack_frames(packet)],
+                             [frame[:4] + (bytes(frame[4]),) for frame in frames])
+            self.assertEqual(len(packet), connection.packet_size(300, frames))
+        self.assertEqual([frame.frame_type for frame, _ in parse_frames(packet[:-6])],  # a truncated frame
+                         [DATA_FIN, ACK, ACK_RANGE, MAX_DATA, MAX_STREAM_DATA])
+        self.assertIsNone(DQUICHeader.from_bytes(packet[:5]))
+
+
+class TestConnection(unittest.TestCase):
+    """
+    This class contains tests for the connection's state machine, without sockets (the packets are passed by hand).
+    """
+
+    def test_transfer_with_loss(self):
+        sender = Connection(('localhost', 8885), 0)
+        receiver = Connection(('localhost', 8886), 0)
+        send_stream = sender.queue_object(1, bytes(range(100)) * 50, True, 1000)
+        now = 0.0
+        lost = False
+        while sender.send_streams:
+            packet = sender.next_packet(now)
+            if packet is None:  # waiting for the acks (or the timer)
+                now = min(sender.timer_deadline(now), receiver.ack_deadline or math.inf)
+                self.assertTrue(sender.on_timeout(now))
+            else:
+                packet_number, frames = packet
+                data = bytes(sender.build_packet(SHORT, packet_number, frames))
+                if packet_number == 1 and not lost:  # the second packet is lost once
+                    lost = True
+                    continue
+                receiver.on_data_packet(data, now)
+            ack = receiver.next_ack(now)  # (every ACK_EVERY packets, a gap or the delay timer)
+            if ack is not None:
+                now += 0.001
+                sender.on_ack_packet(ack[0], bytes(receiver.build_packet(ACK, *ack)), now)
+        self.assertTrue(send_stream.is_complete())
+        self.assertEqual(receiver.take_completed_streams([1])[1], bytes(range(100)) * 50)
+        self.assertEqual(sender.finished_send_streams, {1})
+
+    def test_give_up_timeout(self):
+        # the receiver never answers: the backed off probe timeouts stop at GIVE_UP_TIMEOUT after the first packet
+        sender = Connection(('localhost', 8885), 0)
+        sender.queue_object(1, bytes(5000), True, 1000)
+        now = 0.0
+        while True:
+            packet = sender.next_packet(now)
+            if packet is None:
+                now = sender.timer_deadline(now)
+                if not sender.on_timeout(now):
+                    break
+        self.assertLess(sender.paths[0].pto_count, MAX_TRIES + 1)
+        self.assertAlmostEqual(now, recovery.GIVE_UP_TIMEOUT)
+
+    def test_flow_control(self):
+        # the receiver's application reads only when the sender is blocked, the unread data never exceeds the windows
+        sender = Connection(('localhost', 8885), 0)
+        receiver = Connection(('localhost', 8886), 0, stream_window=INITIAL_MAX_STREAM_DATA,
+                              connection_window=INITIAL_MAX_DATA, ack_every=1)
+        objects = {stream_id: bytes([stream_id]) * 600000 for stream_id in range(1, 4)}
+        for stream_id, obj in objects.items():
+            sender.queue_object(stream_id, obj, True, 2000)
+        received = {stream_id: b"" for stream_id in objects}
+        now = 0.0
+        blocked_packets = 0
+        while sender.send_streams:
+            packet = sender.next_packet(now)
+            if packet is None:
+                now = sender.timer_deadline(now)
+                sender.on_timeout(now)
+                continue
+            packet_number, frames = packet
+            if any(frame[1] in (DATA_BLOCKED, STREAM_DATA_BLOCKED) for frame in frames):
+                blocked_packets += 1
+            receiver.on_data_packet(bytes(sender.build_packet(SHORT, packet_number, frames)), now)
+            self.assertLessEqual(receiver.data_received - receiver.data_consumed, INITIAL_MAX_DATA)
+            self.assertLessEqual(sender.data_sent, sender.peer_max_data)
+            ack = receiver.next_ack(now)
+            now += 0.0001
+            sender.on_ack_packet(ack[0], bytes(receiver.build_packet(ACK, *ack)), now)
+            if receiver.peer_blocked:  # the application reads, raising the credit
+                for stream_id, data in receiver.read_streams(10 ** 7).items():
+                    received[stream_id] += data
+                sender.on_credit_packet(bytes(receiver.build_packet(MAX_DATA, 0, receiver.credit_update())))
+        for stream_id, data in receiver.read_streams(10 ** 7).items():
+            received[stream_id] += data
+        self.assertEqual(received, objects)
+        self.assertGreater(blocked_packets, 0)
+
+    def test_delayed_acks(self):
+        # one ack covers ack_every packets, a single packet is acked after max_ack_delay, a gap is reported at once
+        sender = Connection(('localhost', 8885), 0)
+        receiver = Connection(('localhost', 8886), 0, ack_every=3, max_ack_delay=0.01)
+        sender.queue_object(1, bytes(20000), True, 1000)
+        packets = [bytes(sender.build_packet(SHORT, *sender.next_packet(0.0, 10 ** 6))) for _ in range(8)]
+        acks = []
+        for now, packet_number in ((0.0, 0), (0.001, 1), (0.002, 2), (0.003, 3), (0.02, 5)):
+            if packet_number == 5:
+                self.assertIsNone(receiver.next_ack(0.0125))
+                acks[3] = receiver.next_ack(0.0135)  # the delay timer
+            receiver.on_data_packet(packets[packet_number], now)
+            acks.append(receiver.next_ack(now))
+        self.assertEqual(acks[:2], [None, None])
+        self.assertEqual([packet_number for packet_number, _ in acks[2:]], [2, 3, 5])  # the largest one acked
+        ranges = [[(frame[2], frame[3]) for frame in frames if frame[1] == PACKET_RANGE] for _, frames in acks[2:]]
+        self.assertEqual(ranges, [[(0, 3)], [(3, 1)], [(5, 1)]])  # (packet 4 is missing, acked at once)
+        delays = [[frame[2] for frame in frames if frame[1] == ACK_DELAY][0] for _, frames in acks[2:]]
+        self.assertEqual(delays[::2], [0, 0])
+        self.assertAlmostEqual(delays[1], 10500, delta=1)  # microseconds
+
+        # the sender takes every packet an ack covers out of the flight:
+        for ack in acks[2:]:
+            sender.on_ack_packet(ack[0], bytes(receiver.build_packet(ACK, *ack)), 0.03)
+        self.assertEqual(sorted(sender.sent_packets), [4, 6, 7])
+        self.assertEqual(sender.largest_acked, 5)
+
+    def test_metrics(self):
+        # the counters of a transfer losing a packet, and its qlog events
+        qlog = io.StringIO()
+        sender = Connection(('localhost', 8885), 1, metrics=metrics.ConnectionMetrics(1, metrics.QlogWriter(qlog)))
+        receiver = Connection(('localhost', 8886), 2, ack_every=1, metrics=metrics.ConnectionMetrics(2))
+        self.assertIsNone(Connection(('localhost', 8887), 3).stats())  # disabled by default
+        sender.queue_object(1, bytes(20000), True, 1000)
+        now = 0.0
+        while sender.send_streams:
+            packet = sender.next_packet(now)
+            if packet is None:
+                now = sender.timer_deadline(now)
+                sender.on_timeout(now)
+                continue
+            data = bytes(sender.build_packet(SHORT, *packet))
+            if packet[0] == 2:  # lost
+                continue
+            receiver.on_data_packet(data, now)
+            ack = receiver.next_ack(now)
+            now += 0.001
+            sender.on_ack_packet(ack[0], bytes(receiver.build_packet(ACK, *ack)), now)
+        stats = sender.stats()
+        self.assertEqual(stats["packets_sent"], stats["packets_acked"] + stats["packets_lost"])
+        self.assertEqual(stats["packets_lost"], 1)
+        self.assertEqual(stats["rtt"]["count"], stats["packets_received"])  # an rtt sample of every ack
+        self.assertEqual(stats["streams"][1]["bytes_resent"], 1000)
+        self.assertEqual(stats["time_to_complete"]["count"], 1)
+        self.assertEqual(receiver.stats()["acks_sent"], stats["packets_acked"])
+        lines = [json.loads(line) for line in qlog.getvalue().splitlines()]
+        self.assertEqual(lines[0]["qlog_format"], "JSON-SEQ")
+        names = [event["name"] for event in lines[1:]]
+        self.assertEqual(names.count("transport:packet_sent"), stats["packets_sent"])
+        self.assertEqual(names.count("recovery:packet_lost"), 1)
+        self.assertEqual(lines[1]["time"], 0.0)
+
+    def test_forward_error_correction(self):
+        # a packet lost from a group is rebuilt by the receiver, two lost from a group are sent again
+        for version in (COMPACT_VERSION, FIXED_VERSION):
+            sender = Connection(('localhost', 8885), 1, versions=(version,), fec_group_size=4)
+            receiver = Connection(('localhost', 8886), 2, versions=(version,))
+            send_stream = sender.queue_object(1, bytes(range(250)) * 80, True, 1000)
+            now = 0.0
+            while sender.send_streams:
+                packet = sender.next_packet(now)
+                if packet is None:
+                    now = min(sender.timer_deadline(now), receiver.ack_deadline or math.inf)
+                    self.assertTrue(sender.on_timeout(now))
+                else:
+                    data = bytes(sender.build_packet(SHORT, *packet))
+                    if packet[0] in (1, 6, 7):  # (groups 0-3 and 5-8, their parity follows them)
+                        continue
+                    receiver.on_data_packet(data, now)
+                ack = receiver.next_ack(now)
+                if ack is not None:
+                    now += 0.001
+                    sender.on_ack_packet(ack[0], bytes(receiver.build_packet(ACK, *ack)), now)
+            self.assertTrue(send_stream.is_complete())
+            self.assertEqual(receiver.take_completed_streams([1])[1], bytes(range(250)) * 80)
+            self.assertEqual(receiver.fec_decoder.recovered, 1)
+            self.assertEqual(sender.data_resent, 2000)  # packet 1 was never sent again
+
+        decoder = fec.FecDecoder()  # a packet arriving after its group's parity completes the group
+        encoder = fec.FecEncoder(3)
+        for packet_number, payload in enumerate([b"abc", b"defgh", b"i"]):
+            encoder.add(packet_number, payload)
+        self.assertTrue(encoder.parity_due(3))
+        self.assertEqual(decoder.on_parity(*encoder.take_parity()), [])
+        self.assertEqual(decoder.on_source(2, b"i"), [])
+        self.assertEqual(decoder.on_source(0, b"abc"), [(1, b"defgh")])
+
+        adaptive = fec.FecEncoder("adaptive")  # no parity until packets are lost
+        self.assertEqual(adaptive.group_size, 0)
+        for _ in range(10):
+            adaptive.on_packet_lost()
+        self.assertEqual(adaptive.group_size, fec.MIN_GROUP_SIZE)
+        for _ in range(300):
+            adaptive.on_packet_acked()
+        self.assertEqual(adaptive.group_size, 0)
+        self.assertRaises(ValueError, fec.FecEncoder, 1)
+
+
+class TestMultipath(unittest.TestCase):
+    """
+    This class contains tests for the connections of several paths: the path schedulers, the packet number space
+    and acks of every path, the failover of a silent path, and a transfer over two impaired paths.
+    """
+
+    def test_path_schedulers(self):
+        paths = [multipath.Path(0, ('localhost', 8885)), multipath.Path(1, ('localhost', 8886), 1, weight=2)]
+        weighted_round_robin = multipath.create_path_scheduler("weighted_round_robin")
+        self.assertEqual([weighted_round_robin.select(paths).path_id for _ in range(6)], [1, 0, 1, 1, 0, 1])
+        min_rtt = multipath.create_path_scheduler("min_rtt")
+        self.assertEqual(min_rtt.select(paths).path_id, 0)  # (the same initial rtt)
+        paths[1].rtt.update(0.01, 0.0)
+        paths[0].rtt.update(0.05, 0.0)
+        self.assertEqual(min_rtt.select(paths).path_id, 1)
+        self.assertRaises(ValueError, multipath.create_path_scheduler, "fastest")
+        self.assertRaises(ValueError, multipath.Path, 2, ('localhost', 8887), weight=0)
+
+    def test_failover(self):
+        # both paths carry data (their own packet numbers, acked on their path) until the second one goes silent
+        sender = Connection(('localhost', 8885), 1, fec_group_size=4, path_scheduler="weighted_round_robin")
+        sender.peer_conn_id = 2
+        path = sender.add_path(('localhost', 8887), 1)
+        receiver = Connection(('localhost', 8886), 2, ack_every=1)
+        send_stream = sender.queue_object(1, bytes(range(200)) * 500, True, 1000)
+        sent = {0: [], 1: []}  # the packet numbers sent on every path
+        now = 0.0
+        while sender.send_streams:
+            packet = sender.next_packet(now)
+            if packet is None:
+                now = min(sender.timer_deadline(now), receiver.ack_deadline or math.inf)
+                self.assertTrue(sender.on_timeout(now))
+            else:
+                data = bytes(sender.build_packet(SHORT, *packet))
+                self.assertEqual(packet_path_id(data), sender.packet_path.path_id)
+                sent[sender.packet_path.path_id].append(packet[0])
+                if sender.packet_path is path and len(sent[1]) > 10:  # the second path stops carrying packets
+                    continue
+                receiver.on_data_packet(data, now, sender.packet_path.addr)
+            ack = receiver.next_ack(now)
+            if ack is not None:
+                now += 0.001
+                if receiver.packet_path.path_id == 0 or len(sent[1]) <= 10:
+                    sender.on_ack_packet(ack[0], bytes(receiver.build_packet(ACK, *ack)), now)
+        self.assertTrue(send_stream.is_complete())
+        self.assertEqual(receiver.take_completed_streams([1])[1], bytes(range(200)) * 500)
+        self.assertEqual(sent[1][:11], list(range(11)))  # (a packet number space of its own)
+        self.assertGreater(len(sent[0]), 11)
+        self.assertTrue(path.failed)
+        self.assertFalse(sender.paths[0].failed)
+        self.assertEqual(sorted(receiver.paths), [0, 1])
+        self.assertEqual(receiver.paths[1].addr, ('localhost', 8887))
+        self.assertEqual(packet_path_id(bytes(receiver.build_packet(SHORT, 0, [(0, PATH, 1, 0, b"")]))), 1)
+
+    def test_impaired_paths(self):
+        # the second path is slower, both carry the objects; then a third path that stops carrying packets fails over
+        receiver_sock = DQUIC()
+        receiver_sock.bind(('localhost', 8894))
+        fast = impairment.Impairment(delay=0.002, bandwidth=4_000_000)
+        slow = impairment.Impairment(delay=0.01, bandwidth=2_000_000)
+        proxies = [impairment.ImpairmentProxy(('127.0.0.1', 8894), fast, fast, seed=1),
+                   impairment.ImpairmentProxy(('127.0.0.1', 8894), slow, slow, seed=2),
+                   impairment.ImpairmentProxy(('127.0.0.1', 8894), seed=3)]
+        for proxy in proxies:
+            proxy.start()
+        objects = {1: bytes(range(256)) * 2000, 2: bytes(300000)}
+        sender_sock = DQUIC(metrics=True)
+        try:
+            self.assertEqual(sender_sock.open_path(proxies[0].address, proxies[1].address), 1)
+            sender_thread = threading.Thread(target=sender_sock.send_to, args=(proxies[0].address, objects),
+                                             daemon=True)
+            sender_thread.start()
+            _, completed = receiver_sock.receive_streams([1, 2], timeout=10)
+            sender_thread.join(10)
+            self.assertEqual({stream_id: bytes(obj) for stream_id, obj in completed.items()}, objects)
+            path_stats = sender_sock.stats()[0]["paths"]
+            self.assertEqual([stats["path_id"] for stats in path_stats], [0, 1])
+            self.assertTrue(all(stats["packets_sent"] > 0 for stats in path_stats))
+            self.assertGreater(proxies[1].stats()["uplink"]["packets"], 0)
+
+            self.assertEqual(sender_sock.open_path(proxies[0].address, proxies[2].address), 2)
+            for stream_id, size in ((3, 1000000), (4, 2000000)):  # (the third path carries the first one only)
+                sender_thread = threading.Thread(target=sender_sock.send_to,
+                                                 args=(proxies[0].address, {stream_id: bytes(size)}),
+                                                 kwargs={"path_scheduler": "weighted_round_robin"}, daemon=True)
+                sender_thread.start()
+                _, completed = receiver_sock.receive_streams([stream_id], timeout=10)
+                sender_thread.join(10)
+                self.assertEqual(bytes(completed[stream_id]), bytes(size))
+                third_path = sender_sock.connections.get(proxies[0].address).paths[2]
+                self.assertTrue(third_path.validated)
+                proxies[2].uplink.impairment.loss = 1.0
+            self.assertTrue(third_path.failed)
+        finally:
+            for proxy in proxies:
+                proxy.stop()
+            sender_sock.close()
+            receiver_sock.close()
+
+
+class TestStreamScheduler(unittest.TestCase):
+    """
+    This class contains tests for the stream schedulers' order, and their use by the connection.
+    """
+
+    @staticmethod
+    def pop_order(stream_scheduler, sent_length=0):
+        # pops the ready streams, pushing every stream back until it sent 3 times
+        order = []
+        sends = {}
+        stream_id = stream_scheduler.pop()
+        while stream_id is not None:
+            order.append(stream_id)
+            stream_scheduler.on_sent(stream_id, sent_length)
+            sends[stream_id] = sends.get(stream_id, 0) + 1
+            if sends[stream_id] < 3:
+                stream_scheduler.push(stream_id)
+            stream_id = stream_scheduler.pop()
+        return order
+
+    def test_round_robin(self):
+        stream_scheduler = scheduler.create_scheduler("round_robin")
+        for stream_id in (1, 2, 3):
+            stream_scheduler.add_stream(stream_id, streams.SendStream(stream_id, bytes(100)))
+            stream_scheduler.push(stream_id)
+        stream_scheduler.push(1)  # (ready already)
+        self.assertEqual(len(stream_scheduler), 3)
+        self.assertEqual(stream_scheduler.share(1200, 0), 300)
+        self.assertEqual(stream_scheduler.share(900, 1), 300)
+        stream_scheduler.remove_stream(2)
+        self.assertEqual(self.pop_order(stream_scheduler), [1, 3, 1, 3, 1, 3])
+
+    def test_weighted_priority(self):
+        stream_scheduler = scheduler.create_scheduler("priority")
+        for stream_id, priority, weight in ((1, 3, 1), (2, 3, 2), (3, 0, 1)):
+            stream_scheduler.add_stream(stream_id, streams.SendStream(stream_id, bytes(100)), priority, weight)
+            stream_scheduler.push(stream_id)
+        # the urgent stream first, then stream 2 sends twice for every send of stream 1:
+        self.assertEqual(self.pop_order(stream_scheduler, 1000), [3, 3, 3, 1, 2, 2, 1, 2, 1])
+        with self.assertRaises(ValueError):
+            stream_scheduler.add_stream(4, streams.SendStream(4, b""), weight=0)
+
+    def test_shortest_first(self):
+        stream_scheduler = scheduler.create_scheduler("shortest_first")
+        for stream_id, size in ((1, 5000), (2, 100), (3, 1000)):
+            stream_scheduler.add_stream(stream_id, streams.SendStream(stream_id, bytes(size)))
+            stream_scheduler.push(stream_id)
+        self.assertEqual([stream_scheduler.pop() for _ in range(4)], [2, 3, 1, None])
+        with self.assertRaises(ValueError):
+            scheduler.create_scheduler("fifo")
+
+    def test_small_object_first(self):
+        # a small object queued after bulk ones is acknowledged first when it's urgent, or with shortest first
+        # (round robin shares the packets with the bulk objects)
+        for stream_scheduler, priority in (("round_robin", scheduler.DEFAULT_PRIORITY), ("priority", 0),
+                                           ("shortest_first", scheduler.DEFAULT_PRIORITY)):
+            sender = Connection(('localhost', 8885), 0, stream_scheduler=stream_scheduler)
+            receiver = Connection(('localhost', 8886), 0, ack_every=1)
+            for stream_id in range(1, 101):  # bulk objects
+                sender.queue_object(stream_id, bytes(20000), True)
+            sender.queue_object(101, bytes(2000), True, priority=priority)
+            completed = []
+            packets = 0
+            now = 0.0
+            while sender.send_streams:
+                packet_number, frames = sender.next_packet(now, 10 ** 6)
+                packets += 1
+                receiver.on_data_packet(bytes(sender.build_packet(SHORT, packet_number, frames)), now)
+                ack = receiver.next_ack(now)
+                now += 0.0001
+                sender.on_ack_packet(ack[0], bytes(receiver.build_packet(ACK, *ack)), now)
+                completed.extend(sender.take_completed_send_streams())
+            self.assertEqual(sorted(completed), list(range(1, 102)))
+            self.assertLess(packets, 2002000 / 1000)  # the packets are filled with data, not frame headers
+            if stream_scheduler != "round_robin":
+                self.assertEqual(completed[0], 101)
+
+
+class TestPathMtuDiscovery(unittest.TestCase):
+    """
+    This class contains tests for the path MTU search and the packets filled up to the path MTU.
+    """
+
+    def test_search(self):
+        search = pmtud.PathMtuDiscovery(max_plpmtu=9000)
+        now = 0.0
+        while True:
+            probe_size = search.next_probe(now)
+            if probe_size is None:
+                break
+            if probe_size > 4000:  # refused by the local device
+                search.on_packet_too_big()
+            elif probe_size > 1500:  # dropped by the path, probed MAX_PROBES times
+                search.on_probe_lost()
+            else:
+                search.on_probe_acked()
+        self.assertLessEqual(search.plpmtu, 1500)
+        self.assertGreater(search.plpmtu, 1500 - pmtud.SEARCH_PRECISION)
+        self.assertIsNone(search.next_probe(now + pmtud.RAISE_INTERVAL - 1))
+        self.assertIsNotNone(search.next_probe(now + pmtud.RAISE_INTERVAL))  # searching for a raised path MTU
+        search.on_probe_discarded()
+        self.assertEqual(search.on_black_hole(), pmtud.BASE_PLPMTU)
+
+    def test_transfer_fills_path_mtu(self):
+        # the path drops packets bigger than 1500 bytes, probe losses don't shrink the congestion window
+        sender = Connection(('localhost', 8885), 0, max_plpmtu=pmtud.MAX_PLPMTU)
+        receiver = Connection(('localhost', 8886), 0, ack_every=1)
+        objects = {stream_id: bytes([stream_id]) * 100000 for stream_id in range(1, 4)}
+        for stream_id, obj in objects.items():
+            sender.queue_object(stream_id, obj, True)
+        now = 0.0
+        data_packets = []
+        while sender.send_streams:
+            flight = []  # the packets sent until the window or the pacer holds the next one
+            packet = sender.next_packet(now)
+            while packet is not None:
+                packet_number, frames = packet
+                flight.append((packet_number, bytes(sender.build_packet(SHORT, packet_number, frames))))
+                if not sender.is_mtu_probe(packet_number):
+                    data_packets.append((len(flight[-1][1]), sender.max_packet_size(), len(frames)))
+                packet = sender.next_packet(now)
+            if not flight:
+                now = sender.timer_deadline(now)
+                self.assertTrue(sender.on_timeout(now))
+                continue
+            for packet_number, data in flight:
+                if len(data) > 1500:
+                    self.assertTrue(sender.is_mtu_probe(packet_number))
+                    continue
+                receiver.on_data_packet(data, now)
+                ack = receiver.next_ack(now)
+                now += 0.001
+                sender.on_ack_packet(ack[0], bytes(receiver.build_packet(ACK, *ack)), now)
+        self.assertEqual(receiver.take_completed_streams(list(objects)), objects)
+        self.assertGreater(sender.max_packet_size(), 1500 - pmtud.SEARCH_PRECISION)
+        self.assertEqual(sender.congestion_controller.max_datagram_size, sender.max_packet_size())
+        self.assertEqual(sender.congestion_controller.recovery_start_time, -math.inf)  # no congestion event
+        self.assertTrue(all(size <= max_size for size, max_size, _ in data_packets))
+        # the streams share full packets:
+        self.assertTrue(any(size == max_size and frames == 3 for size, max_size, frames in data_packets))
+
+
+class TestAsyncDQUIC(unittest.TestCase):
+    """
+    This class contains tests for the asyncio endpoint serving many clients at once.
+    """
+
+    def test_concurrent_clients(self):
+        async def run():
+            server = aiodquic.AsyncDQUIC()
+            await server.bind(('localhost', 8887))
+
+            async def serve():
+                while True:
+                    address, request = await server.receive_streams([66])
+                    asyncio.create_task(server.send_to(address, {1: bytes(request[66]) * 1000}))
+
+            async def client(client_number):
+                client_sock = aiodquic.AsyncDQUIC()
+                await client_sock.send_to(('localhost', 8887), {66: f"client {client_number}".encode()})
+                _, response = await client_sock.receive_streams([1], timeout=10)
+                client_sock.close()
+                return bytes(response[1])
+
+            server_task = asyncio.create_task(serve())
+            responses = await asyncio.gather(*(client(client_number) for client_number in range(50)))
+            server_task.cancel()
+            server.close()
+            return responses
+
+        responses = asyncio.run(run())
+        self.assertEqual(responses, [f"client {client_number}".encode() * 1000 for client_number in range(50)])
+
+    def test_send_sources(self):
+        objects = {stream_id: random.Random(stream_id).randbytes(300000) for stream_id in range(1, 6)}
+
+        async def async_chunks(data):
+            for i in range(0, len(data), 7000):
+                await asyncio.sleep(0)
+                yield data[i:i + 7000]
+
+        async def run(path):
+            server = aiodquic.AsyncDQUIC()
+            await server.bind(('localhost', 8893))
+
+            async def receive():
+                received = {}
+                while len(received) < len(objects):
+                    _, completed = await server.receive_streams(timeout=20)
+                    received.update({stream_id: bytes(data) for stream_id, data in completed.items()})
+                return received
+
+            receiving = asyncio.create_task(receive())
+            client_sock = aiodquic.AsyncDQUIC()
+            with open(path, "rb") as file:
+                sent = await client_sock.send_to(('localhost', 8893), {
+                    1: path, 2: file, 3: (objects[3][i:i + 5000] for i in range(0, 300000, 5000)),
+                    4: async_chunks(objects[4]), 5: bytearray(objects[5])})
+            received = await receiving
+            client_sock.close()
+            server.close()
+            return sent, received
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/object"
+            with open(path, "wb") as file:
+                file.write(objects[1])
+            objects[2] = objects[1]
+            sent, received = asyncio.run(run(path))
+        self.assertEqual(sent, 5 * 300000)
+        self.assertEqual(received, objects)
+
+    def test_failing_source(self):
+        # an async iterator raising partway: its stream leaves the connection, which may send on it again
+        async def failing_chunks():
+            yield b"first chunk "
+            await asyncio.sleep(0.2)  # (acknowledged meanwhile)
+            raise RuntimeError("source failed")
+
+        async def run():
+            server = aiodquic.AsyncDQUIC()
+            await server.bind(('localhost', 8896))
+            client_sock = aiodquic.AsyncDQUIC()
+            with self.assertRaises(RuntimeError):
+                await client_sock.send_to(('localhost', 8896), {1: failing_chunks()})
+            connection = next(iter(client_sock.connections))
+            self.assertEqual(connection.send_streams, {})
+            self.assertFalse(connection.is_active())
+            await client_sock.send_to(('localhost', 8896), {1: b"then the rest"})
+            _, completed = await server.receive_streams([1], timeout=10)
+            client_sock.close()
+            server.close()
+            return bytes(completed[1])
+
+        self.assertEqual(asyncio.run(run()), b"first chunk then the rest")
+
+
+class TestSharding(unittest.TestCase):
+    """
+    This class contains tests for steering the packets of a sharded server's connections to their worker.
+    """
+
+    def test_forward_to_worker(self):
+        async def run():
+            channels = sharding.create_channels(2)
+            workers = [aiodquic.AsyncDQUIC() for _ in range(2)]
+            worker_addresses = [('127.0.0.1', 8888), ('127.0.0.1', 8889)]  # (different ports to choose the worker)
+            for worker, endpoint in enumerate(workers):
+                await endpoint.bind_worker(worker_addresses[worker], worker, channels)
+
+            async def serve(endpoint):
+                while True:
+                    address, request = await endpoint.receive_streams()
+                    for stream_id, obj in request.items():
+                        asyncio.create_task(endpoint.send_to(address, {stream_id + 100: bytes(obj) * 2}))
+
+            serving_tasks = [asyncio.create_task(serve(endpoint)) for endpoint in workers]
+            client = aiodquic.AsyncDQUIC()
+            await client.send_to(worker_addresses[0], {1: b"first"})
+            _, first_response = await client.receive_streams([101], timeout=10)
+            connection = next(iter(client.connections))
+            self.assertEqual(conn_id_worker(connection.peer_conn_id), 0)
+            # the client's packets now reach worker 1 (as after a port change), which forwards them to worker 0:
+            connection.addr = worker_addresses[1]
+            client.connections.addresses[worker_addresses[1]] = connection
+            await client.send_to(worker_addresses[1], {2: b"second"})
+            _, second_response = await client.receive_streams([102], timeout=10)
+            for task in serving_tasks:
+                task.cancel()
+            for endpoint in workers + [client]:
+                endpoint.close()
+            return first_response, second_response, [len(endpoint.connections) for endpoint in workers], \
+                workers[1].forwarded_packets
+
+        first_response, second_response, connections, forwarded_packets = asyncio.run(run())
+        self.assertEqual(bytes(first_response[101]), b"firstfirst")
+        self.assertEqual(bytes(second_response[102]), b"secondsecond")
+        self.assertEqual(connections, [1, 0])  # worker 1 holds no state of worker 0's connection
+        self.assertGreater(forwarded_packets, 0)
+
+
+class TestReceiveStreams(unittest.TestCase):
+    """
+    This class contains tests for receiving whole streams (sender and receiver on the same machine).
+    """
+
+    def test_receive_streams(self):
+        receiver_sock = DQUIC()
+        receiver_sock.bind(('localhost', 8881))
+        objects = {1: bytes(range(256)) * 400, 2: b"small", 3: b""}
+        sender_sock = DQUIC()
+        sender_thread = threading.Thread(target=sender_sock.send_to, args=(('localhost', 8881), objects), daemon=True)
+        sender_thread.start()
+        _, received_objects = receiver_sock.receive_streams(list(objects), timeout=10)
+        sender_thread.join(10)
+        self.assertEqual({stream_id: bytes(obj) for stream_id, obj in received_objects.items()}, objects)
+        self.assertEqual(receiver_sock.receive_streams(timeout=0.1), (None, {}))
+        with self.assertRaises(ValueError):  # the streams were finished
+            sender_sock.send_to(('localhost', 8881), {1: b"more"})
+        sender_sock.close()
+        receiver_sock.close()
+
+    def test_version_negotiation(self):
+        # a receiver speaking only the fixed layout drops the compact packets, the sender falls back after a probe
+        # timeout; a receiver speaking both answers in the sender's version
+        for receiver_versions, version in (((FIXED_VERSION,), FIXED_VERSION), (None, COMPACT_VERSION)):
+            receiver_sock = DQUIC(versions=receiver_versions) if receiver_versions else DQUIC()
+            receiver_sock.bind(('localhost', 8891))
+            sender_sock = DQUIC()
+            objects = {1: bytes(range(256)) * 100}
+            sender_thread = threading.Thread(target=sender_sock.send_to, args=(('localhost', 8891), objects),
+                                             daemon=True)
+            sender_thread.start()
+            address, received_objects = receiver_sock.receive_streams([1], timeout=10)
+            sender_thread.join(10)
+            self.assertEqual(bytes(received_objects[1]), objects[1])
+            self.assertEqual(sender_sock.connections.get(resolve_address(('localhost', 8891))).version, version)
+            self.assertEqual(receiver_sock.connections.get(address).version, version)
+            sender_sock.close()
+            receiver_sock.close()
+        with self.assertRaises(ValueError):
+            DQUIC(versions=(3,))
+
+    def test_receive_streams_batch_io(self):
+        # with GSO/GRO where the kernel supports them, the same packets otherwise
+        receiver_sock = DQUIC(batch_io=True)
+        receiver_sock.bind(('localhost', 8883))
+        objects = {stream_id: bytes([stream_id]) * 100000 for stream_id in range(1, 4)}
+        sender_sock = DQUIC(batch_io=True)
+        sender_thread = threading.Thread(target=sender_sock.send_to, args=(('localhost', 8883), objects), daemon=True)
+        sender_thread.start()
+        _, received_objects = receiver_sock.receive_streams(list(objects), timeout=10)
+        sender_thread.join(10)
+        self.assertEqual({stream_id: bytes(obj) for stream_id, obj in received_objects.items()}, objects)
+        sender_sock.close()
+        receiver_sock.close()
+
+    def test_port_change(self):
+        # the connection follows the sender to a new port (a NAT rebinding), identified by its connection id
+        receiver_sock = DQUIC()
+        receiver_sock.bind(('localhost', 8884))
+        sender_sock = DQUIC()
+        for stream_id in (1, 2):
+            sender_thread = threading.Thread(target=sender_sock.send_to,
+                                             args=(('localhost', 8884), {stream_id: b"object"}), daemon=True)
+            sender_thread.start()
+            address, received_objects = receiver_sock.receive_streams([stream_id], timeout=10)
+            sender_thread.join(10)
+            self.assertEqual(bytes(received_objects[stream_id]), b"object")
+            self.assertEqual(address[1], sender_sock.sock.getsockname()[1])
+            old_sock, sender_sock.sock = sender_sock.sock, socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            old_sock.close()
+        self.assertEqual(len(receiver_sock.connections), 1)
+        sender_sock.close()
+        receiver_sock.close()
+
+    def test_flow_control_receive_from(self):
+        # an object bigger than the windows, received by a slow reader
+        receiver_sock = DQUIC(stream_window=INITIAL_MAX_STREAM_DATA, connection_window=INITIAL_MAX_DATA)
+        receiver_sock.bind(('localhost', 8890))
+        obj = bytes(range(256)) * 8000  # 2 MB
+        sender_sock = DQUIC()
+        sender_thread = threading.Thread(target=sender_sock.send_to, args=(('localhost', 8890), {1: obj}), daemon=True)
+        sender_thread.start()
+        received = []
+        while sum(len(data) for data in received) < len(obj):
+            _, data = receiver_sock.receive_from(100000)
+            received.append(data.get(1, b""))
+            connection = next(iter(receiver_sock.connections))
+            self.assertLessEqual(connection.data_received - connection.data_consumed, INITIAL_MAX_DATA)
+        sender_thread.join(10)
+        self.assertEqual(b"".join(received), obj)
+        sender_sock.close()
+        receiver_sock.close()
+
+    def test_flow_control_receive_streams(self):
+        # objects bigger than the windows, held whole until they are complete: the data received in order is
+        # credited as it arrives (otherwise the sender would wait for a reading that never comes)
+        receiver_sock = DQUIC(stream_window=INITIAL_MAX_STREAM_DATA, connection_window=INITIAL_MAX_DATA)
+        receiver_sock.bind(('localhost', 8895))
+        objects = {1: bytes(range(256)) * 8000, 2: bytes(range(256)) * 4000}  # 2 MB and 1 MB
+        sender_sock = DQUIC()
+        sender_thread = threading.Thread(target=sender_sock.send_to, args=(('localhost', 8895), objects), daemon=True)
+        sender_thread.start()
+        _, received_objects = receiver_sock.receive_streams(list(objects), timeout=10)
+        sender_thread.join(10)
+        self.assertEqual({stream_id: bytes(obj) for stream_id, obj in received_objects.items()}, objects)
+        sender_sock.close()
+        receiver_sock.close()
+
+
+class TestConnectionTable(unittest.TestCase):
+    """
+    This class contains tests for finding the connections by their ids and forgetting the idle ones.
+    """
+
+    def test_route(self):
+        table = ConnectionTable()
+        connection = table.route(DQUICHeader(SHORT, 0, UNKNOWN_CONN_ID, 77), ('127.0.0.1', 1000), 0.0, create=True)
+        self.assertEqual(connection.peer_conn_id, 77)
+        self.assertIs(table.route(DQUICHeader(SHORT, 1, UNKNOWN_CONN_ID, 77), ('127.0.0.1', 1000), 0.0), connection)
+        self.assertIsNone(table.route(DQUICHeader(ACK, 0, 12345, 78), ('127.0.0.1', 1001), 0.0))  # unknown id
+        # the peer moved to another port:
+        self.assertIs(table.route(DQUICHeader(SHORT, 2, connection.conn_id, 77), ('127.0.0.1', 1001), 0.0), connection)
+        self.assertEqual(connection.addr, ('127.0.0.1', 1001))
+        self.assertIs(table.get(('127.0.0.1', 1001)), connection)
+        self.assertIsNone(table.get(('127.0.0.1', 1000)))
+        # a new peer on the same address:
+        new_connection = table.route(DQUICHeader(SHORT, 0, UNKNOWN_CONN_ID, 99), ('127.0.0.1', 1001), 0.0, create=True)
+        self.assertIsNot(new_connection, connection)
+        self.assertEqual(len(table), 2)
+
+    def test_eviction(self):
+        table = ConnectionTable(idle_timeout=10, max_connections=2)
+        first = table.create(('127.0.0.1', 1000), 0.0)
+        second = table.create(('127.0.0.1', 1001), 5.0)
+        second.queue_object(1, b"object", True, 1000)  # being sent, can't be forgotten
+        third = table.create(('127.0.0.1', 1002), 6.0)  # the least recently active idle one makes room
+        self.assertEqual(list(table), [second, third])
+        third.queue_object(1, b"object", True, 1000)
+        self.assertIsNone(table.create(('127.0.0.1', 1003), 7.0))  # full of active connections
+        second.abandon_send_streams()
+        self.assertEqual(table.evict_idle(16.0), [second])
+        self.assertEqual(list(table), [third])
+
+    def test_readable_connections(self):
+        # only the connections holding data the application didn't take are visited by the receiving
+        table = ConnectionTable()
+        sender = Connection(('127.0.0.1', 1000), 0)
+        receivers = [table.create(('127.0.0.1', port), 0.0) for port in range(1001, 1004)]
+        sender.queue_object(1, b"first part", False, 1000)
+        packet_number, frames = sender.next_packet(0.0)
+        receivers[1].on_data_packet(bytes(sender.build_packet(SHORT, packet_number, frames)), 0.0)
+        for receiver in receivers:
+            table.update_readable(receiver)
+        self.assertEqual(list(table.readable.values()), [receivers[1]])
+        self.assertEqual(receivers[1].take_completed_streams(), {})  # not completed, still readable
+        table.update_readable(receivers[1])
+        self.assertEqual(list(table.readable.values()), [receivers[1]])
+        self.assertEqual(receivers[1].read_streams(1024), {1: b"first part"})
+        table.update_readable(receivers[1])
+        self.assertEqual(table.readable, {})
+
+
+class TestDatagramBatch(unittest.TestCase):
+    """
+    This class contains tests for collecting packets into GSO trains (with a socket recording the sendmsg calls).
+    """
+
+    class RecordingSocket:
+        def __init__(self):
+            self.calls = []
+
+        def setsockopt(self, level, option, value):
+            pass
+
+        def sendmsg(self, buffers, ancdata=(), flags=0, address=None):
+            self.calls.append((b"".join(buffers), list(ancdata), address))
+            return sum(len(buffer) for buffer in buffers)
+
+        def recvmsg_into(self, buffers, ancbufsize=0):  # a train of two 4 bytes datagrams and a shorter one (GRO)
+            buffers[0][:10] = b"aaaabbbbcc"
+            return 10, [(datagrams.SOL_UDP, datagrams.UDP_GRO, struct.pack("=i", 4))], 0, ('localhost', 8884)
+
+    def test_trains(self):
+        sock = self.RecordingSocket()
+        batch = datagrams.DatagramBatch(sock)
+        self.assertTrue(batch.gso)
+        address = ('localhost', 8884)
+        batch.add(sock, [b"aaaa"], 4, address)
+        batch.add(sock, [b"bb", b"bb"], 4, address)
+        batch.add(sock, [b"cc"], 2, address)  # shorter, ends the train
+        batch.add(sock, [b"dddd"], 4, address)
+        batch.flush(sock)
+        self.assertEqual(len(sock.calls), 2)
+        self.assertEqual(sock.calls[0][0], b"aaaabbbbcc")
+        self.assertEqual(sock.calls[0][1], [(datagrams.SOL_UDP, datagrams.UDP_SEGMENT, struct.pack("=H", 4))])
+        self.assertEqual(sock.calls[1], (b"dddd", [], address))  # a single packet is sent as is
+
+    def test_gso_fallback(self):
+        sock = self.RecordingSocket()
+        batch = datagrams.DatagramBatch(sock)
+        record = sock.sendmsg
+
+        def sendmsg(buffers, ancdata=(), flags=0, address=None):
+            if ancdata:  # the device can't segment
+                raise OSError(errno.EIO, "Input/output error")
+            return record(buffers, ancdata, flags, address)
+        sock.sendmsg = sendmsg
+        batch.add(sock, [b"aa"], 2, ('localhost', 8884))
+        batch.add(sock, [b"bb"], 2, ('localhost', 8884))
+        batch.flush(sock)
+        self.assertFalse(batch.gso)
+        self.assertEqual([call[0] for call in sock.calls], [b"aa", b"bb"])
+
+    def test_receive_buffer(self):
+        sock = self.RecordingSocket()
+        receiver = datagrams.DatagramReceiver(sock)
+        self.assertTrue(receiver.gro)
+        train = [receiver.recvfrom(sock) for _ in range(3)]  # (split from one call)
+        self.assertEqual([bytes(data) for data, _ in train], [b"aaaa", b"bbbb", b"cc"])
+        self.assertTrue(all(data.obj is receiver.buffer for data, _ in train))  # views of the buffer, no copies
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('localhost', 0))
+        receiver = datagrams.DatagramReceiver(sock, False)
+        sock.sendto(b"first", sock.getsockname())
+        sock.sendto(b"second", sock.getsockname())
+        first, _ = receiver.recvfrom(sock)
+        self.assertEqual(bytes(first), b"first")
+        second, address = receiver.recvfrom(sock)
+        self.assertEqual((bytes(second), address), (b"second", sock.getsockname()))
+        self.assertIs(first.obj, second.obj)  # (the buffer is reused)
+        sock.close()
+
+
+
+class TestImpairmentProxy(unittest.TestCase):
+    """
+    This class contains tests for the impaired links of the benchmark proxy, and a transfer through it.
+    """
+
+    def test_link(self):
+        link = impairment.Link(impairment.Impairment(delay=0.01, bandwidth=1000, queue_bytes=2000),
+                               random.Random(1))
+        # every packet waits for the ones queued before it, beyond the queue they're dropped:
+        self.assertEqual([link.deliver_time(500, 0.0) for _ in range(6)], [0.51, 1.01, 1.51, 2.01, None, None])
+        self.assertAlmostEqual(link.deliver_time(500, 1.0), 2.51)
+        self.assertEqual(link.stats()["queue_drops"], 2)
+        lossy = impairment.Link(impairment.Impairment(loss=1.0), random.Random(1))
+        self.assertIsNone(lossy.deliver_time(100, 0.0))
+        reordering = impairment.Link(impairment.Impairment(reorder=1.0), random.Random(1))
+        self.assertEqual(reordering.deliver_time(100, 0.0), impairment.REORDER_DELAY)
+
+    def test_impaired_transfer(self):
+        receiver_sock = DQUIC()
+        receiver_sock.bind(('localhost', 8892))
+        link = impairment.Impairment(delay=0.002, jitter=0.001, loss=0.05, reorder=0.05)
+        proxy = impairment.ImpairmentProxy(('127.0.0.1', 8892), link, link, seed=1)
+        proxy.start()
+        objects = {1: bytes(range(256)) * 2000, 2: bytes(50000)}
+        sender_sock = DQUIC()
+        sender_thread = threading.Thread(target=sender_sock.send_to, args=(proxy.address, objects), daemon=True)
+        sender_thread.start()
+        received_objects = {}
+        while len(received_objects) < len(objects):
+            _, completed = receiver_sock.receive_streams(timeout=10)
+            self.assertTrue(completed)
+            received_objects.update(completed)
+        sender_thread.join(10)
+        proxy.stop()
+        self.assertEqual({stream_id: bytes(obj) for stream_id, obj in received_objects.items()}, objects)
+        stats = proxy.stats()
+        self.assertGreater(stats["uplink"]["lost"] + stats["downlink"]["lost"], 0)
+        self.assertEqual(set(sender_sock.send_times), set(objects))
+        sender_sock.close()
+        receiver_sock.close()
+
+
+class TestObjectStore(unittest.TestCase):
+    """
+    This class contains tests for the server's content addressed object store.
+    """
+
+    def test_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = objectstore.ObjectStore(directory)
+            digest = store.generate(100000, "0:1")
+            obj = store.get(digest)
+            self.assertEqual(obj, random.Random("0:1").randbytes(100000))
+            self.assertEqual(store.put(bytes(obj)), digest)  # the same content is the same object
+            with open(f"{directory}/file", "wb") as file:
+                file.write(b"file content")
+            self.assertEqual(bytes(store.get(store.put_file(f"{directory}/file"))), b"file content")
+            self.assertEqual(bytes(store.get(store.put(b""))), b"")
+            self.assertRaises(KeyError, store.get, "0" * 64)
+            del obj
+            store.close()
+
+            restarted = objectstore.ObjectStore(directory)  # finds the generated object by its size and seed
+            self.assertEqual(restarted.lookup("random-100000-0:1"), digest)
+            self.assertEqual(restarted.generate(100000, "0:1"), digest)
+            self.assertTrue(restarted.verify(digest))
+            restarted.close()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,54 @@
+import struct
+
+MAX_VARINT = 2 ** 62 - 1  # the largest value of a variable length integer
+# the two high bits of the first byte tell the integer's size: 1, 2, 4 or 8 bytes (like QUIC, RFC 9000 16)
+STRUCTS = {1: struct.Struct("!B"), 2: struct.Struct("!H"), 4: struct.Struct("!I"), 8: struct.Struct("!Q")}
+PREFIXES = {1: 0, 2: 0x4000, 4: 0x80000000, 8: 0xC000000000000000}
+MASKS = {size: (1 << (8 * size - 2)) - 1 for size in STRUCTS}
+
+
+def encoded_size(value: int) -> int:
+    """
+    The function returns the bytes of a value's shortest encoding.
+    """
+    if value < 0x40:
+        return 1
+    if value < 0x4000:
+        return 2
+    if value < 0x40000000:
+        return 4
+    if value <= MAX_VARINT:
+        return 8
+    raise ValueError(f"{value} is too big for a variable length integer")
+
+
+def pack_into(buffer, pointer: int, value: int, size: int = None) -> int:
+    """
+    The function writes a value into the buffer.
+    :param buffer: writable buffer
+    :param pointer: where the value is written
+    :param value: the value, from 0 to MAX_VARINT
+    :param size: the bytes to use (1, 2, 4 or 8, at least the shortest encoding), None for the shortest encoding
+    :return: the position after the value
+    """
+    if size is None:
+        if value < 0x40:  # (most values, a byte as is)
+            buffer[pointer] = value
+            return pointer + 1
+        size = encoded_size(value)
+    STRUCTS[size].pack_into(buffer, pointer, value | PREFIXES[size])
+    return pointer + size
+
+
+def unpack_from(data, pointer: int):
+    """
+    The function reads a value from the data.
+    :param data: the buffer
+    :param pointer: where the value starts
+    :return: the value and the position after it
+    """
+    first = data[pointer]
+    if first < 0x40:  # (most values: frame types, stream ids, small lengths)
+        return first, pointer + 1
+    size = 1 << (first >> 6)
+    return STRUCTS[size].unpack_from(data, pointer)[0] & MASKS[size], pointer + size